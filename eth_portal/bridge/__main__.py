@@ -1,6 +1,19 @@
 from argparse import ArgumentParser
+import os
 
-from .run import launch_backfill, launch_bridge, launch_injector, launch_patch_recent
+from eth_portal.trin import DEFAULT_STORAGE_KB
+
+from .follow import DEFAULT_MAX_IN_FLIGHT
+from .inject import DEFAULT_DEAD_LETTER_PATH
+from .logs import start_queued_logging
+from .run import (
+    launch_backfill,
+    launch_bridge,
+    launch_export,
+    launch_injector,
+    launch_metrics_server,
+    launch_patch_recent,
+)
 
 # Parse CLI arguments
 parser = ArgumentParser()
@@ -15,7 +28,11 @@ group.add_argument(
     "-f",
     "--content-files",
     nargs="+",
-    help="Load the content from the files, and publish them into the Portal network.",
+    help=(
+        "Load the content from the files, and publish them into the Portal network."
+        " Directories are searched recursively for content files, and quoted globs"
+        " are expanded lazily, so publishing starts right away."
+    ),
 )
 group.add_argument(
     "-b",
@@ -43,29 +60,291 @@ parser.add_argument(
     default="infura",
     help="What kind of provider to use. Defaults to Infura.",
 )
+parser.add_argument(
+    "--fetch-workers",
+    type=int,
+    help=(
+        "When backfilling with --block-range or --patch-recent, fetch blocks with"
+        " this many parallel workers, while encoding and pushing in separate stages."
+        " By default, one block is fetched, encoded and pushed at a time."
+    ),
+)
+parser.add_argument(
+    "--ordered",
+    action="store_true",
+    help=(
+        "When backfilling with --fetch-workers, push blocks in block number order."
+        " By default, blocks are pushed as soon as they are ready."
+    ),
+)
+parser.add_argument(
+    "--export-dir",
+    help=(
+        "With --block-range, write the encoded content to .portalcontent files in"
+        " this directory, instead of publishing it. The files can be published"
+        " later with --content-files, without a provider."
+    ),
+)
+parser.add_argument(
+    "--export-archive",
+    help=(
+        "With --block-range, pack the encoded content into this single"
+        " .portalarchive file, instead of publishing it. The archive can be"
+        " published later with --content-files, without a provider."
+    ),
+)
+parser.add_argument(
+    "--encode-processes",
+    type=int,
+    help=(
+        "When backfilling with --fetch-workers, or exporting,"
+        " encode blocks in this many processes, to use more than one CPU core."
+        " By default, blocks are encoded in a single thread."
+    ),
+)
+parser.add_argument(
+    "--route-k",
+    type=int,
+    help=(
+        "Offer each content item only to this many of the launched trin nodes,"
+        " choosing the nodes whose IDs are closest to the content ID."
+        " By default, every item is offered to every node."
+    ),
+)
+parser.add_argument(
+    "--max-in-flight",
+    type=int,
+    default=DEFAULT_MAX_IN_FLIGHT,
+    help=(
+        "When following the head with --latest, publish up to this many blocks"
+        f" at the same time. Defaults to {DEFAULT_MAX_IN_FLIGHT}."
+    ),
+)
+parser.add_argument(
+    "--subscribe-uri",
+    help=(
+        "When following the head with --latest, subscribe to new heads at this"
+        " websocket JSON-RPC URI, instead of polling the provider."
+    ),
+)
+parser.add_argument(
+    "--content-store",
+    help=(
+        "Path to a database of encoded content. Blocks that were already"
+        " encoded are loaded from it instead of the provider, and newly-encoded"
+        " blocks are saved to it. Works with --latest, --block-range and --patch-recent."
+    ),
+)
+parser.add_argument(
+    "--content-store-max-mb",
+    type=int,
+    default=10 * 1024,
+    help=(
+        "Cap on the size of the content store, in megabytes. The least recently"
+        " used content is evicted beyond it. Defaults to 10 GB."
+    ),
+)
+parser.add_argument(
+    "--trin-data-root",
+    help=(
+        "Keep the data of each launched trin node in a temporary directory under"
+        " this one, which is deleted on exit. Use a ramdisk like /dev/shm to avoid"
+        " disk contention when running many nodes."
+    ),
+)
+parser.add_argument(
+    "--trin-storage-kb",
+    type=int,
+    default=DEFAULT_STORAGE_KB,
+    help=(
+        "How much content each launched trin node may store, in kilobytes."
+        f" Defaults to {DEFAULT_STORAGE_KB}."
+    ),
+)
+parser.add_argument(
+    "--dead-letter-file",
+    default=DEFAULT_DEAD_LETTER_PATH,
+    help=(
+        "Where to list the --content-files items that too few peers were offered,"
+        f" even after every retry. Defaults to {DEFAULT_DEAD_LETTER_PATH}"
+    ),
+)
+parser.add_argument(
+    "--offer-index",
+    help=(
+        "Path to a database of which trin nodes offered which content, to enough"
+        " peers. Content is never offered again through the same node, and"
+        " blocks that were fully offered aren't even encoded, across runs of"
+        " --latest, --content-files, --block-range and --patch-recent."
+    ),
+)
+parser.add_argument(
+    "--checkpoint",
+    help=(
+        "Path to a file that records which blocks were pushed, during a"
+        " --block-range or --patch-recent backfill."
+    ),
+)
+parser.add_argument(
+    "--resume",
+    action="store_true",
+    help=(
+        "Skip any content that the --checkpoint file shows was already pushed,"
+        " to continue an interrupted backfill."
+    ),
+)
+parser.add_argument(
+    "--log-level",
+    choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+    default="INFO",
+    help=(
+        "The lowest level of log records to write. At INFO, a summary of the pushed"
+        " content is logged every 1000 items, with warnings about slow or failed"
+        " offers. DEBUG logs every offer. Defaults to INFO."
+    ),
+)
+parser.add_argument(
+    "--log-json",
+    action="store_true",
+    help="Write each log record as a line of JSON, for log collectors to parse.",
+)
+parser.add_argument(
+    "--metrics-port",
+    type=int,
+    help=(
+        "Serve Prometheus metrics at http://127.0.0.1:PORT/metrics, like blocks"
+        " fetched, encode times, offer latencies and peer counts."
+    ),
+)
 args = parser.parse_args()
 
+if args.resume and not args.checkpoint:
+    parser.error("--resume requires a --checkpoint file")
+content_store_max_bytes = args.content_store_max_mb * 2**20
+
+if args.route_k is not None and args.route_k < 1:
+    parser.error("--route-k must be at least 1")
+
+if args.max_in_flight < 1:
+    parser.error("--max-in-flight must be at least 1")
+
+if args.fetch_workers is not None and args.fetch_workers < 1:
+    parser.error("--fetch-workers must be at least 1")
+
+if args.trin_storage_kb < 0:
+    parser.error("--trin-storage-kb must not be negative")
+elif args.trin_data_root and not os.path.isdir(args.trin_data_root):
+    parser.error(f"--trin-data-root {args.trin_data_root} is not a directory")
+
+export_path = args.export_dir or args.export_archive
+if export_path and not args.block_range:
+    parser.error("--export-dir and --export-archive require --block-range")
+elif args.export_dir and args.export_archive:
+    parser.error("Choose only one of --export-dir and --export-archive")
+elif args.export_archive and not args.export_archive.endswith(".portalarchive"):
+    parser.error("--export-archive must end in .portalarchive")
+
+if args.encode_processes is not None:
+    if args.fetch_workers is None and not export_path:
+        parser.error("--encode-processes requires --fetch-workers or an export")
+    elif args.encode_processes < 1:
+        parser.error("--encode-processes must be at least 1")
+
+log_listener = start_queued_logging(args.log_level, args.log_json)
+if args.metrics_port is None:
+    metrics_server = None
+else:
+    metrics_server = launch_metrics_server(args.metrics_port)
+
 try:
     if args.latest:
-        launch_bridge(args.provider)
+        launch_bridge(
+            args.provider,
+            args.route_k,
+            args.max_in_flight,
+            args.subscribe_uri,
+            args.content_store,
+            content_store_max_bytes,
+            args.trin_data_root,
+            args.trin_storage_kb,
+            args.offer_index,
+        )
     elif args.content_files:
-        launch_injector(args.content_files)
+        launch_injector(
+            args.content_files,
+            args.route_k,
+            args.dead_letter_file,
+            args.trin_data_root,
+            args.trin_storage_kb,
+            args.offer_index,
+        )
     elif args.block_range:
         start, end = args.block_range
         if start > end:
             raise RuntimeError(
                 "The end block must be the same or larger than the start block"
             )
+        elif export_path:
+            launch_export(
+                start,
+                end,
+                args.provider,
+                export_path,
+                args.fetch_workers,
+                args.encode_processes,
+                args.content_store,
+                content_store_max_bytes,
+            )
         else:
-            launch_backfill(start, end, args.provider)
+            launch_backfill(
+                start,
+                end,
+                args.provider,
+                args.fetch_workers,
+                args.ordered,
+                args.route_k,
+                args.content_store,
+                content_store_max_bytes,
+                args.checkpoint,
+                args.resume,
+                args.encode_processes,
+                args.trin_data_root,
+                args.trin_storage_kb,
+                args.offer_index,
+            )
     elif args.patch_recent:
-        launch_patch_recent(args.patch_recent[0], args.provider)
+        launch_patch_recent(
+            args.patch_recent[0],
+            args.provider,
+            args.fetch_workers,
+            args.ordered,
+            args.route_k,
+            args.content_store,
+            content_store_max_bytes,
+            args.checkpoint,
+            args.resume,
+            args.encode_processes,
+            args.trin_data_root,
+            args.trin_storage_kb,
+            args.offer_index,
+        )
     else:
         raise RuntimeError("Must run bridge with an option. Run with -h to see them.")
 except KeyboardInterrupt:
     if args.latest:
         print("Clean exit of bridge launcher")
-    elif args.content_files or args.block_range:
+    elif export_path:
+        print("Warning: process exited before exporting all content")
+    elif args.content_files or args.block_range or args.patch_recent:
         print("Warning: process exited before pushing out all content")
+        if args.checkpoint:
+            print(
+                f"Progress was saved to {args.checkpoint}, add --resume to continue"
+                " where it left off"
+            )
     else:
         raise RuntimeError("Program ended early, with unknown command line argument")
+finally:
+    if metrics_server is not None:
+        metrics_server.shutdown()
+    log_listener.stop()
@@ -0,0 +1,265 @@
+import logging
+import threading
+import time
+from typing import Callable, List, Optional, Sequence
+
+from .metrics import NODES_DRAINED, OFFER_LIMIT
+
+# How many offers each node may have in flight: every node starts at the
+#   initial limit, and then adapts between the bounds
+DEFAULT_INITIAL_LIMIT = 4
+DEFAULT_MIN_LIMIT = 1
+DEFAULT_MAX_LIMIT = 32
+
+# An offer that takes longer than this is a sign that the node is overloaded,
+#   in seconds
+DEFAULT_TARGET_SECONDS = 5
+
+# Drain a node after this many offers in a row that overloaded it, or that
+#   reached no peers at all
+DEFAULT_DRAIN_AFTER = 8
+
+# How long to stop offering content to a drained node, in seconds
+DEFAULT_DRAIN_SECONDS = 60
+
+# The weight of the newest offer in each node's moving averages
+_AVERAGE_WEIGHT = 0.1
+
+logger = logging.getLogger(__name__)
+
+
+class _NodeState:
+    __slots__ = (
+        "limit",
+        "in_flight",
+        "mean_seconds",
+        "mean_peers",
+        "last_decrease",
+        "overloaded_streak",
+        "isolated_streak",
+        "drained_until",
+    )
+
+    def __init__(self, initial_limit):
+        self.limit = float(initial_limit)
+        self.in_flight = 0
+        self.mean_seconds: Optional[float] = None
+        self.mean_peers: Optional[float] = None
+        self.last_decrease = float("-inf")
+        self.overloaded_streak = 0
+        self.isolated_streak = 0
+        self.drained_until: Optional[float] = None
+
+
+class NodeOfferLimiter:
+    """
+    Adapt how many offers each launched node may have in flight, from how its offers turn out.
+
+    Limits follow additive-increase, multiplicative-decrease: each offer
+    that reaches peers in good time raises the node's limit by a fraction,
+    adding up to one more slot per full window of offers. An offer that
+    fails, times out, or is slower than the target halves the limit, at most
+    once per window, so one burst of failures doesn't collapse it.
+
+    A node is drained for a while, and offered nothing, when its offers keep
+    overloading it even at the lowest limit, or when they keep reaching no
+    peers at all, because the node is isolated from the network. It comes
+    back at the lowest limit, and works its way up again.
+
+    All offers wait for the nodes they go to, so the bridge pushes content
+    only as fast as the network accepts it.
+    """
+
+    def __init__(
+        self,
+        node_labels: Sequence[str],
+        initial_limit: int = DEFAULT_INITIAL_LIMIT,
+        min_limit: int = DEFAULT_MIN_LIMIT,
+        max_limit: int = DEFAULT_MAX_LIMIT,
+        target_seconds: float = DEFAULT_TARGET_SECONDS,
+        drain_after: int = DEFAULT_DRAIN_AFTER,
+        drain_seconds: float = DEFAULT_DRAIN_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Start every node at the initial limit, with nothing in flight.
+
+        :param node_labels: a label for each node, like its node ID, to report it by.
+            Nodes are identified by their position in this sequence.
+        :param initial_limit: how many offers each node may start with in flight
+        :param min_limit: the lowest in-flight limit of any node, at least 1
+        :param max_limit: the highest in-flight limit of any node
+        :param target_seconds: offers slower than this lower the node's limit
+        :param drain_after: drain a node after this many overloaded or isolated
+            offers in a row
+        :param drain_seconds: how long a drained node is offered nothing
+        :param clock: the source of the current time, in seconds
+        """
+        if not 1 <= min_limit <= initial_limit <= max_limit:
+            raise ValueError(
+                "Limits must satisfy 1 <= min <= initial <= max, not"
+                f" {min_limit}, {initial_limit}, {max_limit}"
+            )
+
+        self._labels = tuple(node_labels)
+        self._min_limit = min_limit
+        self._max_limit = max_limit
+        self._target_seconds = target_seconds
+        self._drain_after = drain_after
+        self._drain_seconds = drain_seconds
+        self._clock = clock
+
+        self._nodes = [_NodeState(initial_limit) for _ in self._labels]
+        self._num_drained = 0
+        self._condition = threading.Condition()
+
+        for label in self._labels:
+            OFFER_LIMIT.set(initial_limit, node_id=label)
+        NODES_DRAINED.set(0)
+
+    @property
+    def max_in_flight(self) -> int:
+        """
+        The most offers that could ever be in flight at once, over all nodes.
+        """
+        return len(self._nodes) * self._max_limit
+
+    @property
+    def num_drained(self) -> int:
+        with self._condition:
+            return self._num_drained
+
+    def limit(self, position: int) -> int:
+        """
+        How many offers the node may currently have in flight.
+        """
+        with self._condition:
+            return int(self._nodes[position].limit)
+
+    def is_drained(self, position: int) -> bool:
+        """
+        Whether the node is being offered nothing for now.
+        """
+        with self._condition:
+            return self._check_drained(position)
+
+    def available(self, positions: Sequence[int]) -> List[int]:
+        """
+        Drop any drained nodes from a selection of nodes.
+
+        If every node in the selection is drained, the whole selection is
+        returned anyway, so that content always has somewhere to go.
+        """
+        with self._condition:
+            undrained = [idx for idx in positions if not self._check_drained(idx)]
+        return undrained or list(positions)
+
+    def acquire(self, positions: Sequence[int]) -> float:
+        """
+        Wait until every one of the nodes has room for another offer, and claim it.
+
+        Room on all the nodes is claimed at once, so that concurrent pushes
+        can never each hold some of the slots that the other is waiting on.
+
+        :return: the time that the slots were claimed, to pass to :meth:`release`
+        """
+        nodes = [self._nodes[idx] for idx in positions]
+        with self._condition:
+            self._condition.wait_for(
+                lambda: all(node.in_flight < int(node.limit) for node in nodes)
+            )
+            for node in nodes:
+                node.in_flight += 1
+            return self._clock()
+
+    def release(
+        self, position: int, started: float, seconds: float, num_peers: Optional[int]
+    ) -> None:
+        """
+        Free a node's slot after an offer, and adapt its limit to how the offer went.
+
+        :param started: the time returned by :meth:`acquire` for the offer
+        :param seconds: how long the offer took
+        :param num_peers: how many peers the node offered the content to, or
+            None if the offer failed or timed out
+        """
+        with self._condition:
+            node = self._nodes[position]
+            node.in_flight -= 1
+            self._condition.notify_all()
+
+            node.mean_seconds = _average(node.mean_seconds, seconds)
+            if num_peers is not None:
+                node.mean_peers = _average(node.mean_peers, num_peers)
+
+            if num_peers is None or seconds > self._target_seconds:
+                node.overloaded_streak += 1
+                # Only back off once for all the offers that were in flight together
+                if started >= node.last_decrease:
+                    node.limit = max(node.limit / 2, self._min_limit)
+                    node.last_decrease = self._clock()
+            else:
+                node.overloaded_streak = 0
+                node.limit = min(node.limit + 1 / node.limit, self._max_limit)
+
+            if num_peers == 0:
+                node.isolated_streak += 1
+            elif num_peers is not None:
+                node.isolated_streak = 0
+
+            OFFER_LIMIT.set(int(node.limit), node_id=self._labels[position])
+
+            if node.drained_until is None:
+                if node.isolated_streak >= self._drain_after:
+                    self._drain(position, "isolated")
+                elif (
+                    node.overloaded_streak >= self._drain_after
+                    and node.limit <= self._min_limit
+                ):
+                    self._drain(position, "saturated")
+
+    def _drain(self, position, reason):
+        node = self._nodes[position]
+        node.drained_until = self._clock() + self._drain_seconds
+        self._num_drained += 1
+        NODES_DRAINED.set(self._num_drained)
+        logger.warning(
+            "Draining node",
+            extra={
+                "node_id": self._labels[position],
+                "reason": reason,
+                "drain_seconds": self._drain_seconds,
+                "mean_seconds": _round(node.mean_seconds),
+                "mean_peers": _round(node.mean_peers),
+            },
+        )
+
+    def _check_drained(self, position) -> bool:
+        """
+        Whether the node is drained, restoring it at the lowest limit if its time is up.
+        """
+        node = self._nodes[position]
+        if node.drained_until is None:
+            return False
+        elif self._clock() < node.drained_until:
+            return True
+
+        node.drained_until = None
+        node.limit = float(self._min_limit)
+        node.overloaded_streak = node.isolated_streak = 0
+        self._num_drained -= 1
+        NODES_DRAINED.set(self._num_drained)
+        OFFER_LIMIT.set(self._min_limit, node_id=self._labels[position])
+        logger.info("Restoring drained node", extra={"node_id": self._labels[position]})
+        return False
+
+
+def _average(mean, sample):
+    if mean is None:
+        return float(sample)
+    else:
+        return mean + _AVERAGE_WEIGHT * (sample - mean)
+
+
+def _round(value):
+    return None if value is None else round(value, 4)
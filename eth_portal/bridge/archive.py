@@ -0,0 +1,282 @@
+from array import array
+import hashlib
+import mmap
+import os
+from pathlib import Path
+import struct
+from typing import Iterator, Optional, Tuple
+
+ARCHIVE_SUFFIX = ".portalarchive"
+
+# The archive starts with a fixed-size header:
+#   magic, number of entries, offset of the index, number of index slots
+_MAGIC = b"PORTALA1"
+_HEADER = struct.Struct("<8sQQQ")
+
+# Each entry in the value section is prefixed by the lengths of its key and value
+_RECORD_PREFIX = struct.Struct("<HI")
+
+# Each index slot holds a hash of the content key, and the offset of the entry
+#   plus one, so that an empty slot is all zeroes
+_SLOT = struct.Struct("<QQ")
+
+# The index has at least this many slots per entry, which keeps lookups to a
+#   probe or two, at the cost of 16 bytes per slot
+_SLOTS_PER_ENTRY = 2
+
+
+class ContentArchive:
+    """
+    Read a packed archive of Portal content, without loading it into memory.
+
+    An archive is a single file with all the content keys and values, and a
+    hash index of the content keys. The file is memory-mapped, so values are
+    sliced out of it without copying, looking up a key takes constant time,
+    and the archive may be far larger than RAM. Archives are written by
+    :class:`ArchiveWriter`.
+
+    Values are returned as memoryviews into the mapped file, so they must be
+    released before the archive is closed.
+    """
+
+    def __init__(self, path):
+        """
+        Open the archive at the given path.
+
+        :raise ValueError: if the file is not a content archive
+        """
+        self.path = Path(path)
+        with open(self.path, "rb") as archive_file:
+            self._mmap = mmap.mmap(archive_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+
+        if len(self._mmap) < _HEADER.size:
+            self.close()
+            raise ValueError(f"File {self.path} is too short to be a content archive")
+
+        magic, num_entries, index_offset, num_slots = _HEADER.unpack_from(self._mmap)
+        if magic != _MAGIC:
+            self.close()
+            raise ValueError(f"File {self.path} is not a content archive")
+
+        self._num_entries = num_entries
+        self._index_offset = index_offset
+        self._num_slots = num_slots
+
+    def __len__(self) -> int:
+        return self._num_entries
+
+    def get(self, content_key: bytes) -> Optional[memoryview]:
+        """
+        Look up the content value for the given key, or None if it's not in the archive.
+        """
+        offset = self._find(content_key)
+        if offset is None:
+            return None
+        else:
+            _, value = self._read_record(offset)
+            return value
+
+    def __contains__(self, content_key: bytes) -> bool:
+        return self._find(content_key) is not None
+
+    def items(self) -> Iterator[Tuple[bytes, memoryview]]:
+        """
+        Iterate over every (content_key, content_value) in the archive, in file order.
+
+        Reading sequentially through the file keeps the page cache effective,
+        even for archives larger than RAM.
+        """
+        offset = _HEADER.size
+        while offset < self._index_offset:
+            content_key, content_value = self._read_record(offset)
+            record_offset = offset
+            offset += _RECORD_PREFIX.size + len(content_key) + len(content_value)
+
+            # A key that was written more than once is only yielded at its
+            #   latest value, which is the one that the index points to
+            if self._find(content_key) == record_offset:
+                yield content_key, content_value
+            else:
+                content_value.release()
+
+    def keys(self) -> Iterator[bytes]:
+        """
+        Iterate over every content key in the archive, in file order.
+        """
+        for content_key, content_value in self.items():
+            content_value.release()
+            yield content_key
+
+    def close(self) -> None:
+        self._view.release()
+        self._mmap.close()
+
+    def __enter__(self) -> "ContentArchive":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _read_record(self, offset):
+        key_length, value_length = _RECORD_PREFIX.unpack_from(self._mmap, offset)
+        key_start = offset + _RECORD_PREFIX.size
+        value_start = key_start + key_length
+        content_key = self._mmap[key_start:value_start]
+        content_value = self._view[value_start : value_start + value_length]
+        return content_key, content_value
+
+    def _find(self, content_key):
+        """
+        Find the offset of the entry with the given key, or None if it's missing.
+        """
+        if not self._num_slots:
+            return None
+
+        key_hash = _hash_key(content_key)
+        mask = self._num_slots - 1
+        slot = key_hash & mask
+        while True:
+            slot_hash, offset_plus_one = _SLOT.unpack_from(
+                self._mmap, self._index_offset + slot * _SLOT.size
+            )
+            if offset_plus_one == 0:
+                return None
+            elif slot_hash == key_hash:
+                offset = offset_plus_one - 1
+                key_length, _ = _RECORD_PREFIX.unpack_from(self._mmap, offset)
+                key_start = offset + _RECORD_PREFIX.size
+                if self._mmap[key_start : key_start + key_length] == content_key:
+                    return offset
+            slot = (slot + 1) & mask
+
+
+class ArchiveWriter:
+    """
+    Write Portal content into a packed archive, for :class:`ContentArchive` to read.
+
+    Entries are appended to the file as they are added, so memory use only
+    grows by 16 bytes per entry, for the index that is written on close. If
+    a key is added more than once, the archive holds its latest value.
+
+    The archive is written under a temporary name, and only moved into place
+    when it's closed without an error, so a partial archive is never left
+    behind at the path.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._partial_path = self.path.with_name(self.path.name + ".partial")
+        self._file = open(self._partial_path, "wb")
+        self._file.write(bytes(_HEADER.size))
+        self._offset = _HEADER.size
+
+        # The key hash and offset of every entry, in the order they were added
+        self._key_hashes = array("Q")
+        self._offsets = array("Q")
+
+    def add(self, content_key: bytes, content_value: bytes) -> None:
+        """
+        Append a content item to the archive.
+        """
+        record_prefix = _RECORD_PREFIX.pack(len(content_key), len(content_value))
+        self._file.write(record_prefix)
+        self._file.write(content_key)
+        self._file.write(content_value)
+
+        self._key_hashes.append(_hash_key(content_key))
+        self._offsets.append(self._offset)
+        self._offset += len(record_prefix) + len(content_key) + len(content_value)
+
+    def close(self) -> None:
+        """
+        Write the index, and move the finished archive into place.
+        """
+        self._file.flush()
+        index, num_entries = self._build_index()
+
+        self._file.write(index)
+        self._file.seek(0)
+        self._file.write(
+            _HEADER.pack(_MAGIC, num_entries, self._offset, len(index) // _SLOT.size)
+        )
+        self._file.close()
+        os.replace(self._partial_path, self.path)
+
+    def abort(self) -> None:
+        """
+        Stop writing, and delete the partial archive.
+        """
+        self._file.close()
+        self._partial_path.unlink()
+
+    def __enter__(self) -> "ArchiveWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _build_index(self):
+        """
+        Build an open-addressing hash table, from key hash to entry offset.
+
+        :return: (the encoded index, the number of distinct keys in it)
+        """
+        num_slots = 1
+        while num_slots < len(self._offsets) * _SLOTS_PER_ENTRY:
+            num_slots *= 2
+        mask = num_slots - 1
+
+        slot_hashes = array("Q", bytes(8 * num_slots))
+        slot_offsets = array("Q", bytes(8 * num_slots))
+        num_entries = 0
+
+        with open(self._partial_path, "rb") as partial_file:
+            # Only needed to compare keys with colliding hashes, which is rare
+            written = mmap.mmap(partial_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            for key_hash, offset in zip(self._key_hashes, self._offsets):
+                slot = key_hash & mask
+                while slot_offsets[slot] != 0:
+                    if slot_hashes[slot] == key_hash and _same_key(
+                        written, slot_offsets[slot] - 1, offset
+                    ):
+                        # The same key was added again, keep the latest value
+                        break
+                    slot = (slot + 1) & mask
+                else:
+                    num_entries += 1
+
+                slot_hashes[slot] = key_hash
+                slot_offsets[slot] = offset + 1
+        finally:
+            written.close()
+
+        index = bytearray(num_slots * _SLOT.size)
+        for slot, (key_hash, offset_plus_one) in enumerate(
+            zip(slot_hashes, slot_offsets)
+        ):
+            if offset_plus_one:
+                _SLOT.pack_into(index, slot * _SLOT.size, key_hash, offset_plus_one)
+        return index, num_entries
+
+
+def is_archive_path(path) -> bool:
+    return Path(path).suffix == ARCHIVE_SUFFIX
+
+
+def _hash_key(content_key: bytes) -> int:
+    return int.from_bytes(hashlib.sha256(content_key).digest()[:8], "little")
+
+
+def _same_key(written, offset_a, offset_b):
+    def key_at(offset):
+        key_length, _ = _RECORD_PREFIX.unpack_from(written, offset)
+        key_start = offset + _RECORD_PREFIX.size
+        return written[key_start : key_start + key_length]
+
+    return key_at(offset_a) == key_at(offset_b)
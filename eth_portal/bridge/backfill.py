@@ -0,0 +1,506 @@
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import closing
+from itertools import islice
+from queue import Empty, Full, Queue
+import threading
+
+from .checkpoint import content_type_of
+from .fetch import BatchFetcher
+from .history import encode_block_content, encode_raw_block_content
+from .insert import PortalInserter
+from .metrics import ENCODE_SECONDS
+from .offered import MINIMUM_OTHER_PEERS_OFFERED
+
+DEFAULT_FETCH_WORKERS = 8
+
+# How many consecutive blocks each fetch worker requests in one JSON-RPC batch
+DEFAULT_FETCH_WINDOW = 4
+
+# How many blocks may wait between each stage of the pipeline. When a queue is
+#   full, the stage feeding it blocks, so a slow push stage throttles fetching.
+DEFAULT_QUEUE_SIZE = 32
+
+# How often a blocked stage wakes up to check whether the pipeline was stopped
+_STOP_CHECK_SECONDS = 0.1
+
+# Sentinel, put on a queue by a stage when it has no more items to produce
+_DONE = object()
+
+
+def serial_backfill(
+    portal_inserter: PortalInserter,
+    block_numbers,
+    w3,
+    content_store=None,
+    checkpoint=None,
+    resume: bool = False,
+):
+    """
+    Fetch, encode and push a range of blocks, one block at a time.
+
+    See :func:`pipelined_backfill` for a faster alternative, and for a
+    description of the parameters.
+    """
+    with closing(BatchFetcher(w3)) as fetcher:
+        for block_number in block_numbers:
+            if resume and checkpoint.is_complete(block_number):
+                continue
+
+            content_items = None
+            if content_store is not None:
+                content_items = content_store.get_block(block_number)
+
+            if content_items is None:
+                print(f"Getting block #{block_number} for injection to Portal network")
+                ((block_fields, uncles, receipts),) = fetcher.fetch_blocks(
+                    [block_number]
+                )
+                if portal_inserter.was_block_offered(block_fields.hash):
+                    print(f"Skipping block #{block_number}, which was already offered")
+                    continue
+                content_items = encode_block_content(block_fields, uncles, receipts)
+                if content_store is not None:
+                    content_store.put_block(
+                        block_number, block_fields.hash, content_items
+                    )
+            else:
+                print(f"Loaded block #{block_number} from the content store")
+
+            push_block_content(
+                portal_inserter, block_number, content_items, checkpoint, resume
+            )
+
+
+def push_block_content(
+    portal_inserter: PortalInserter,
+    block_number: int,
+    content_items,
+    checkpoint=None,
+    resume: bool = False,
+):
+    """
+    Push all content items of a block, recording each one in the checkpoint.
+
+    An item is only recorded if it was offered to enough peers, so that an
+    item that failed, or that only reached isolated nodes, is pushed again
+    on resuming.
+
+    :param content_items: a sequence of (content_key, content_value) for the block
+    :param checkpoint: if supplied, a
+        :class:`~eth_portal.bridge.checkpoint.BackfillCheckpoint` to record
+        progress in
+    :param resume: whether to skip content that the checkpoint shows was
+        already offered
+    """
+    if resume:
+        offered_types = checkpoint.offered_types(block_number)
+    else:
+        offered_types = frozenset()
+
+    for content_key, content_value in content_items:
+        if content_type_of(content_key) in offered_types:
+            continue
+
+        peer_counts = portal_inserter.push_history(content_key, content_value)
+        if (
+            checkpoint is not None
+            and max(peer_counts, default=0) >= MINIMUM_OTHER_PEERS_OFFERED
+        ):
+            checkpoint.record(block_number, content_key)
+
+    print(f"Pushed all content for block #{block_number}")
+
+
+def pipelined_backfill(
+    portal_inserter: PortalInserter,
+    block_numbers,
+    w3,
+    fetch_workers: int = DEFAULT_FETCH_WORKERS,
+    ordered: bool = False,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+    fetch_window: int = DEFAULT_FETCH_WINDOW,
+    content_store=None,
+    checkpoint=None,
+    resume: bool = False,
+    encode_processes: int = None,
+):
+    """
+    Fetch, encode and push a range of blocks, with each stage running concurrently.
+
+    Several fetch workers retrieve blocks from the provider in parallel. A
+    single encode stage validates and encodes them, and the calling thread
+    pushes the encoded content to the portal inserter. The stages are linked
+    by bounded queues, so the whole pipeline runs at the speed of its slowest
+    stage without buffering an unbounded number of blocks.
+
+    Encoding is CPU-bound, so a single encode stage can only use one core. With
+    `encode_processes`, blocks are instead fetched as raw JSON, and encoded in
+    a pool of processes.
+
+    If any stage fails, the whole pipeline is stopped and the error is
+    re-raised in the calling thread.
+
+    :param portal_inserter: a class responsible for pushing content keys and
+        values into the network via a group of running portal clients
+    :param block_numbers: the block numbers to backfill
+    :param w3: web3 access to core Ethereum content
+    :param fetch_workers: how many threads retrieve blocks from the provider
+    :param ordered: whether to push blocks in the order of `block_numbers`.
+        Otherwise, blocks are pushed as soon as they are encoded.
+    :param queue_size: the maximum number of blocks waiting between stages.
+        When ordered, it also caps how far fetching may run ahead of the next
+        block to push.
+    :param fetch_window: how many consecutive blocks a fetch worker retrieves
+        at once, using batched JSON-RPC requests
+    :param content_store: if supplied, a :class:`~eth_portal.bridge.store.ContentStore`
+        to load previously-encoded blocks from, skipping the fetch and encode
+        stages, and to save newly-encoded blocks to
+    :param checkpoint: if supplied, a
+        :class:`~eth_portal.bridge.checkpoint.BackfillCheckpoint` to record
+        which content of which blocks was offered
+    :param resume: whether to skip content that the checkpoint shows was
+        already offered
+    :param encode_processes: if supplied, encode blocks in this many processes
+    """
+    encoded_blocks = iter_encoded_blocks(
+        block_numbers,
+        w3,
+        fetch_workers,
+        ordered,
+        queue_size,
+        fetch_window,
+        content_store,
+        checkpoint if resume else None,
+        encode_processes,
+        portal_inserter.was_block_offered,
+    )
+
+    # Close explicitly, so the background stages shut down even if a push fails
+    with closing(encoded_blocks):
+        for block_number, content_items in encoded_blocks:
+            if content_items:
+                push_block_content(
+                    portal_inserter, block_number, content_items, checkpoint, resume
+                )
+
+
+def iter_encoded_blocks(
+    block_numbers,
+    w3,
+    fetch_workers: int = DEFAULT_FETCH_WORKERS,
+    ordered: bool = False,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+    fetch_window: int = DEFAULT_FETCH_WINDOW,
+    content_store=None,
+    skip_complete=None,
+    encode_processes: int = None,
+    was_block_offered=None,
+):
+    """
+    Fetch and encode a range of blocks in background stages, and yield the content.
+
+    This is the pipeline behind :func:`pipelined_backfill`, without the push
+    stage, so the content can go anywhere, like to files. Close the generator
+    when done with it, even early, to shut down the background stages.
+
+    :param skip_complete: if supplied, a
+        :class:`~eth_portal.bridge.checkpoint.BackfillCheckpoint`, to skip the
+        blocks that it shows were completely offered
+    :param was_block_offered: if supplied, a function that takes a header
+        hash, and returns whether the block was already offered, to skip it
+        before encoding
+
+    See :func:`pipelined_backfill` for the other parameters.
+
+    :return: a generator of (block_number, content_items), where each content
+        item is a (content_key, content_value). Blocks that were skipped by
+        `was_block_offered` have no content items.
+    """
+    pipeline = _BackfillPipeline(
+        w3,
+        fetch_workers,
+        ordered,
+        queue_size,
+        fetch_window,
+        content_store,
+        skip_complete,
+        encode_processes,
+        was_block_offered,
+    )
+    yield from pipeline.run(block_numbers)
+
+
+class _BackfillPipeline:
+    """
+    Run the fetch and encode stages of a backfill in background threads.
+
+    Encoded blocks are yielded to the caller, which acts as the final stage.
+
+    With a pool of encode processes, each fetch worker submits its raw blocks
+    to the pool as soon as they arrive, and the encode stage only collects the
+    results, in the order that they were fetched.
+    """
+
+    def __init__(
+        self,
+        w3,
+        fetch_workers: int,
+        ordered: bool,
+        queue_size: int,
+        fetch_window: int = 1,
+        content_store=None,
+        skip_complete=None,
+        encode_processes: int = None,
+        was_block_offered=None,
+    ):
+        if fetch_workers < 1:
+            raise ValueError(f"Must use at least one fetch worker, not {fetch_workers}")
+        if fetch_window < 1:
+            raise ValueError(
+                f"Must fetch at least one block at a time, not {fetch_window}"
+            )
+
+        if encode_processes is not None and encode_processes < 1:
+            raise ValueError(
+                f"Must use at least one encode process, not {encode_processes}"
+            )
+
+        self._fetcher = BatchFetcher(w3)
+        self._encode_processes = encode_processes
+        self._encode_pool = None
+        self._content_store = content_store
+        self._skip_complete = skip_complete
+        self._was_block_offered = was_block_offered
+        self._fetch_window = fetch_window
+        self._num_fetch_workers = fetch_workers
+        self._ordered = ordered
+
+        self._fetched: Queue = Queue(maxsize=queue_size)
+        self._encoded: Queue = Queue(maxsize=queue_size)
+
+        self._stop = threading.Event()
+        self._failure = None
+
+        self._block_numbers = None
+        self._block_numbers_lock = threading.Lock()
+
+        # In order, one block that stalls would hold up all the blocks after
+        #   it, so cap how many blocks may be taken but not yet emitted
+        if ordered:
+            self._reorder_slots = threading.Semaphore(queue_size)
+        else:
+            self._reorder_slots = None
+
+    def run(self, block_numbers):
+        """
+        Start all the stages, and yield (block_number, content_items) as they are encoded.
+        """
+        self._block_numbers = enumerate(block_numbers)
+        if self._encode_processes:
+            self._encode_pool = ProcessPoolExecutor(max_workers=self._encode_processes)
+
+        threads = [
+            threading.Thread(target=self._fetch_worker, daemon=True)
+            for _ in range(self._num_fetch_workers)
+        ]
+        threads.append(threading.Thread(target=self._encode_worker, daemon=True))
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                encoded = self._get(self._encoded)
+                if encoded is _DONE:
+                    break
+                else:
+                    yield encoded
+        finally:
+            # Shut down the background stages, whether exiting cleanly or not
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+            if self._encode_pool is not None:
+                self._encode_pool.shutdown()
+            self._fetcher.close()
+
+        if self._failure is not None:
+            raise self._failure
+
+    def _next_window(self):
+        """
+        Take the next blocks to fetch, up to a window of them.
+
+        In order, wait until at least one block may be taken without running
+        too far ahead of the next block to emit.
+        """
+        if self._reorder_slots is None:
+            with self._block_numbers_lock:
+                return list(islice(self._block_numbers, self._fetch_window))
+
+        while not self._reorder_slots.acquire(timeout=_STOP_CHECK_SECONDS):
+            if self._stop.is_set():
+                return []
+        num_slots = 1
+        # Never wait for the rest of the window, so a small queue can't deadlock
+        while num_slots < self._fetch_window and self._reorder_slots.acquire(False):
+            num_slots += 1
+
+        with self._block_numbers_lock:
+            window = list(islice(self._block_numbers, num_slots))
+        for _ in range(num_slots - len(window)):
+            self._reorder_slots.release()
+        return window
+
+    def _fetch_worker(self):
+        try:
+            while not self._stop.is_set():
+                window = self._next_window()
+                if not window:
+                    break
+
+                # Blocks that were already encoded skip straight past encoding
+                to_fetch = []
+                for idx, block_number in window:
+                    if self._is_complete(block_number):
+                        # Nothing to push, but still pass it on, to keep the order
+                        self._put(self._fetched, (idx, block_number, None, ()))
+                        continue
+
+                    stored_content = self._load_stored(block_number)
+                    if stored_content is None:
+                        to_fetch.append((idx, block_number))
+                    else:
+                        self._put(
+                            self._fetched, (idx, block_number, None, stored_content)
+                        )
+
+                if not to_fetch:
+                    continue
+
+                indices, block_numbers = zip(*to_fetch)
+                print(f"Getting blocks {block_numbers} for injection to Portal network")
+                if self._encode_pool is None:
+                    fetched_blocks = self._fetcher.fetch_blocks(block_numbers)
+                else:
+                    fetched_blocks = [
+                        self._encode_pool.submit(encode_raw_block_content, raw_block)
+                        for raw_block in self._fetcher.fetch_raw_blocks(block_numbers)
+                    ]
+
+                for idx, block_number, fetched in zip(
+                    indices, block_numbers, fetched_blocks
+                ):
+                    self._put(self._fetched, (idx, block_number, fetched, None))
+        except Exception as exc:
+            self._fail(exc)
+        finally:
+            self._put(self._fetched, _DONE)
+
+    def _is_complete(self, block_number):
+        if self._skip_complete is None:
+            return False
+        else:
+            return self._skip_complete.is_complete(block_number)
+
+    def _load_stored(self, block_number):
+        if self._content_store is None:
+            return None
+        else:
+            return self._content_store.get_block(block_number)
+
+    def _encode_worker(self):
+        # Blocks that were fetched out of order, waiting for their turn, by index
+        pending = {}
+        next_idx = 0
+        done_fetchers = 0
+
+        try:
+            while done_fetchers < self._num_fetch_workers:
+                fetched = self._get(self._fetched)
+                if fetched is _DONE:
+                    done_fetchers += 1
+                    continue
+
+                idx, block_number, fetched_block, content_items = fetched
+                if content_items is None and self._was_offered(fetched_block):
+                    # Nothing to push, but still pass it on, to keep the order
+                    content_items = ()
+                elif content_items is None:
+                    header_hash, content_items = self._encode(fetched_block)
+                    if self._content_store is not None:
+                        self._content_store.put_block(
+                            block_number, header_hash, content_items
+                        )
+
+                encoded = (block_number, content_items)
+
+                if not self._ordered:
+                    self._put(self._encoded, encoded)
+                    continue
+
+                pending[idx] = encoded
+                while next_idx in pending:
+                    self._put(self._encoded, pending.pop(next_idx))
+                    self._reorder_slots.release()
+                    next_idx += 1
+        except Exception as exc:
+            self._fail(exc)
+        finally:
+            self._put(self._encoded, _DONE)
+
+    def _was_offered(self, fetched_block):
+        """
+        Check whether a fetched block was already offered, so it needn't be encoded.
+
+        Blocks that were sent to encode processes have already started encoding.
+        """
+        if self._was_block_offered is None or isinstance(fetched_block, Future):
+            return False
+        else:
+            block_fields, _, _ = fetched_block
+            return self._was_block_offered(block_fields.hash)
+
+    @staticmethod
+    def _encode(fetched_block):
+        """
+        Encode a fetched block, or wait for the encode process that is encoding it.
+
+        :return: (header_hash, content_items)
+        """
+        if isinstance(fetched_block, Future):
+            header_hash, content_items, encode_times = fetched_block.result()
+            ENCODE_SECONDS.observe_all(encode_times)
+            return header_hash, content_items
+        else:
+            block_fields, uncles, receipts = fetched_block
+            content_items = encode_block_content(block_fields, uncles, receipts)
+            return block_fields.hash, content_items
+
+    def _fail(self, exc):
+        if self._failure is None:
+            self._failure = exc
+        self._stop.set()
+
+    def _put(self, queue, item):
+        """
+        Put an item on the queue, waiting for room unless the pipeline is stopped.
+        """
+        while True:
+            try:
+                queue.put(item, timeout=_STOP_CHECK_SECONDS)
+            except Full:
+                if self._stop.is_set():
+                    return
+            else:
+                return
+
+    def _get(self, queue):
+        """
+        Get an item from the queue, or return _DONE if the pipeline is stopped.
+        """
+        while True:
+            try:
+                return queue.get(timeout=_STOP_CHECK_SECONDS)
+            except Empty:
+                if self._stop.is_set():
+                    return _DONE
@@ -0,0 +1,112 @@
+from pathlib import Path
+import sqlite3
+import threading
+import time
+from typing import FrozenSet
+
+from eth_portal.ssz_sedes import BODY_TYPE_BYTE, HEADER_TYPE_BYTE, RECEIPT_TYPE_BYTE
+
+# Every type of content that is offered for each block
+BLOCK_CONTENT_TYPES = frozenset(
+    type_byte[0] for type_byte in (HEADER_TYPE_BYTE, BODY_TYPE_BYTE, RECEIPT_TYPE_BYTE)
+)
+
+# Progress is flushed to disk after this many seconds, so that a crash loses
+#   at most a few seconds of work, without paying for a disk sync on every offer
+_COMMIT_INTERVAL_SECONDS = 2
+
+
+def content_type_of(content_key: bytes) -> int:
+    """
+    Get the type of a History Network content key: header, block body or receipts.
+
+    :return: the type ID, which is the first byte of the content key
+    """
+    return content_key[0]
+
+
+class BackfillCheckpoint:
+    """
+    Record which content of which blocks was offered, so a backfill can resume later.
+
+    Progress is recorded separately for the header, block body and receipts
+    of each block, in a SQLite database.
+
+    The checkpoint may be shared between threads.
+    """
+
+    def __init__(self, path):
+        """
+        Open the checkpoint at the given path, creating it if needed.
+        """
+        self._path = Path(path)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self._path), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS offered ("
+            " block_number INTEGER NOT NULL,"
+            " content_type INTEGER NOT NULL,"
+            " PRIMARY KEY (block_number, content_type)"
+            ") WITHOUT ROWID"
+        )
+        self._db.commit()
+        self._last_commit = time.monotonic()
+
+    def record(self, block_number: int, content_key: bytes) -> None:
+        """
+        Record that the content with the given key was offered, for the given block.
+        """
+        with self._lock:
+            self._db.execute(
+                "INSERT OR IGNORE INTO offered (block_number, content_type) VALUES (?, ?)",
+                (block_number, content_type_of(content_key)),
+            )
+            if time.monotonic() - self._last_commit > _COMMIT_INTERVAL_SECONDS:
+                self._commit()
+
+    def offered_types(self, block_number: int) -> FrozenSet[int]:
+        """
+        Get the types of content that were already offered for the given block.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT content_type FROM offered WHERE block_number = ?",
+                (block_number,),
+            ).fetchall()
+        return frozenset(content_type for (content_type,) in rows)
+
+    def is_complete(self, block_number: int) -> bool:
+        """
+        Check whether all content of the given block was already offered.
+        """
+        return self.offered_types(block_number) >= BLOCK_CONTENT_TYPES
+
+    def count_complete(self, start_block: int, end_block: int) -> int:
+        """
+        Count the blocks in the range (inclusive) whose content was all offered.
+        """
+        with self._lock:
+            (count,) = self._db.execute(
+                "SELECT COUNT(*) FROM ("
+                " SELECT block_number FROM offered"
+                " WHERE block_number BETWEEN ? AND ?"
+                " GROUP BY block_number HAVING COUNT(*) >= ?"
+                ")",
+                (start_block, end_block, len(BLOCK_CONTENT_TYPES)),
+            ).fetchone()
+        return count
+
+    def close(self) -> None:
+        with self._lock:
+            self._commit()
+            self._db.close()
+
+    def __enter__(self) -> "BackfillCheckpoint":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _commit(self):
+        self._db.commit()
+        self._last_commit = time.monotonic()
@@ -0,0 +1,99 @@
+from typing import NamedTuple, Sequence, Tuple
+
+KEYSPACE_SIZE = 2**256
+
+
+class CoverageReport(NamedTuple):
+    """
+    How evenly a group of node IDs covers the keyspace.
+    """
+
+    # For each node, in the order given: the furthest XOR distance to any
+    #   content ID that it's the closest node to
+    radii: Tuple[int, ...]
+
+    # The longest run of the keyspace, in ID order, with no node ID in it
+    max_gap: int
+
+    @property
+    def ideal_radius(self) -> int:
+        """
+        The largest radius that any node would need, if the nodes tiled the keyspace evenly.
+
+        With between 2**k and 2**(k+1) nodes, the best possible tiling gives
+        each of the 2**k prefixes of k bits at least one node, so no node is
+        closest to content outside its own prefix.
+        """
+        prefix_bits = len(self.radii).bit_length() - 1
+        return (KEYSPACE_SIZE >> prefix_bits) - 1
+
+    @property
+    def holes(self) -> Tuple[int, ...]:
+        """
+        The position of every node that is closest to more than its share of the keyspace.
+
+        Content beyond the ideal radius of these nodes lands in a part of the
+        keyspace with no node of its own, so it gets offered from further away.
+        """
+        ideal_radius = self.ideal_radius
+        return tuple(
+            idx for idx, radius in enumerate(self.radii) if radius > ideal_radius
+        )
+
+    def describe(self) -> str:
+        """
+        Summarize the coverage in a line, with each span as a share of the whole keyspace.
+        """
+        max_radius = max(self.radii)
+        return (
+            f"{len(self.radii)} node IDs: widest radius 1/{_share(max_radius + 1)}"
+            f" of the keyspace (ideal 1/{_share(self.ideal_radius + 1)}),"
+            f" widest gap 1/{_share(self.max_gap)} (ideal 1/{len(self.radii)}),"
+            f" {len(self.holes)} nodes covering a hole"
+        )
+
+
+def check_coverage(node_ids: Sequence[bytes]) -> CoverageReport:
+    """
+    Measure how evenly the node IDs cover the keyspace, looking for holes.
+
+    Offers are routed to the nodes closest to each content ID, so a node
+    with no neighbors nearby ends up responsible for a wide stretch of the
+    keyspace, while others crowd together.
+
+    :param node_ids: the 32-byte node ID of each node
+    """
+    if not node_ids:
+        raise ValueError("Must check the coverage of at least one node ID")
+
+    ids = [int.from_bytes(node_id, "big") for node_id in node_ids]
+    radii = tuple(_radius(node_id, ids) for node_id in ids)
+
+    sorted_ids = sorted(ids)
+    gaps = [b - a for a, b in zip(sorted_ids, sorted_ids[1:])]
+    gaps += [sorted_ids[0], KEYSPACE_SIZE - sorted_ids[-1]]
+    return CoverageReport(radii, max(gaps))
+
+
+def _radius(node_id: int, all_ids: Sequence[int]) -> int:
+    """
+    Find the furthest XOR distance from the node to any content ID that it's closest to.
+
+    Content that differs from the node first at some bit is routed to the
+    nodes that also differ there, if there are any. If not, it's routed
+    back towards this node. So the radius has every bit set, except where
+    another node first differs from this one.
+    """
+    radius = KEYSPACE_SIZE - 1
+    for other_id in all_ids:
+        first_difference = (node_id ^ other_id).bit_length() - 1
+        if first_difference >= 0:
+            radius &= ~(1 << first_difference)
+    return radius
+
+
+def _share(span: int) -> str:
+    """
+    Show a span of the keyspace as the denominator of its share of the whole.
+    """
+    return f"{KEYSPACE_SIZE / span:.3g}"
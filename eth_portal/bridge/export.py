@@ -0,0 +1,90 @@
+from contextlib import closing, contextmanager
+import os
+from pathlib import Path
+
+from .archive import ArchiveWriter, is_archive_path
+from .backfill import DEFAULT_FETCH_WORKERS, iter_encoded_blocks
+
+CONTENT_FILE_SUFFIX = ".portalcontent"
+
+
+def export_block_range(
+    block_numbers,
+    w3,
+    export_path,
+    fetch_workers: int = DEFAULT_FETCH_WORKERS,
+    encode_processes: int = None,
+    content_store=None,
+) -> int:
+    """
+    Fetch, validate and encode a range of blocks, and save the content to files.
+
+    If the export path ends in ``.portalarchive``, all content is packed into
+    that single archive file. Otherwise, it's a directory, and each content
+    item is written to its own ``.portalcontent`` file in it, named after the
+    hex-encoded content key. Either way, the content injector can read the
+    result, so the content can be injected later, or on another machine,
+    without access to a provider.
+
+    Blocks are fetched and encoded with the same pipeline as a backfill, see
+    :func:`~eth_portal.bridge.backfill.iter_encoded_blocks`.
+
+    :param block_numbers: the block numbers to export
+    :param w3: web3 access to core Ethereum content
+    :param export_path: the archive file to write, or the directory to write
+        content files into, created if needed
+    :param fetch_workers: how many threads retrieve blocks from the provider
+    :param encode_processes: if supplied, encode blocks in this many processes
+    :param content_store: if supplied, a :class:`~eth_portal.bridge.store.ContentStore`
+        to load previously-encoded blocks from, and to save newly-encoded blocks to
+
+    :return: the number of content items written
+    """
+    encoded_blocks = iter_encoded_blocks(
+        block_numbers,
+        w3,
+        fetch_workers,
+        content_store=content_store,
+        encode_processes=encode_processes,
+    )
+
+    num_written = 0
+    with _open_content_writer(export_path) as write_content:
+        with closing(encoded_blocks):
+            for block_number, content_items in encoded_blocks:
+                for content_key, content_value in content_items:
+                    write_content(content_key, content_value)
+                    num_written += 1
+                print(f"Exported all content for block #{block_number}")
+
+    return num_written
+
+
+@contextmanager
+def _open_content_writer(export_path):
+    """
+    Yield a function that writes a content item to the archive or directory at the path.
+    """
+    if is_archive_path(export_path):
+        with ArchiveWriter(export_path) as archive:
+            yield archive.add
+    else:
+        export_dir = Path(export_path)
+        export_dir.mkdir(parents=True, exist_ok=True)
+        yield lambda key, value: write_content_file(export_dir, key, value)
+
+
+def write_content_file(export_dir: Path, content_key: bytes, content_value: bytes):
+    """
+    Write a content value to a ``.portalcontent`` file, named after its content key.
+
+    The file is written under a temporary name first, so that an interrupted
+    export never leaves behind a truncated content file.
+
+    :return: the path of the content file
+    """
+    path = export_dir / f"{content_key.hex()}{CONTENT_FILE_SUFFIX}"
+    partial_path = path.with_suffix(".partial")
+    partial_path.write_bytes(content_value)
+    os.replace(partial_path, path)
+    return path
@@ -0,0 +1,412 @@
+import itertools
+import json
+import threading
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+from eth_utils import encode_hex, to_tuple
+import requests
+from web3 import HTTPProvider
+from web3._utils.method_formatters import PYTHONIC_RESULT_FORMATTERS
+from web3.datastructures import AttributeDict
+from web3.exceptions import TimeExhausted
+
+from .metrics import BLOCKS_FETCHED
+
+# Whether each provider endpoint supports eth_getBlockReceipts, once known
+_BLOCK_RECEIPTS_SUPPORT: Dict[str, bool] = {}
+
+
+class BatchFetcher:
+    """
+    Retrieve blocks, uncles and receipts with as few JSON-RPC round-trips as possible.
+
+    All the uncles and receipts of a block, or of a window of blocks, are
+    requested together in a single JSON-RPC batch. Receipts are requested
+    with ``eth_getBlockReceipts`` where the provider supports it, and
+    otherwise with one ``eth_getTransactionReceipt`` per transaction, still
+    inside the batch.
+
+    Batching requires an HTTP provider. With any other kind of provider, each
+    item is requested individually, just like a plain web3 call.
+
+    Batches share one HTTP session, so reuse a fetcher for as long as
+    possible, and close it when done.
+    """
+
+    def __init__(self, w3):
+        self._w3 = w3
+        self._request_ids = itertools.count()
+        self._request_ids_lock = threading.Lock()
+        self._session = requests.Session()
+
+    def close(self) -> None:
+        """
+        Close the HTTP connections kept open for batches.
+        """
+        self._session.close()
+
+    @property
+    def is_batching(self) -> bool:
+        return isinstance(self._w3.provider, HTTPProvider)
+
+    def fetch_blocks(self, block_numbers: Sequence[int]):
+        """
+        Retrieve everything needed to encode all content for a window of blocks.
+
+        Takes two round-trips in total: one for the blocks, and one for all of
+        their uncles and receipts.
+
+        :return: a list of (block_fields, web3_uncles, web3_receipts), in the
+            same order as `block_numbers`
+        """
+        blocks = self.get_blocks(block_numbers)
+        uncles_and_receipts = self.get_uncles_and_receipts(blocks)
+        BLOCKS_FETCHED.inc(len(blocks))
+        return [
+            (block_fields, web3_uncles, web3_receipts)
+            for block_fields, (web3_uncles, web3_receipts) in zip(
+                blocks, uncles_and_receipts
+            )
+        ]
+
+    def get_blocks(self, block_numbers: Sequence[int]):
+        """
+        Retrieve the blocks with the given numbers, including full transactions.
+        """
+        if not self.is_batching:
+            return [
+                self._w3.eth.get_block(block_number, full_transactions=True)
+                for block_number in block_numbers
+            ]
+
+        calls = [
+            ("eth_getBlockByNumber", [hex(block_number), True])
+            for block_number in block_numbers
+        ]
+        blocks = self.request_batch(calls)
+        for block_number, block_fields in zip(block_numbers, blocks):
+            if block_fields is None:
+                raise ValueError(f"Provider does not have block #{block_number}")
+        return blocks
+
+    def get_uncles_and_receipts(self, blocks) -> List[Tuple[list, list]]:
+        """
+        Retrieve the uncles and receipts of each block, in a single batch.
+
+        Any receipt that the provider does not have yet is waited for, which
+        can happen when following the very tip of the chain.
+
+        :return: a list with (web3_uncles, web3_receipts) for each block
+
+        :raise TimeExhausted: if a receipt never becomes available from the provider
+        """
+        if not self.is_batching:
+            return [
+                (
+                    [self._w3.eth.get_block(uncle) for uncle in block_fields.uncles],
+                    wait_for_receipts(
+                        self._w3,
+                        block_fields,
+                        [txn.hash for txn in block_fields.transactions],
+                    ),
+                )
+                for block_fields in blocks
+            ]
+
+        block_refs = [_block_ref(block_fields) for block_fields in blocks]
+        raw_uncles_and_receipts = self._request_uncles_and_receipts(block_refs)
+
+        uncles_and_receipts = []
+        for block_fields, (raw_uncles, raw_receipts) in zip(
+            blocks, raw_uncles_and_receipts
+        ):
+            web3_uncles = [
+                format_result("eth_getBlockByHash", raw_uncle)
+                for raw_uncle in raw_uncles
+            ]
+            if raw_receipts is None:
+                # The provider has not indexed the receipts yet, so wait for them
+                txn_hashes = [txn.hash for txn in block_fields.transactions]
+                web3_receipts = wait_for_receipts(self._w3, block_fields, txn_hashes)
+            else:
+                web3_receipts = [
+                    format_result("eth_getTransactionReceipt", raw_receipt)
+                    for raw_receipt in raw_receipts
+                ]
+
+            uncles_and_receipts.append((web3_uncles, web3_receipts))
+
+        return uncles_and_receipts
+
+    def fetch_raw_blocks(self, block_numbers: Sequence[int]) -> List[bytes]:
+        """
+        Retrieve everything needed to encode a window of blocks, as raw provider JSON.
+
+        The results are not formatted by web3, so they are cheap to send to
+        another process, where :func:`parse_raw_block` can format them.
+
+        Works with any provider, but only batches requests over HTTP.
+
+        :return: a JSON-encoded object for each block, in the same order as
+            `block_numbers`, with the keys "block", "uncles" and "receipts"
+
+        :raise TimeExhausted: if a receipt never becomes available from the provider
+        """
+        calls = [
+            ("eth_getBlockByNumber", [hex(block_number), True])
+            for block_number in block_numbers
+        ]
+        raw_blocks = self.request_raw_batch(calls)
+        for block_number, raw_block in zip(block_numbers, raw_blocks):
+            if raw_block is None:
+                raise ValueError(f"Provider does not have block #{block_number}")
+
+        block_refs = [_raw_block_ref(raw_block) for raw_block in raw_blocks]
+        raw_uncles_and_receipts = self._request_uncles_and_receipts(block_refs)
+
+        encoded_blocks = []
+        for raw_block, block_ref, (raw_uncles, raw_receipts) in zip(
+            raw_blocks, block_refs, raw_uncles_and_receipts
+        ):
+            if raw_receipts is None:
+                # Wait until the provider has indexed the receipts, then ask again
+                block_fields = format_result("eth_getBlockByNumber", raw_block)
+                txn_hashes = [txn.hash for txn in block_fields.transactions]
+                wait_for_receipts(self._w3, block_fields, txn_hashes)
+                raw_receipts = self.request_raw_batch(
+                    _receipt_calls(block_ref, use_block_receipts=False)
+                )
+
+            encoded_blocks.append(
+                json.dumps(
+                    {"block": raw_block, "uncles": raw_uncles, "receipts": raw_receipts}
+                ).encode()
+            )
+
+        BLOCKS_FETCHED.inc(len(encoded_blocks))
+        return encoded_blocks
+
+    def request_batch(self, calls: Iterable[Tuple[str, Any]]) -> list:
+        """
+        Send a JSON-RPC batch request, and return the formatted results in order.
+
+        :param calls: a sequence of (method, params) pairs
+
+        :raise ValueError: if the provider returns an error for any request
+        """
+        calls = tuple(calls)
+        raw_results = self.request_raw_batch(calls)
+        return [
+            format_result(method, raw_result)
+            for (method, _), raw_result in zip(calls, raw_results)
+        ]
+
+    def request_raw_batch(self, calls: Iterable[Tuple[str, Any]]) -> list:
+        """
+        Send a JSON-RPC batch request, and return the raw JSON results in order.
+
+        With a provider that can't batch, each request is sent individually.
+
+        :param calls: a sequence of (method, params) pairs
+
+        :raise ValueError: if the provider returns an error for any request
+        """
+        if self.is_batching:
+            raw_responses = self._post_batch(calls)
+        else:
+            raw_responses = [
+                (method, self._w3.provider.make_request(method, params))
+                for method, params in calls
+            ]
+
+        results = []
+        for _, response in raw_responses:
+            if "error" in response:
+                raise ValueError(response["error"])
+            results.append(response["result"])
+        return results
+
+    def _request_uncles_and_receipts(self, block_refs):
+        """
+        Request the raw uncles and receipts of each block, in a single batch.
+
+        :param block_refs: (block_hash, uncle_hashes, transaction_hashes) of each
+            block, all hex-encoded
+
+        :return: (raw_uncles, raw_receipts) of each block. The receipts are None
+            if the provider is missing any of them.
+        """
+        use_block_receipts = self.is_batching and self._supports_block_receipts(
+            block_refs
+        )
+
+        calls = []
+        for block_ref in block_refs:
+            calls.extend(_uncle_calls(block_ref))
+            calls.extend(_receipt_calls(block_ref, use_block_receipts))
+
+        results = iter(self.request_raw_batch(calls))
+
+        uncles_and_receipts = []
+        for _, uncle_hashes, txn_hashes in block_refs:
+            raw_uncles = list(itertools.islice(results, len(uncle_hashes)))
+            if use_block_receipts:
+                raw_receipts = next(results)
+            else:
+                raw_receipts = list(itertools.islice(results, len(txn_hashes)))
+
+            if raw_receipts is not None and any(r is None for r in raw_receipts):
+                raw_receipts = None
+
+            uncles_and_receipts.append((raw_uncles, raw_receipts))
+
+        return uncles_and_receipts
+
+    @to_tuple
+    def _post_batch(self, calls):
+        """
+        Send the batch over HTTP, and yield (method, raw_response) in call order.
+        """
+        calls = tuple(calls)
+        if not calls:
+            return
+
+        with self._request_ids_lock:
+            request_ids = [next(self._request_ids) for _ in calls]
+
+        request_data = json.dumps(
+            [
+                {"jsonrpc": "2.0", "method": method, "params": params, "id": request_id}
+                for request_id, (method, params) in zip(request_ids, calls)
+            ]
+        ).encode()
+
+        provider = self._w3.provider
+        http_response = self._session.post(
+            provider.endpoint_uri,
+            data=request_data,
+            **provider.get_request_kwargs(),
+        )
+        http_response.raise_for_status()
+        responses = json.loads(http_response.content)
+
+        if isinstance(responses, dict):
+            # Some providers reject the whole batch with a single error
+            raise ValueError(responses.get("error", responses))
+
+        # Batch responses may arrive in any order, so match them up by ID
+        responses_by_id = {response["id"]: response for response in responses}
+        for request_id, (method, _) in zip(request_ids, calls):
+            if request_id not in responses_by_id:
+                raise ValueError(f"Provider did not respond to {method} request")
+            yield method, responses_by_id[request_id]
+
+    def _supports_block_receipts(self, block_refs) -> bool:
+        endpoint = self._w3.provider.endpoint_uri
+        if endpoint not in _BLOCK_RECEIPTS_SUPPORT:
+            blocks_with_txns = [ref for ref in block_refs if ref[2]]
+            if not blocks_with_txns:
+                # Can't tell yet, and there are no receipts to retrieve anyway
+                return False
+
+            probe_block_hash, _, _ = blocks_with_txns[0]
+            ((_, response),) = self._post_batch(
+                [("eth_getBlockReceipts", [probe_block_hash])]
+            )
+            _BLOCK_RECEIPTS_SUPPORT[endpoint] = "result" in response
+
+        return _BLOCK_RECEIPTS_SUPPORT[endpoint]
+
+
+def wait_for_receipts(w3, block_fields, txn_hashes):
+    """
+    Retrieve the web3 receipts of the given transactions, waiting for any that are missing.
+
+    :param w3: web3 access to core Ethereum content
+    :param block_fields: the web3 block fields for the header the receipts belong to
+    :param txn_hashes: the hashes of every transaction in the block, in block order
+
+    :raise TimeExhausted: if a receipt never becomes available from the provider
+    """
+    print("Collecting receipts to propagate...")
+    try:
+        web3_receipts = [
+            w3.eth.wait_for_transaction_receipt(txn_hash, poll_latency=2)
+            for txn_hash in txn_hashes
+        ]
+    except TimeExhausted:
+        print(
+            f"Transaction never appeared in block #{block_fields.number}: {block_fields.hash}"
+        )
+        raise
+
+    print("Collected receipts")
+    return web3_receipts
+
+
+def format_result(method: str, raw_result):
+    """
+    Format a raw JSON-RPC result the same way that web3 does for its own calls.
+
+    web3 keeps these formatters private, so setup.py only accepts the web3
+    releases that they have been checked against.
+    """
+    if method == "eth_getBlockReceipts":
+        if raw_result is None:
+            return None
+        else:
+            receipt_formatter = PYTHONIC_RESULT_FORMATTERS["eth_getTransactionReceipt"]
+            formatted = [receipt_formatter(receipt) for receipt in raw_result]
+    elif method in PYTHONIC_RESULT_FORMATTERS:
+        formatted = PYTHONIC_RESULT_FORMATTERS[method](raw_result)
+    else:
+        formatted = raw_result
+
+    return AttributeDict.recursive(formatted)
+
+
+def parse_raw_block(encoded_block: bytes):
+    """
+    Format a block from :meth:`BatchFetcher.fetch_raw_blocks` the way web3 would.
+
+    :return: (block_fields, web3_uncles, web3_receipts)
+    """
+    raw = json.loads(encoded_block)
+    block_fields = format_result("eth_getBlockByNumber", raw["block"])
+    web3_uncles = [
+        format_result("eth_getBlockByHash", raw_uncle) for raw_uncle in raw["uncles"]
+    ]
+    web3_receipts = [
+        format_result("eth_getTransactionReceipt", raw_receipt)
+        for raw_receipt in raw["receipts"]
+    ]
+    return block_fields, web3_uncles, web3_receipts
+
+
+def _block_ref(block_fields):
+    return (
+        encode_hex(block_fields.hash),
+        [encode_hex(uncle_hash) for uncle_hash in block_fields.uncles],
+        [encode_hex(txn.hash) for txn in block_fields.transactions],
+    )
+
+
+def _raw_block_ref(raw_block):
+    return (
+        raw_block["hash"],
+        raw_block["uncles"],
+        [raw_txn["hash"] for raw_txn in raw_block["transactions"]],
+    )
+
+
+def _uncle_calls(block_ref):
+    _, uncle_hashes, _ = block_ref
+    return [("eth_getBlockByHash", [uncle_hash, False]) for uncle_hash in uncle_hashes]
+
+
+def _receipt_calls(block_ref, use_block_receipts):
+    block_hash, _, txn_hashes = block_ref
+    if use_block_receipts:
+        return [("eth_getBlockReceipts", [block_hash])]
+    else:
+        return [("eth_getTransactionReceipt", [txn_hash]) for txn_hash in txn_hashes]
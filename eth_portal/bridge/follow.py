@@ -0,0 +1,359 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import time
+from typing import AsyncIterator, Dict, NamedTuple, Optional
+
+from eth_utils import to_bytes, to_int
+import websockets
+
+from .fetch import BatchFetcher
+from .history import propagate_block
+from .insert import PortalInserter
+from .metrics import HEAD_LAG_SECONDS, HEAD_PUBLISH_SECONDS
+
+# How many blocks may be processed at the same time. Further heads wait for
+#   a slot to free up, so a slow provider can't cause an unbounded backlog.
+DEFAULT_MAX_IN_FLIGHT = 4
+
+# Bounds for the adaptive poll interval, in seconds. Right after a new head is
+#   found, the next one is about a slot away, so poll slowly. As time passes,
+#   poll more and more often, until the next head shows up.
+MIN_POLL_SECONDS = 1
+MAX_POLL_SECONDS = 6
+
+# How many times to try publishing a block, before giving up on it
+MAX_PUBLISH_ATTEMPTS = 3
+
+# How many of the most recent blocks to keep latency samples for
+LATENCY_WINDOW = 256
+
+
+class DroppedFilter(Exception):
+    pass
+
+
+class Head(NamedTuple):
+    number: int
+    hash: bytes
+    seen_at: float
+
+
+class HeadLatency:
+    """
+    Track how long it takes to publish new heads, over a window of recent blocks.
+
+    Two latencies are tracked for each block: from when the bridge first saw
+    the head to when all of its content was published, and from the block's
+    own timestamp to when it was published.
+    """
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self._window = window
+        self._publish_latencies: Dict[int, float] = {}
+        self._block_ages: Dict[int, float] = {}
+
+    def record(self, block_number: int, block_timestamp: int, seen_at: float):
+        """
+        Record that the block was just published.
+
+        :param block_timestamp: the timestamp from the block header
+        :param seen_at: the wall-clock time when the bridge first saw the head
+        """
+        published_at = time.time()
+        self._publish_latencies[block_number] = published_at - seen_at
+        self._block_ages[block_number] = published_at - block_timestamp
+
+        # Drop the oldest samples, which were inserted first
+        while len(self._publish_latencies) > self._window:
+            oldest = next(iter(self._publish_latencies))
+            del self._publish_latencies[oldest]
+            del self._block_ages[oldest]
+
+    @property
+    def count(self) -> int:
+        return len(self._publish_latencies)
+
+    def last(self, block_number: int):
+        """
+        Look up the latencies of a recently published block.
+
+        :return: (seconds from first seeing the head, seconds from block timestamp)
+        """
+        return self._publish_latencies[block_number], self._block_ages[block_number]
+
+    def summary(self) -> str:
+        if not self._publish_latencies:
+            return "no blocks published yet"
+
+        latencies = sorted(self._publish_latencies.values())
+        ages = sorted(self._block_ages.values())
+        return (
+            f"head-to-publish over last {len(latencies)} blocks:"
+            f" median {_median(latencies):.1f}s, max {latencies[-1]:.1f}s;"
+            f" block age at publish: median {_median(ages):.1f}s, max {ages[-1]:.1f}s"
+        )
+
+
+class HeadFollower:
+    """
+    Follow the head of the chain, and publish each new block into the Portal network.
+
+    New heads come from a ``newHeads`` websocket subscription, if a websocket
+    URI is supplied, or otherwise from polling a ``latest`` block filter, with
+    an interval that adapts to when the next block is expected.
+
+    Several blocks can be published at the same time, up to `max_in_flight`,
+    so that one slow block doesn't delay noticing and publishing the next one.
+    If any block numbers are skipped, like after the filter is dropped or the
+    subscription reconnects, the missing blocks are backfilled. Blocks that
+    fail to publish are retried along with the next head, a few times.
+    """
+
+    def __init__(
+        self,
+        w3,
+        portal_inserter: PortalInserter,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+        subscribe_uri: Optional[str] = None,
+        content_store=None,
+    ):
+        """
+        Create a follower, which starts following the chain when run.
+
+        :param w3: web3 access to core Ethereum content
+        :param portal_inserter: a class responsible for pushing content keys and
+            values into the network via a group of running portal clients
+        :param max_in_flight: how many blocks may be published at the same time
+        :param subscribe_uri: a websocket JSON-RPC URI to subscribe to new heads
+        :param content_store: if supplied, a :class:`~eth_portal.bridge.store.ContentStore`
+            to save published content to, and to reuse it from on re-publishing
+        """
+        if max_in_flight < 1:
+            raise ValueError(
+                f"Must allow at least one block in flight, not {max_in_flight}"
+            )
+
+        self._w3 = w3
+        self._portal_inserter = portal_inserter
+        self._max_in_flight = max_in_flight
+        self._subscribe_uri = subscribe_uri
+        self._content_store = content_store
+
+        self.latency = HeadLatency()
+
+        # One fetcher for every block, so its HTTP connections are reused
+        self._fetcher = BatchFetcher(w3)
+        self._highest_seen: Optional[int] = None
+        # How many times each block that failed to publish was tried so far
+        self._failed: Dict[int, int] = {}
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_in_flight,
+            thread_name_prefix="head-follower",
+        )
+
+    async def run(self):
+        """
+        Publish new heads until cancelled, or until there are no more heads.
+        """
+        in_flight = asyncio.Semaphore(self._max_in_flight)
+        pending = set()
+
+        try:
+            async for head in self._watch_heads():
+                for block_id, block_number, attempt in self._blocks_to_publish(head):
+                    # Wait for a free slot, so that a backlog of heads builds
+                    #   up in the provider, not in memory
+                    await in_flight.acquire()
+                    task = asyncio.ensure_future(
+                        self._publish(
+                            block_id, block_number, attempt, head.seen_at, in_flight
+                        )
+                    )
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+
+            # Only reached if the source of heads runs dry
+            await asyncio.gather(*pending)
+        finally:
+            for task in pending:
+                task.cancel()
+            self._executor.shutdown(wait=False)
+            self._fetcher.close()
+
+    def _blocks_to_publish(self, head: Head):
+        """
+        Choose which blocks to publish, given a new head: including any skipped or failed blocks.
+
+        :return: an iterable of (block_id, block_number, attempt), where the
+            attempt counts from 1
+        """
+        if self._highest_seen is not None and head.number > self._highest_seen + 1:
+            missed = range(self._highest_seen + 1, head.number)
+            print(
+                f"Missed {len(missed)} blocks before head #{head.number}, backfilling..."
+            )
+        else:
+            missed = range(0)
+
+        failed, self._failed = self._failed, {}
+        for block_number, attempts in sorted(failed.items()):
+            # A block that is published anyway starts again from the first attempt
+            if block_number not in missed and block_number != head.number:
+                print(f"Retrying block #{block_number} after {attempts} failures...")
+                yield block_number, block_number, attempts + 1
+
+        for block_number in missed:
+            yield block_number, block_number, 1
+
+        # Publish by hash, so that a re-org at the same height is still published
+        yield head.hash, head.number, 1
+
+        if self._highest_seen is None or head.number > self._highest_seen:
+            self._highest_seen = head.number
+
+    async def _publish(
+        self,
+        block_id,
+        block_number: int,
+        attempt: int,
+        seen_at: float,
+        in_flight: asyncio.Semaphore,
+    ):
+        try:
+            loop = asyncio.get_event_loop()
+            block_number, block_timestamp = await loop.run_in_executor(
+                self._executor, self._publish_block, block_id
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            if attempt < MAX_PUBLISH_ATTEMPTS:
+                logging.exception(
+                    f"Failed to publish block #{block_number}, retrying with next head..."
+                )
+                self._failed[block_number] = attempt
+            else:
+                logging.exception(
+                    f"Failed to publish block #{block_number} {attempt} times, skipping..."
+                )
+        else:
+            self.latency.record(block_number, block_timestamp, seen_at)
+            from_seen, from_timestamp = self.latency.last(block_number)
+            HEAD_PUBLISH_SECONDS.observe(from_seen)
+            HEAD_LAG_SECONDS.set(from_timestamp)
+            print(
+                f"Published block #{block_number} {from_seen:.1f}s after seeing it,"
+                f" {from_timestamp:.1f}s after its timestamp"
+            )
+            if block_number % 10 == 0:
+                print(self.latency.summary())
+        finally:
+            in_flight.release()
+
+    def _publish_block(self, block_id):
+        block_fields = self._w3.eth.get_block(block_id, full_transactions=True)
+        propagate_block(
+            self._w3,
+            self._portal_inserter,
+            block_fields,
+            self._content_store,
+            self._fetcher,
+        )
+        return block_fields.number, block_fields.timestamp
+
+    def _watch_heads(self) -> AsyncIterator[Head]:
+        if self._subscribe_uri:
+            return self._subscribe_heads()
+        else:
+            return self._poll_heads()
+
+    async def _subscribe_heads(self) -> AsyncIterator[Head]:
+        request = {
+            "jsonrpc": "2.0",
+            "id": 1,
+            "method": "eth_subscribe",
+            "params": ["newHeads"],
+        }
+        while True:
+            try:
+                async with websockets.connect(self._subscribe_uri) as ws:
+                    await ws.send(json.dumps(request))
+                    async for message in ws:
+                        notification = json.loads(message)
+                        if notification.get("method") != "eth_subscription":
+                            continue
+
+                        header = notification["params"]["result"]
+                        yield Head(
+                            to_int(hexstr=header["number"]),
+                            to_bytes(hexstr=header["hash"]),
+                            time.time(),
+                        )
+            except (websockets.WebSocketException, OSError):
+                # The connection may drop, or be refused while the provider
+                #   restarts. Any skipped heads are backfilled when the next head arrives
+                logging.exception("Head subscription dropped, re-subscribing...")
+                await asyncio.sleep(MIN_POLL_SECONDS)
+
+    async def _poll_heads(self) -> AsyncIterator[Head]:
+        loop = asyncio.get_event_loop()
+        while True:
+            block_filter = await loop.run_in_executor(
+                None, self._w3.eth.filter, "latest"
+            )
+            try:
+                async for head in self._poll_filter(block_filter):
+                    yield head
+            except DroppedFilter:
+                # Any skipped heads are backfilled when the next head arrives
+                print("Recreating filter to watch for latest headers")
+
+    async def _poll_filter(self, block_filter) -> AsyncIterator[Head]:
+        loop = asyncio.get_event_loop()
+        poll_interval = MAX_POLL_SECONDS
+        while True:
+            try:
+                new_entries = await loop.run_in_executor(
+                    None, block_filter.get_new_entries
+                )
+            except ValueError as exc:
+                # most likely: the filter was dropped by the node
+                logging.exception("Failure to get latest events, re-attempting...")
+                raise DroppedFilter from exc
+
+            seen_at = time.time()
+            for header_hash in new_entries:
+                header = await loop.run_in_executor(
+                    None, self._w3.eth.get_block, header_hash
+                )
+                yield Head(header.number, header.hash, seen_at)
+
+            if new_entries:
+                poll_interval = MAX_POLL_SECONDS
+            else:
+                poll_interval = max(poll_interval / 2, MIN_POLL_SECONDS)
+            await asyncio.sleep(poll_interval)
+
+
+def follow_chain_head(
+    w3,
+    portal_inserter: PortalInserter,
+    max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+    subscribe_uri: Optional[str] = None,
+    content_store=None,
+):
+    """
+    Monitor the head of the chain, and insert new content until Ctrl-C is pressed.
+
+    See :class:`HeadFollower` for details.
+    """
+    follower = HeadFollower(
+        w3, portal_inserter, max_in_flight, subscribe_uri, content_store
+    )
+    asyncio.run(follower.run())
+
+
+def _median(sorted_values):
+    return sorted_values[len(sorted_values) // 2]
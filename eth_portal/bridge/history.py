@@ -1,29 +1,33 @@
 from tempfile import NamedTemporaryFile
 from typing import Tuple
 
-from eth.db.trie import make_trie_root_and_nodes
 from eth_hash.auto import keccak
 from eth_utils import ValidationError
 import rlp
-from web3.exceptions import TimeExhausted
 
 from eth_portal.portal_encode import (
     block_body_content_key,
-    block_body_content_value,
+    encoded_block_body_content_value,
+    encoded_receipt_content_value,
     header_content_key,
     receipt_content_key,
-    receipt_content_value,
 )
+from eth_portal.trie import ordered_trie_root
 from eth_portal.web3_decode import (
+    DecodedBlock,
     block_fields_to_header,
-    receipt_fields_to_receipt,
-    web3_result_to_transaction,
+    receipts_fields_to_receipts,
+    web3_results_to_transactions,
 )
 
+from .fetch import BatchFetcher, parse_raw_block
 from .insert import PortalInserter
+from .metrics import BLOCKS_FETCHED, ENCODE_SECONDS
 
 
-def propagate_block(w3, portal_inserter: PortalInserter, block_fields):
+def propagate_block(
+    w3, portal_inserter: PortalInserter, block_fields, content_store=None, fetcher=None
+):
     """
     Propagate the block and all related data into Portal History Network.
 
@@ -35,33 +39,68 @@ def propagate_block(w3, portal_inserter: PortalInserter, block_fields):
     :param portal_inserter: a class responsible for pushing content keys and
         values into the network via a group of running portal clients
     :param header_hash: the new header hash that we were notified exists on the network
+    :param content_store: if supplied, a :class:`~eth_portal.bridge.store.ContentStore`
+        to load the content from, if it was previously encoded, and to save
+        newly-encoded content to
+    :param fetcher: the :class:`~eth_portal.bridge.fetch.BatchFetcher` to
+        retrieve uncles and receipts with, which should be reused across
+        blocks. If None, one is created and closed just for this block.
     """
-    propagate_header(w3, portal_inserter, block_fields)
-
-    # Convert web3 transactions to py-evm transactions
-    transactions = [
-        web3_result_to_transaction(web3_transaction, block_fields.number)
-        for web3_transaction in block_fields.transactions
-    ]
-
-    propagate_block_bodies(w3, portal_inserter, block_fields, transactions)
-    propagate_receipts(w3, portal_inserter, block_fields, transactions)
+    if portal_inserter.was_block_offered(block_fields.hash):
+        # Already offered, maybe in an earlier run, so skip fetching and encoding
+        return
+
+    if content_store is not None:
+        stored_content = content_store.get_block_by_hash(block_fields.hash)
+        if stored_content is not None:
+            for content_key, content_value in stored_content:
+                portal_inserter.push_history(content_key, content_value)
+            return
+
+    decoded_block = DecodedBlock(block_fields)
+    header_content = propagate_header(w3, portal_inserter, decoded_block)
+
+    # Retrieve all uncles and receipts of the block in a single round-trip
+    owns_fetcher = fetcher is None
+    if owns_fetcher:
+        fetcher = BatchFetcher(w3)
+    try:
+        ((web3_uncles, web3_receipts),) = fetcher.get_uncles_and_receipts(
+            [block_fields]
+        )
+    finally:
+        if owns_fetcher:
+            fetcher.close()
+    BLOCKS_FETCHED.inc()
+
+    body_content = propagate_block_bodies(portal_inserter, decoded_block, web3_uncles)
+    receipts_content = propagate_receipts(portal_inserter, block_fields, web3_receipts)
+
+    if content_store is not None:
+        content_store.put_block(
+            block_fields.number,
+            block_fields.hash,
+            (header_content, body_content, receipts_content),
+        )
 
 
-def propagate_header(w3, portal_inserter: PortalInserter, block_fields):
+def propagate_header(w3, portal_inserter: PortalInserter, decoded_block: DecodedBlock):
     """
     Propagate the block header into Portal History Network.
 
     :param w3: web3 access to core Ethereum content
     :param portal_inserter: a class responsible for pushing content keys and
         values into the network via a group of running portal clients
-    :param block_fields: the web3 block fields for the header to propagate
+    :param decoded_block: the block whose header to propagate
+
+    :return: the (content_key, content_value) that was pushed
     """
     # Encode data for posting
-    content_key, content_value = block_fields_to_content(block_fields)
+    content_key, content_value = encode_header_content(decoded_block)
 
     # Post data to trin nodes
     portal_inserter.push_history(content_key, content_value)
+    return content_key, content_value
 
 
 def block_fields_to_content(block_fields) -> Tuple[bytes, bytes]:
@@ -76,53 +115,57 @@ def block_fields_to_content(block_fields) -> Tuple[bytes, bytes]:
     :raise ValidationError: if the rlp-encoded header does not match the header
         hash in `block_fields`
     """
-    header = block_fields_to_header(block_fields)
-    header_rlp = rlp.encode(header)
+    return encode_header_content(DecodedBlock(block_fields))
 
-    if keccak(header_rlp) != block_fields.hash:
-        raise ValidationError(
-            f"Could not correctly encode header fields {block_fields} to {header!r}"
-        )
 
-    if header.hash != block_fields.hash:
+@ENCODE_SECONDS.time(content_type="header")
+def encode_header_content(decoded_block: DecodedBlock) -> Tuple[bytes, bytes]:
+    """
+    Generate a Portal History Network content key and value for a block header.
+
+    :return: (content_key, content_value)
+
+    :raise ValidationError: if the rlp-encoded header does not match the header
+        hash of the block
+    """
+    header_rlp = decoded_block.header_rlp
+
+    # Hash the cached encoding, rather than py-evm's header.hash, which
+    #   would RLP-encode the whole header again
+    if keccak(header_rlp) != decoded_block.hash:
         raise ValidationError(
-            "py-evm generated a different hash than we did manually with"
-            f" header fields {block_fields} to {header!r}"
+            f"Could not correctly encode header fields {decoded_block.block_fields}"
+            f" to {decoded_block.header!r}"
         )
 
-    content_key = header_content_key(block_fields.hash)
+    content_key = header_content_key(decoded_block.hash)
     return content_key, header_rlp
 
 
 def propagate_block_bodies(
-    w3, portal_inserter: PortalInserter, block_fields, transactions
+    portal_inserter: PortalInserter, decoded_block: DecodedBlock, web3_uncles
 ):
     """
     Post block bodies to the Portal History Network.
 
-    :param w3: web3 access to core Ethereum content
     :param portal_inserter: a class responsible for pushing content keys and
         values into the network via a group of running portal clients
-    :param block_fields: the web3 block fields for the header to retrieve
-        transactions and uncles from
-    """
-    # Retrieve data to post to network
-    web3_uncles = [w3.eth.get_block(uncle) for uncle in block_fields.uncles]
+    :param decoded_block: the block that the body belongs to
+    :param web3_uncles: the web3 headers of the block's uncles
 
+    :return: the (content_key, content_value) that was pushed
+    """
     # Encode data for posting
-    content_key, content_value = _encode_block_body_content(
-        transactions,
-        web3_uncles,
-        block_fields.hash,
-        block_fields.number,
-        block_fields.transactionsRoot,
-        block_fields.sha3Uncles,
+    content_key, content_value = encode_decoded_block_body_content(
+        decoded_block, web3_uncles
     )
 
     # Post data to trin nodes
     portal_inserter.push_history(content_key, content_value)
+    return content_key, content_value
 
 
+@ENCODE_SECONDS.time(content_type="block_body")
 def encode_block_body_content(
     web3_transactions,
     web3_uncles,
@@ -142,35 +185,54 @@ def encode_block_body_content(
         header's `transactions_root` or `uncles_root` respectively
     """
     # Convert web3 transactions to py-evm transactions
-    transactions = [
-        web3_result_to_transaction(web3_transaction, block_number)
-        for web3_transaction in web3_transactions
-    ]
+    transactions = web3_results_to_transactions(web3_transactions, block_number)
+    encoded_transactions = [transaction.encode() for transaction in transactions]
 
     return _encode_block_body_content(
-        transactions,
+        encoded_transactions,
+        ordered_trie_root(encoded_transactions),
         web3_uncles,
         header_hash,
-        block_number,
         transactions_root,
         uncles_root,
     )
 
 
+@ENCODE_SECONDS.time(content_type="block_body")
+def encode_decoded_block_body_content(
+    decoded_block: DecodedBlock, web3_uncles
+) -> Tuple[bytes, bytes]:
+    """
+    Generate a Portal History Network content key and value for a block body.
+
+    Just like :func:`encode_block_body_content`, but reuses the transactions
+    that were already decoded and encoded in the block.
+
+    :return: (content_key, content_value)
+
+    :raise ValidationError: if the encoded transactions or uncles do not match the
+        header's `transactions_root` or `uncles_root` respectively
+    """
+    return _encode_block_body_content(
+        decoded_block.encoded_transactions,
+        decoded_block.transactions_root,
+        web3_uncles,
+        decoded_block.hash,
+        decoded_block.block_fields.transactionsRoot,
+        decoded_block.block_fields.sha3Uncles,
+    )
+
+
 def _encode_block_body_content(
-    transactions,
+    encoded_transactions,
+    calculated_transactions_root: hash,
     web3_uncles,
     header_hash: bytes,
-    block_number: int,
     transactions_root: hash,
     uncles_root: hash,
 ) -> Tuple[bytes, bytes]:
-    # Just like encode_block_body_content, but the transactions are already
-    # decoded from web3
-
     # Validate against the transactions root
-    calculated_transaction_root, _ = make_trie_root_and_nodes(transactions)
-    if calculated_transaction_root != transactions_root:
+    if calculated_transactions_root != transactions_root:
         raise ValidationError(
             f"Could not correctly encode transactions for header {header_hash.hex()}"
         )
@@ -187,36 +249,23 @@ def _encode_block_body_content(
         )
 
     content_key = block_body_content_key(header_hash)
-    content_value = block_body_content_value(transactions, encoded_uncles)
+    content_value = encoded_block_body_content_value(
+        encoded_transactions, encoded_uncles
+    )
     return content_key, content_value
 
 
-def propagate_receipts(w3, portal_inserter: PortalInserter, block_fields, transactions):
+def propagate_receipts(portal_inserter: PortalInserter, block_fields, web3_receipts):
     """
-    React to new header hash notification by posting receipts to Portal History Network.
+    Post receipts to the Portal History Network.
 
-    :param w3: web3 access to core Ethereum content
     :param portal_inserter: a class responsible for pushing content keys and
         values into the network via a group of running portal clients
-    :param block_fields: the web3 block fields for the header to retrieve receipts from
-    """
-    # Retrieve data to post to network
-    txn_hashes = [keccak(txn.encode()) for txn in transactions]
-
-    print("Collecting receipts to propagate...")
-    try:
-        web3_receipts = [
-            w3.eth.wait_for_transaction_receipt(txn_hash, poll_latency=2)
-            for txn_hash in txn_hashes
-        ]
-    except TimeExhausted:
-        print(
-            f"Transaction never appeared in block #{block_fields.number}: {block_fields.hash}"
-        )
-        raise
-
-    print("Collected receipts")
+    :param block_fields: the web3 block fields for the header the receipts belong to
+    :param web3_receipts: the web3 receipts of every transaction in the block
 
+    :return: the (content_key, content_value) that was pushed
+    """
     # Encode data for posting
     content_key, content_value = encode_receipts_content(
         web3_receipts,
@@ -227,8 +276,56 @@ def propagate_receipts(w3, portal_inserter: PortalInserter, block_fields, transa
 
     # Post data to trin nodes
     portal_inserter.push_history(content_key, content_value)
+    return content_key, content_value
+
+
+def encode_block_content(
+    block_fields, web3_uncles, web3_receipts
+) -> Tuple[Tuple[bytes, bytes], ...]:
+    """
+    Generate all Portal History Network content keys and values for a single block.
+
+    This is the pure-encoding counterpart to :func:`propagate_block`: all the
+    data must already be retrieved from the provider, and nothing is pushed.
+
+    :return: ((content_key, content_value), ...) for the header, block body and receipts
+
+    :raise ValidationError: if any encoded content does not match the header
+    """
+    decoded_block = DecodedBlock(block_fields)
+    header_content = encode_header_content(decoded_block)
+    body_content = encode_decoded_block_body_content(decoded_block, web3_uncles)
+    receipts_content = encode_receipts_content(
+        web3_receipts,
+        block_fields.hash,
+        block_fields.number,
+        block_fields.receiptsRoot,
+    )
+    return header_content, body_content, receipts_content
+
+
+def encode_raw_block_content(encoded_block: bytes):
+    """
+    Generate all Portal History Network content for a block fetched as raw JSON.
+
+    Takes and returns only plain bytes, so that it's cheap to run in another
+    process: see :meth:`~eth_portal.bridge.fetch.BatchFetcher.fetch_raw_blocks`.
+
+    The encode times are returned too, for the calling process to record
+    with ``ENCODE_SECONDS.observe_all()``, since metrics aren't served from
+    other processes.
+
+    :return: (header_hash, ((content_key, content_value), ...), encode_times)
+
+    :raise ValidationError: if any encoded content does not match the header
+    """
+    block_fields, web3_uncles, web3_receipts = parse_raw_block(encoded_block)
+    with ENCODE_SECONDS.capture() as encode_times:
+        content_items = encode_block_content(block_fields, web3_uncles, web3_receipts)
+    return bytes(block_fields.hash), content_items, encode_times
 
 
+@ENCODE_SECONDS.time(content_type="receipts")
 def encode_receipts_content(
     web3_receipts,
     header_hash: bytes,
@@ -243,18 +340,17 @@ def encode_receipts_content(
     :raise ValidationError: if the encoded receipts do not match the header's `receipt_root`
     """
     # Convert web3 receipts to py-evm receipts
-    receipts = [
-        receipt_fields_to_receipt(receipt, block_number) for receipt in web3_receipts
-    ]
+    receipts = receipts_fields_to_receipts(web3_receipts, block_number)
+    encoded_receipts = [receipt.encode() for receipt in receipts]
 
     # Validate against the receipt root
-    calculated_root, _ = make_trie_root_and_nodes(receipts)
+    calculated_root = ordered_trie_root(encoded_receipts)
     if calculated_root != receipt_root:
         # Keep a copy of the invalid receipts for later analysis
         bad_data_prefix = f"trin.badreceipts.{receipt_root.hex()}."
         with NamedTemporaryFile("w+t", prefix=bad_data_prefix, delete=False) as f:
-            for receipt in receipts:
-                f.write(receipt.encode().hex() + "\n")
+            for encoded_receipt in encoded_receipts:
+                f.write(encoded_receipt.hex() + "\n")
 
             invalid_receipts_filepath = f.name
 
@@ -264,5 +360,5 @@ def encode_receipts_content(
         )
 
     content_key = receipt_content_key(header_hash)
-    content_value = receipt_content_value(receipts)
+    content_value = encoded_receipt_content_value(encoded_receipts)
     return content_key, content_value
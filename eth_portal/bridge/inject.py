@@ -1,73 +1,269 @@
 import binascii
+import glob
+from itertools import chain
+import os
 from pathlib import Path
 import time
 
-from eth_utils import ValidationError, to_bytes, to_tuple
+from eth_utils import ValidationError, to_bytes
+
+from .archive import ARCHIVE_SUFFIX, ContentArchive, is_archive_path
+from .metrics import DEAD_LETTERS, RETRY_QUEUE_DEPTH
+from .offered import MINIMUM_OTHER_PEERS_OFFERED
+from .retry import RetryScheduler
 
-MINIMUM_OTHER_PEERS_OFFERED = 3
 SECONDS_TO_FIND_MORE_PEERS = 10
-# TODO make issue to supply directories in addition to files
+
+# Where to record the content items that never reached enough peers
+DEFAULT_DEAD_LETTER_PATH = "portal-injection.deadletter"
+
+CONTENT_FILE_SUFFIXES = (".portalcontent", ARCHIVE_SUFFIX)
+
+# How often to report progress while injecting, in number of items
+_PROGRESS_INTERVAL = 10000
 
 
-@to_tuple
 def parse_content_keys(content_files):
+    """
+    Validate the supplied content paths, and find the content key of each item.
+
+    Each path is a file, a directory, or a glob pattern. Directories are
+    searched recursively, for any content files inside. Each file is either a
+    single ``.portalcontent`` item, or a packed ``.portalarchive`` of many items.
+
+    This is a generator: directories and globs are only walked as the items
+    are consumed, so injection can start right away, and memory use stays
+    flat, even for millions of files.
+
+    :return: a (content_key, Path) for each content item. Items in an archive
+        all share the archive's path.
+
+    :raise ValidationError: when reaching any supplied path that is missing,
+        or that isn't a content file
+    """
+    for path in iter_content_paths(content_files):
+        if is_archive_path(path):
+            yield from _parse_archive_keys(path)
+        else:
+            yield _parse_file_key(path)
+
+
+def iter_content_paths(content_files):
+    """
+    Lazily expand the supplied files, directories and globs into content file paths.
+
+    Inside directories, only files with a content file suffix are included,
+    so that unrelated files and partially-written exports are skipped.
+
+    A recursive ``**`` glob already descends into every directory it matches,
+    so those directories aren't walked again, which would yield their files
+    twice. Like a walked directory, only the content files it matches are
+    included.
+    """
     for str_path in content_files:
         path = Path(str_path)
-        if not path.exists():
+        if path.exists():
+            yield from _expand_path(path)
+        elif _is_glob(str(str_path)):
+            matches = glob.iglob(str(str_path), recursive=True)
+            first_match = next(matches, None)
+            if first_match is None:
+                raise ValidationError(f"Supplied glob {str_path!r} matches no files")
+
+            is_recursive = "**" in str(str_path)
+            for match in chain((first_match,), matches):
+                match_path = Path(match)
+                if not is_recursive:
+                    yield from _expand_path(match_path)
+                elif _is_content_file(match_path):
+                    yield match_path
+        else:
             raise ValidationError(f"Supplied file {path!r} does not exist")
-        if not path.is_file():
-            raise ValidationError(
-                f"Supplied path {path!r} does not point to a file (is it a directory?)"
-            )
-        if path.suffix != ".portalcontent":
-            raise ValidationError(
-                f"Supplied files must end in .portalcontent, unlike: {path!r}"
-            )
-        try:
-            content_key = to_bytes(hexstr=path.stem)
-        except binascii.Error:
-            raise ValidationError(
-                f"File names must be in a hex-encoded format, unlike: {path!r}"
-            )
-
-        yield content_key, path
-
-
-@to_tuple
-def attempt_inject_all(portal_inserter, parsed_paths):
+
+
+def _is_glob(str_path):
+    return any(char in str_path for char in "*?[")
+
+
+def _is_content_file(path):
+    return path.name.endswith(CONTENT_FILE_SUFFIXES) and path.is_file()
+
+
+def _expand_path(path):
+    if path.is_dir():
+        yield from _walk_content_files(path)
+    elif path.is_file():
+        yield path
+    else:
+        raise ValidationError(
+            f"Supplied path {path!r} is not a regular file or directory"
+        )
+
+
+def _walk_content_files(root):
     """
-    Inject all the content items, returning any that do not offer to enough peers.
+    Yield every content file under the directory, recursively, using os.scandir.
+
+    Entries are yielded in directory order, without sorting, so that a
+    directory with millions of files never has to be listed in full.
+    """
+    pending_dirs = [root]
+    while pending_dirs:
+        with os.scandir(pending_dirs.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    pending_dirs.append(Path(entry.path))
+                elif entry.name.endswith(CONTENT_FILE_SUFFIXES) and entry.is_file():
+                    yield Path(entry.path)
+
+
+def _parse_archive_keys(path):
+    try:
+        with ContentArchive(path) as archive:
+            for content_key in archive.keys():
+                yield content_key, path
+    except ValueError as exc:
+        raise ValidationError(str(exc)) from exc
 
-    Note that trin is currently returning the number of peers offered (not
-    accepted), and ignores whether that content was previously offered. So on
-    multiple attempts to call this method, the result can be considered a
-    cumulative count of how many peers were offered.
 
-    This method returns if the *most connected* bridge client doesn't offer to
-    enough peers. It ignores any lesser-connected bridge clients, which may be
-    offering to duplicate peers of the most-connected client.
+def _parse_file_key(path):
+    if path.suffix != ".portalcontent":
+        raise ValidationError(
+            "Supplied files must end in .portalcontent or .portalarchive,"
+            f" unlike: {path!r}"
+        )
+    try:
+        content_key = to_bytes(hexstr=path.stem)
+    except binascii.Error:
+        raise ValidationError(
+            f"File names must be in a hex-encoded format, unlike: {path!r}"
+        )
 
-    :param content_paths: a list of (content_key, Path) content items to inject to network
+    return content_key, path
 
-    :return: a tuple of content_paths that too few peers were interested in
+
+def inject_content(
+    portal_inserter,
+    content_files,
+    dead_letter_path=DEFAULT_DEAD_LETTER_PATH,
+    scheduler=None,
+    sleep=time.sleep,
+):
     """
-    print(f"Injecting {len(parsed_paths)} items")
-    for content_key, path in parsed_paths:
+    Inject all the content items, retrying any that too few peers were offered.
+
+    Each item that doesn't reach enough peers is retried later, with an
+    exponentially growing delay, see :class:`~eth_portal.bridge.retry.RetryScheduler`.
+    Retries are mixed in with the fresh content as they come due, so one
+    item that's hard to place doesn't hold up the rest.
+
+    Items that run out of attempts are given up on, and appended to the
+    dead letter file as they fail, one per line, as the hex-encoded content
+    key and the path of the file that holds it. The file is only created if
+    any item fails.
+
+    :param content_files: the content files, directories and globs to inject
+    :param dead_letter_path: the file to record failed items in
+    :param scheduler: the :class:`~eth_portal.bridge.retry.RetryScheduler` to
+        pace retries with, or None for the default
+    :param sleep: how to wait for the next retry, when nothing else is ready
+    """
+    if scheduler is None:
+        scheduler = RetryScheduler(base_delay=SECONDS_TO_FIND_MORE_PEERS)
+
+    fresh_items = parse_content_keys(content_files)
+    archives = {}
+    num_pushed = num_dead = 0
+    try:
+        with _DeadLetterLog(dead_letter_path) as dead_letters:
+            while True:
+                due_retry = scheduler.pop_due()
+                if due_retry is not None:
+                    content_item, attempts = due_retry
+                else:
+                    content_item = next(fresh_items, None)
+                    attempts = 0
+
+                if content_item is None:
+                    # All fresh content is pushed, so wait for the next retry
+                    wait_seconds = scheduler.seconds_until_due()
+                    if wait_seconds is None:
+                        break
+                    print(
+                        f"Too few peers were interested in {len(scheduler)} items,"
+                        f" retrying the next in {wait_seconds:.1f} seconds..."
+                    )
+                    sleep(wait_seconds)
+                    continue
+
+                if not _push_item(portal_inserter, content_item, archives):
+                    if not scheduler.schedule(content_item, attempts + 1):
+                        dead_letters.append(*content_item)
+                        DEAD_LETTERS.inc()
+                        num_dead += 1
+                RETRY_QUEUE_DEPTH.set(len(scheduler))
+
+                num_pushed += 1
+                if num_pushed % _PROGRESS_INTERVAL == 0:
+                    print(
+                        f"Injected {num_pushed} items so far, {len(scheduler)}"
+                        " waiting for a retry"
+                    )
+    finally:
+        for archive in archives.values():
+            archive.close()
+
+    if num_dead:
+        print(
+            f"Gave up on {num_dead} items that too few peers were interested in,"
+            f" listed in {dead_letter_path}"
+        )
+    else:
+        print("Successfully injected all content items")
+
+
+def _push_item(portal_inserter, content_item, archives):
+    """
+    Offer a content item to the network.
+
+    :return: whether the most connected bridge client offered it to enough peers
+    """
+    content_key, path = content_item
+    if is_archive_path(path):
+        if path not in archives:
+            archives[path] = ContentArchive(path)
+
+        # Sliced straight out of the memory-mapped archive, without a copy
+        with archives[path].get(content_key) as content_value:
+            peer_offers = portal_inserter.push_history(content_key, content_value)
+    else:
         content_value = path.read_bytes()
         peer_offers = portal_inserter.push_history(content_key, content_value)
-        if max(peer_offers) < MINIMUM_OTHER_PEERS_OFFERED:
-            yield content_key, path
 
+    return max(peer_offers) >= MINIMUM_OTHER_PEERS_OFFERED
+
+
+class _DeadLetterLog:
+    """
+    Append the content items that couldn't be injected to a file, opened on first use.
+
+    Each item is flushed as it's added, so the log is complete even if the
+    injector is interrupted.
+    """
 
-def inject_content(portal_inserter, content_files):
-    parsed_paths = parse_content_keys(content_files)
+    def __init__(self, path):
+        self._path = Path(path)
+        self._file = None
 
-    failed_paths = attempt_inject_all(portal_inserter, parsed_paths)
+    def append(self, content_key, path):
+        if self._file is None:
+            self._file = open(self._path, "a")
+        self._file.write(f"{content_key.hex()} {path}\n")
+        self._file.flush()
 
-    while len(failed_paths):
-        print(f"Too few peers were interested in {len(failed_paths)} items")
-        print(f"Retrying in {SECONDS_TO_FIND_MORE_PEERS} seconds...")
-        time.sleep(SECONDS_TO_FIND_MORE_PEERS)
-        failed_paths = attempt_inject_all(portal_inserter, failed_paths)
+    def __enter__(self):
+        return self
 
-    print(f"Successfully injected all {len(parsed_paths)} content items")
+    def __exit__(self, *exc_info):
+        if self._file is not None:
+            self._file.close()
@@ -1,14 +1,47 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import logging
+import threading
 import time
 
-from eth_utils import encode_hex, to_tuple
+from eth_utils import encode_hex
+from web3.exceptions import TimeExhausted
+
+from eth_portal.ipc import EncodedHex, PipelinedIPCProvider
+
+from .adaptive import NodeOfferLimiter
+from .metrics import ITEMS_PUSHED, OFFER_PEERS, OFFER_SECONDS, OFFERS, OFFERS_SKIPPED
+from .routing import NodeIdIndex, content_id
+from .store import block_content_keys
+
+# How long to wait for each portal client to respond to an offer, in seconds
+DEFAULT_OFFER_TIMEOUT = 30
+
+# How long each portal client's provider waits for a response, in seconds.
+#   Longer than the offer timeout, so that a slow offer is counted as timed
+#   out by the push, while it keeps its node's slot until the node answers.
+OFFER_REQUEST_TIMEOUT = 2 * DEFAULT_OFFER_TIMEOUT
+
+# Log a summary of the pushed content, after this many items
+DEFAULT_LOG_SAMPLE_INTERVAL = 1000
+
+# Log a warning about any item that takes longer than this to push, in seconds
+DEFAULT_SLOW_PUSH_SECONDS = 5
+
+logger = logging.getLogger(__name__)
 
 
 # TODO: add a portal formatter to upstream Web3 and then delete this method
-def _parse_number_clients_contacted(response):
+def _parse_number_clients_contacted(response, node_id):
     if "result" in response:
+        OFFERS.inc(outcome="accepted")
+        OFFER_PEERS.observe(response["result"])
         return response["result"]
     else:
-        print("json response to history offer was an error: {json_response!r}")
+        OFFERS.inc(outcome="error")
+        logger.warning(
+            "History offer returned an error",
+            extra={"node_id": node_id, "response": response},
+        )
         return 0
 
 
@@ -16,72 +49,322 @@ class PortalInserter:
     """
     Track a group of Portal nodes, and simplify pushing content to them.
 
-    Eventually, it will intelligently choose which nodes to broadcast content
-    to. At documentation time, it naively pushes all content to all supplied nodes.
-    """
+    By default, it naively pushes all content to all supplied nodes. When
+    routing is enabled, each item is only offered to the k nodes whose IDs
+    are closest to the item's content ID.
+
+    How many offers each node may have in flight adapts to how its offers
+    turn out, and nodes that are saturated or isolated are drained for a
+    while. See :class:`~eth_portal.bridge.adaptive.NodeOfferLimiter`.
 
-    MAX_FIELD_DISPLAY_LENGTH = 2048
+    With an offer index, content is never offered again through a node that
+    already offered it to enough peers, even in an earlier run.
 
-    def __init__(self, web3_links):
+    Every offer is logged at debug level, with its timing. At info level,
+    only a summary is logged every so often, along with warnings about slow
+    or failed offers. Content values are never logged.
+    """
+
+    def __init__(
+        self,
+        web3_links,
+        offer_timeout=DEFAULT_OFFER_TIMEOUT,
+        node_ids=None,
+        route_k=None,
+        log_sample_interval=DEFAULT_LOG_SAMPLE_INTERVAL,
+        slow_push_seconds=DEFAULT_SLOW_PUSH_SECONDS,
+        offer_limiter=None,
+        offer_index=None,
+    ):
         """
         Create an instance, with web3 links to the launched Portal nodes.
+
+        :param offer_timeout: how many seconds to wait for each node to respond
+            to an offer, before counting it as having reached no peers
+        :param node_ids: the node ID of each launched node, in the same order as
+            `web3_links`. Required for routing.
+        :param route_k: if supplied, only offer each item to this many nodes,
+            choosing the nodes closest to the content ID by XOR distance
+        :param log_sample_interval: log a summary after pushing this many items
+        :param slow_push_seconds: log a warning about any item that takes
+            longer than this to push
+        :param offer_limiter: a :class:`NodeOfferLimiter` for the nodes, to
+            replace the default one
+        :param offer_index: if supplied, an
+            :class:`~eth_portal.bridge.offered.OfferIndex` to skip content that
+            nodes already offered, and to record new offers in
         """
         self._web3_links = web3_links
+        self._offer_timeout = offer_timeout
+
+        if route_k is None:
+            self._node_index = None
+        elif node_ids is None or len(node_ids) != len(web3_links):
+            raise ValueError("Must supply a node ID for every node, to route content")
+        else:
+            self._node_index = NodeIdIndex(node_ids)
+        self._route_k = route_k
+
+        self._node_labels = [_w3_ipc_to_id(w3) for w3 in web3_links]
+        if offer_limiter is None:
+            offer_limiter = NodeOfferLimiter(self._node_labels)
+        self._limiter = offer_limiter
+        self._offer_index = offer_index
+
+        # Enough threads for every node to have as many offers in flight as allowed
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(offer_limiter.max_in_flight, 1),
+            thread_name_prefix="portal-offer",
+        )
+
+        self._log_sample_interval = log_sample_interval
+        self._slow_push_seconds = slow_push_seconds
+
+        # Content may be pushed from several threads, so guard the counters
+        self._stats_lock = threading.Lock()
+        self._num_pushed = 0
+        self._window = _PushStats()
+
+    def shutdown(self):
+        """
+        Stop the threads used to offer content, after any pending offers finish.
+        """
+        self._executor.shutdown()
 
-    @to_tuple
     def push_history(self, content_key: bytes, content_value: bytes):
         """
         Push the given Portal History content out to the group of portal clients.
 
-        :return: a list of how many peers were contacted with the content, with
+        The content value may be any bytes-like object, like a memoryview.
+        It's hex-encoded once, and the encoding is shared by the offers to
+        every client.
+
+        Content is offered to all selected clients concurrently, once each of
+        them has room for another offer in flight. Drained clients are skipped,
+        unless all the selected clients are drained. If a client doesn't
+        respond within the offer timeout, or the offer fails, it is counted as
+        contacting 0 peers.
+
+        Clients that already offered the content, according to the offer
+        index, are skipped, and counted as contacting the peers that they did then.
+
+        :return: a tuple of how many peers were contacted with the content, with
             an entry for each local client that the history was pushed to.
         """
         content_key_hex = encode_hex(content_key)
-        content_value_hex = encode_hex(content_value)
+        content_value_hex = EncodedHex(content_value)
+
+        targets = self._select_nodes(content_key)
+        already_offered = self._already_offered(content_key, targets)
+        if len(already_offered) == len(targets):
+            OFFERS_SKIPPED.inc(len(targets))
+            return tuple(already_offered[idx] for idx in targets)
+
+        to_offer = [idx for idx in targets if idx not in already_offered]
+        OFFERS_SKIPPED.inc(len(already_offered))
+        started = self._limiter.acquire(to_offer)
+        start = time.monotonic()
+        offers = [
+            self._executor.submit(
+                self._offer_and_release,
+                idx,
+                started,
+                content_key_hex,
+                content_value_hex,
+            )
+            for idx in to_offer
+        ]
+
+        # All offers start at the same time, so they share a single deadline
+        deadline = start + self._offer_timeout
+        peer_counts = dict(already_offered)
+        for idx, offer in zip(to_offer, offers):
+            node_id = self._node_labels[idx]
+            try:
+                result = offer.result(timeout=max(deadline - time.monotonic(), 0))
+            except TimeoutError:
+                OFFERS.inc(outcome="timeout")
+                logger.warning(
+                    "Timed out offering history item",
+                    extra={
+                        "content_key": content_key_hex,
+                        "node_id": node_id,
+                        "timeout": self._offer_timeout,
+                    },
+                )
+                peer_counts[idx] = 0
+            except (TimeExhausted, OSError) as exc:
+                # The node stopped responding, or went away, maybe to restart
+                OFFERS.inc(outcome="error")
+                logger.warning(
+                    "Failed offering history item",
+                    extra={
+                        "content_key": content_key_hex,
+                        "node_id": node_id,
+                        "error": repr(exc),
+                    },
+                )
+                peer_counts[idx] = 0
+            else:
+                offer_seconds = time.monotonic() - start
+                OFFER_SECONDS.observe(offer_seconds, node_id=node_id)
+                num_peers = _parse_number_clients_contacted(result, node_id)
+                logger.debug(
+                    "Offered history item",
+                    extra={
+                        "content_key": content_key_hex,
+                        "node_id": node_id,
+                        "peers": num_peers,
+                        "seconds": round(offer_seconds, 4),
+                    },
+                )
+                peer_counts[idx] = num_peers
+                if self._offer_index is not None:
+                    self._offer_index.record(content_key, node_id, num_peers)
+
+        peer_counts = tuple(peer_counts[idx] for idx in targets)
+        self._record_push(
+            content_key_hex, len(content_value), time.monotonic() - start, peer_counts
+        )
+        return peer_counts
+
+    def was_offered(self, content_key: bytes) -> bool:
+        """
+        Check whether every node that the content goes to already offered it.
 
-        value_len = len(content_value_hex)
-        if value_len > self.MAX_FIELD_DISPLAY_LENGTH:
-            value_suffix = f"... ({value_len-self.MAX_FIELD_DISPLAY_LENGTH} more)"
+        Always False without an offer index.
+        """
+        if self._offer_index is None:
+            return False
+        else:
+            targets = self._route(content_key)
+            return len(self._already_offered(content_key, targets)) == len(targets)
+
+    def was_block_offered(self, header_hash: bytes) -> bool:
+        """
+        Check whether all the content of a block was already offered.
+
+        If so, the block needn't even be encoded. Always False without an
+        offer index.
+        """
+        return all(
+            self.was_offered(content_key)
+            for content_key in block_content_keys(header_hash)
+        )
+
+    def _record_push(self, content_key_hex, value_bytes, seconds, peer_counts):
+        """
+        Count a pushed item, and log it if it's an outlier, or due for a summary.
+        """
+        fields = {
+            "content_key": content_key_hex,
+            "value_bytes": value_bytes,
+            "seconds": round(seconds, 4),
+            "max_peers": max(peer_counts, default=0),
+        }
+        if seconds > self._slow_push_seconds:
+            logger.warning("Slow push of history item", extra=fields)
         else:
-            value_suffix = ""
+            logger.debug("Pushed history item", extra=fields)
+
+        ITEMS_PUSHED.inc()
+        with self._stats_lock:
+            self._num_pushed += 1
+            self._window.add(value_bytes, seconds)
+            if self._num_pushed % self._log_sample_interval:
+                return
+            window, self._window = self._window, _PushStats()
+            num_pushed = self._num_pushed
 
-        print(
-            "Propagate new history content with key, value:",
-            content_key_hex,
-            ",",
-            content_value_hex[: self.MAX_FIELD_DISPLAY_LENGTH] + value_suffix,
+        logger.info(
+            "Pushed history items",
+            extra={
+                "total_items": num_pushed,
+                "items": window.num_items,
+                "bytes": window.num_bytes,
+                "mean_seconds": round(window.total_seconds / window.num_items, 4),
+                "max_seconds": round(window.max_seconds, 4),
+            },
         )
 
-        # For now, just push to all inserting clients. When running more, be a
-        #   bit smarter about selecting inserters closer to the content key
-        for w3 in self._web3_links:
-            result = self.offer_hex_content(w3, content_key_hex, content_value_hex)
-            node_id = _w3_ipc_to_id(w3)
-            print("Sent history item to", node_id, "response:", result)
-            yield _parse_number_clients_contacted(result)
+    def _select_nodes(self, content_key: bytes):
+        """
+        Choose the positions of the launched nodes to offer the content to.
+        """
+        if self._node_index is None:
+            return self._limiter.available(self._route(content_key))
+        else:
+            # Look past any drained nodes, to still offer to k nodes
+            num_nodes = self._route_k + self._limiter.num_drained
+            closest = self._node_index.closest(content_id(content_key), num_nodes)
+            return self._limiter.available(closest)[: self._route_k]
+
+    def _route(self, content_key: bytes):
+        """
+        Choose the positions of the nodes that the content belongs with, drained or not.
+        """
+        if self._node_index is None:
+            return range(len(self._web3_links))
+        else:
+            return self._node_index.closest(content_id(content_key), self._route_k)
+
+    def _already_offered(self, content_key: bytes, targets):
+        """
+        Find which of the target nodes already offered the content.
+
+        :return: how many peers each node offered the content to, by the
+            node's position, for only the nodes that did
+        """
+        if self._offer_index is None:
+            return {}
+
+        labels = {self._node_labels[idx]: idx for idx in targets}
+        offered = self._offer_index.offered_peers(content_key, labels)
+        return {labels[label]: num_peers for label, num_peers in offered.items()}
+
+    def _offer_and_release(self, idx, started, content_key_hex, content_value_hex):
+        """
+        Offer content to one node, then tell the limiter how the offer went.
+        """
+        offer_start = time.monotonic()
+        response = None
+        try:
+            response = self.offer_hex_content(
+                self._web3_links[idx], content_key_hex, content_value_hex
+            )
+            return response
+        finally:
+            num_peers = None if response is None else response.get("result")
+            self._limiter.release(
+                idx, started, time.monotonic() - offer_start, num_peers
+            )
 
     @staticmethod
     def offer_hex_content(w3, key, val):
-        try:
-            return w3.provider.make_request("portal_historyOffer", [key, val])
-        except FileNotFoundError:
-            # Retry if we just tried to hit the portal client too fast
-            for num_polls in range(100):
-                if w3.isConnected():
-                    break
-                else:
-                    if num_polls % 10 == 9:
-                        print(
-                            "Portal client is unavailable. Perhaps it is not done booting."
-                            " Retrying shortly..."
-                        )
-                    time.sleep(0.1)
-            else:
-                raise RuntimeError(
-                    "Portal client appears to be permanently unavailable"
-                )
+        if not isinstance(w3.provider, PipelinedIPCProvider):
+            # Other providers need the value as a plain string
+            val = str(val)
+
+        # The node was already waited on until ready, when it was launched
+        return w3.provider.make_request("portal_historyOffer", [key, val])
+
+
+class _PushStats:
+    """
+    Counters for the items pushed since the last summary was logged.
+    """
+
+    def __init__(self):
+        self.num_items = 0
+        self.num_bytes = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
 
-            return w3.provider.make_request("portal_historyOffer", [key, val])
+    def add(self, value_bytes, seconds):
+        self.num_items += 1
+        self.num_bytes += value_bytes
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
 
 
 def _w3_ipc_to_id(w3):
@@ -0,0 +1,113 @@
+import copy
+import json
+import logging
+from logging.handlers import QueueHandler, QueueListener
+import queue
+import sys
+
+# Every log record has these attributes, so any others were passed with ``extra``
+_STANDARD_ATTRIBUTES = frozenset(vars(logging.makeLogRecord({}))) | {
+    "message",
+    "asctime",
+}
+
+# Formats tracebacks before records are queued, separately from any output format
+_TRACEBACK_FORMATTER = logging.Formatter()
+
+
+def start_queued_logging(level="INFO", json_format=False, stream=None):
+    """
+    Send all log records through a queue, to be written by a background thread.
+
+    Logging calls only format the message and put the record on the queue, so
+    slow output, like a terminal or a log shipper, never holds up the caller.
+
+    :param level: the lowest level of records to write
+    :param json_format: write each record as a line of JSON, instead of text
+    :param stream: where to write the records, defaulting to stderr
+
+    :return: the running :class:`~logging.handlers.QueueListener`. Stop it
+        before exiting, to write any records still in the queue.
+    """
+    output_handler = logging.StreamHandler(stream or sys.stderr)
+    if json_format:
+        output_handler.setFormatter(JSONFormatter())
+    else:
+        output_handler.setFormatter(
+            FieldsFormatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+        )
+
+    log_queue = queue.Queue()
+    root_logger = logging.getLogger()
+    root_logger.addHandler(_TracebackQueueHandler(log_queue))
+    root_logger.setLevel(level)
+
+    listener = QueueListener(log_queue, output_handler)
+    listener.start()
+    return listener
+
+
+def log_fields(record: logging.LogRecord) -> dict:
+    """
+    Get the structured fields that were passed to a logging call with ``extra``.
+    """
+    return {
+        key: value
+        for key, value in vars(record).items()
+        if key not in _STANDARD_ATTRIBUTES
+    }
+
+
+class _TracebackQueueHandler(QueueHandler):
+    """
+    Queue records with any traceback kept apart from the message, as ``exc_text``.
+
+    The standard handler merges the traceback into the message, and drops the
+    exception, so a JSON formatter can't tell them apart anymore.
+    """
+
+    def prepare(self, record):
+        # Like the standard handler, resolve everything that might not be
+        #   safe to read from another thread, like the message args
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _TRACEBACK_FORMATTER.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class FieldsFormatter(logging.Formatter):
+    """
+    Format a record as text, followed by a key=value pair for each structured field.
+    """
+
+    def formatMessage(self, record):
+        # Any traceback is added after this, so the fields stay on the first line
+        line = super().formatMessage(record)
+        fields = log_fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    Format a record as a single line of JSON, with its structured fields at the top level.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(log_fields(record))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # The traceback was already formatted, before the record was queued
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
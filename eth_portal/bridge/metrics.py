@@ -0,0 +1,330 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import math
+import threading
+import time
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+# Upper bounds of the histogram buckets for durations, in seconds
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Upper bounds of the histogram buckets for how many peers were offered content
+PEER_COUNT_BUCKETS = (0, 1, 2, 3, 4, 6, 8, 12, 16, 24, 32)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str]):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def _label_values(self, labels) -> Tuple[str, ...]:
+        if set(labels) != set(self.label_names):
+            raise ValueError(
+                f"Metric {self.name} needs labels {self.label_names}, not {tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def _format_labels(self, label_values, **extra_labels) -> str:
+        pairs = list(zip(self.label_names, label_values)) + list(extra_labels.items())
+        if not pairs:
+            return ""
+        else:
+            return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        with self._lock:
+            yield from self._render_samples()
+
+
+class Counter(_Metric):
+    """
+    A total that only goes up, like the number of blocks fetched.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, label_names=()):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        label_values = self._label_values(labels)
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._label_values(labels), 0)
+
+    def _render_samples(self):
+        for label_values, value in self._values.items():
+            yield f"{self.name}{self._format_labels(label_values)} {_number(value)}"
+
+
+class Gauge(_Metric):
+    """
+    A value that goes up and down, like the length of a queue.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, label_names=()):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels) -> None:
+        label_values = self._label_values(labels)
+        with self._lock:
+            self._values[label_values] = value
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._label_values(labels), 0)
+
+    def _render_samples(self):
+        for label_values, value in self._values.items():
+            yield f"{self.name}{self._format_labels(label_values)} {_number(value)}"
+
+
+class Histogram(_Metric):
+    """
+    Count observations into buckets, like how long each offer took.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, label_names=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+        # For each combination of labels: (count per bucket, sum, count)
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+        # Observations collected by each thread, while inside capture()
+        self._captured = threading.local()
+
+    def observe(self, value: float, **labels) -> None:
+        label_values = self._label_values(labels)
+        captured = getattr(self._captured, "observations", None)
+        if captured is not None:
+            captured.append((value, labels))
+
+        # Buckets are inclusive of their upper bound
+        bucket_idx = bisect_left(self.buckets, value)
+        with self._lock:
+            if label_values not in self._values:
+                self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            bucket_counts, _, _ = entry = self._values[label_values]
+            bucket_counts[bucket_idx] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Observe how many seconds the context takes to run.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    @contextmanager
+    def capture(self):
+        """
+        Collect every observation that this thread makes in the context, as well as recording it.
+
+        Metrics are only served from the main process, so observations made in
+        a worker process are lost, unless they are sent back and passed to
+        :meth:`observe_all` there.
+
+        :return: a list that the (value, labels) of each observation are added to
+        """
+        previous = getattr(self._captured, "observations", None)
+        observations: List[Tuple[float, Dict[str, str]]] = []
+        self._captured.observations = observations
+        try:
+            yield observations
+        finally:
+            self._captured.observations = previous
+
+    def observe_all(self, observations: Iterable[Tuple[float, Dict[str, str]]]):
+        """
+        Record observations that were collected by :meth:`capture`.
+        """
+        for value, labels in observations:
+            self.observe(value, **labels)
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            entry = self._values.get(self._label_values(labels))
+            return 0 if entry is None else entry[2]
+
+    def _render_samples(self):
+        for label_values, (bucket_counts, total, count) in self._values.items():
+            cumulative = 0
+            for upper_bound, bucket_count in zip(
+                self.buckets + (math.inf,), bucket_counts
+            ):
+                cumulative += bucket_count
+                labels = self._format_labels(label_values, le=_number(upper_bound))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+
+            labels = self._format_labels(label_values)
+            yield f"{self.name}_sum{labels} {_number(total)}"
+            yield f"{self.name}_count{labels} {count}"
+
+
+class MetricsRegistry:
+    """
+    A collection of metrics, to render all together.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def counter(self, name, documentation, label_names=()) -> Counter:
+        return self._register(Counter(name, documentation, label_names))
+
+    def gauge(self, name, documentation, label_names=()) -> Gauge:
+        return self._register(Gauge(name, documentation, label_names))
+
+    def histogram(
+        self, name, documentation, label_names=(), buckets=DURATION_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, label_names, buckets))
+
+    def render(self) -> str:
+        """
+        Render every metric, in the Prometheus text exposition format.
+        """
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+
+def serve_metrics(registry: MetricsRegistry, port: int, host: str = "127.0.0.1"):
+    """
+    Serve the metrics at ``/metrics`` on the port, from a background thread.
+
+    Metrics are rendered in the Prometheus text format. Rates, like blocks
+    fetched or offers made per second, are left to Prometheus to calculate
+    from the counters, with ``rate()``.
+
+    :return: the running server. Call ``shutdown()`` on it to stop serving.
+    """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            # Don't print a line for every scrape
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(
+        target=server.serve_forever, name="metrics-server", daemon=True
+    )
+    thread.start()
+    return server
+
+
+def _escape(label_value: str) -> str:
+    return label_value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value) -> str:
+    if value == math.inf:
+        return "+Inf"
+    elif float(value).is_integer():
+        return str(int(value))
+    else:
+        return repr(float(value))
+
+
+# The metrics of the bridge, which are all served together
+REGISTRY = MetricsRegistry()
+
+BLOCKS_FETCHED = REGISTRY.counter(
+    "portal_bridge_blocks_fetched_total",
+    "Blocks fetched from the provider",
+)
+ENCODE_SECONDS = REGISTRY.histogram(
+    "portal_bridge_encode_seconds",
+    "Time to encode and validate each content item, by content type",
+    ("content_type",),
+)
+ITEMS_PUSHED = REGISTRY.counter(
+    "portal_bridge_items_pushed_total",
+    "Content items pushed to the launched nodes",
+)
+OFFERS = REGISTRY.counter(
+    "portal_bridge_offers_total",
+    "Offers of content to launched nodes, by outcome",
+    ("outcome",),
+)
+OFFER_SECONDS = REGISTRY.histogram(
+    "portal_bridge_offer_seconds",
+    "Time for a launched node to respond to an offer, by node ID",
+    ("node_id",),
+)
+OFFER_PEERS = REGISTRY.histogram(
+    "portal_bridge_offer_peers",
+    "How many peers a launched node offered each content item to",
+    buckets=PEER_COUNT_BUCKETS,
+)
+OFFERS_SKIPPED = REGISTRY.counter(
+    "portal_bridge_offers_skipped_total",
+    "Offers skipped, because the launched node already offered the content before",
+)
+RETRY_QUEUE_DEPTH = REGISTRY.gauge(
+    "portal_bridge_retry_queue_depth",
+    "Injected content items waiting for a retry",
+)
+DEAD_LETTERS = REGISTRY.counter(
+    "portal_bridge_dead_letters_total",
+    "Injected content items given up on, after running out of retries",
+)
+HEAD_LAG_SECONDS = REGISTRY.gauge(
+    "portal_bridge_head_lag_seconds",
+    "Seconds from the latest published head's timestamp until it was published",
+)
+HEAD_PUBLISH_SECONDS = REGISTRY.histogram(
+    "portal_bridge_head_publish_seconds",
+    "Time from first seeing each head until all its content was published",
+)
+OFFER_LIMIT = REGISTRY.gauge(
+    "portal_bridge_offer_limit",
+    "How many offers each launched node may have in flight, by node ID",
+    ("node_id",),
+)
+NODES_DRAINED = REGISTRY.gauge(
+    "portal_bridge_nodes_drained",
+    "Launched nodes that are offered nothing for now, for being saturated or isolated",
+)
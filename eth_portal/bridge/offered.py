@@ -0,0 +1,222 @@
+import hashlib
+import math
+from pathlib import Path
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable
+
+# The fewest peers that a node must offer content to, for the offer to count
+MINIMUM_OTHER_PEERS_OFFERED = 3
+
+# The Bloom filter is sized for at least this many offers, and twice as many
+#   as are already in the index when it's opened
+DEFAULT_FILTER_CAPACITY = 2**20
+
+# The chance that the filter reports an offer that isn't in the index, which
+#   costs a lookup on disk, rather than a wrong answer
+DEFAULT_FALSE_POSITIVE_RATE = 0.01
+
+# Offers are flushed to disk after this many seconds, so that a crash loses
+#   at most a few seconds of records, without paying for a disk sync on every offer
+_COMMIT_INTERVAL_SECONDS = 2
+
+
+class BloomFilter:
+    """
+    A compact, approximate set of byte strings, with no false negatives.
+
+    Each item sets a few bits, chosen by double hashing a single digest of it.
+    """
+
+    def __init__(self, capacity: int, false_positive_rate: float):
+        """
+        Size the filter to stay under the false positive rate, up to the capacity.
+
+        :param capacity: how many items the filter is expected to hold
+        :param false_positive_rate: the chance, at capacity, that an item
+            which wasn't added is reported as being in the filter
+        """
+        capacity = max(capacity, 1)
+        self.capacity = capacity
+        self._num_bits = math.ceil(
+            -capacity * math.log(false_positive_rate) / math.log(2) ** 2
+        )
+        self._num_hashes = max(round(self._num_bits / capacity * math.log(2)), 1)
+        self._bits = bytearray((self._num_bits + 7) // 8)
+
+    @property
+    def num_bytes(self) -> int:
+        return len(self._bits)
+
+    def add(self, item: bytes) -> None:
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: bytes) -> bool:
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item, digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "big")
+        # An odd step can't get stuck cycling through only a few of the bits
+        step = int.from_bytes(digest[8:], "big") | 1
+        return (
+            (first + idx * step) % self._num_bits for idx in range(self._num_hashes)
+        )
+
+
+class OfferIndex:
+    """
+    Remember which content was offered through which node, so it isn't offered again.
+
+    An offer is only recorded if the node offered the content to enough peers.
+    Offers are kept in a SQLite database, which is the exact record. An
+    in-memory Bloom filter over it answers most lookups for content that was
+    never offered, like new blocks, without touching the disk.
+
+    The filter is rebuilt from the database when the index is opened, and
+    rebuilt at double the size if it fills up.
+
+    The index may be shared between threads.
+    """
+
+    def __init__(
+        self,
+        path,
+        min_peers: int = MINIMUM_OTHER_PEERS_OFFERED,
+        filter_capacity: int = DEFAULT_FILTER_CAPACITY,
+        false_positive_rate: float = DEFAULT_FALSE_POSITIVE_RATE,
+    ):
+        """
+        Open the index at the given path, creating it if needed.
+
+        :param path: the path of the SQLite database file
+        :param min_peers: the fewest peers a node must offer content to, for
+            the offer to be recorded
+        :param filter_capacity: how many offers the Bloom filter is sized for,
+            at least
+        :param false_positive_rate: how often the Bloom filter may send a lookup
+            to disk for an offer that was never made
+        """
+        self._path = Path(path)
+        self._min_peers = min_peers
+        self._false_positive_rate = false_positive_rate
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self._path), check_same_thread=False)
+        self._db.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS offered (
+                content_key BLOB NOT NULL,
+                node_id TEXT NOT NULL,
+                peers INTEGER NOT NULL,
+                PRIMARY KEY (content_key, node_id)
+            ) WITHOUT ROWID;
+            """
+        )
+        self._db.commit()
+        self._last_commit = time.monotonic()
+
+        (self._num_offers,) = self._db.execute(
+            "SELECT COUNT(*) FROM offered"
+        ).fetchone()
+        self._filter = self._build_filter(max(filter_capacity, 2 * self._num_offers))
+
+    def __len__(self) -> int:
+        """
+        How many (content key, node) offers are recorded.
+        """
+        return self._num_offers
+
+    @property
+    def filter_bytes(self) -> int:
+        """
+        The size of the in-memory Bloom filter.
+        """
+        return self._filter.num_bytes
+
+    def record(self, content_key: bytes, node_id: str, num_peers: int) -> bool:
+        """
+        Record that the node offered the content, if it reached enough peers.
+
+        :return: whether the offer was recorded
+        """
+        if num_peers < self._min_peers:
+            return False
+
+        content_key = bytes(content_key)
+        with self._lock:
+            inserted = self._db.execute(
+                "INSERT OR IGNORE INTO offered (content_key, node_id, peers)"
+                " VALUES (?, ?, ?)",
+                (content_key, node_id, num_peers),
+            ).rowcount
+            if inserted:
+                self._num_offers += 1
+                self._filter.add(_filter_item(content_key, node_id))
+                if self._num_offers > self._filter.capacity:
+                    self._filter = self._build_filter(2 * self._filter.capacity)
+
+            if time.monotonic() - self._last_commit > _COMMIT_INTERVAL_SECONDS:
+                self._commit()
+        return True
+
+    def offered_peers(
+        self, content_key: bytes, node_ids: Iterable[str]
+    ) -> Dict[str, int]:
+        """
+        Find which of the nodes already offered the content.
+
+        :return: how many peers each node offered the content to, for only
+            the nodes that did
+        """
+        content_key = bytes(content_key)
+        with self._lock:
+            maybe_offered = [
+                node_id
+                for node_id in node_ids
+                if _filter_item(content_key, node_id) in self._filter
+            ]
+            if not maybe_offered:
+                return {}
+
+            rows = self._db.execute(
+                "SELECT node_id, peers FROM offered WHERE content_key = ?"
+                f" AND node_id IN ({', '.join('?' * len(maybe_offered))})",
+                (content_key, *maybe_offered),
+            ).fetchall()
+        return dict(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            self._commit()
+            self._db.close()
+
+    def __enter__(self) -> "OfferIndex":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _build_filter(self, capacity):
+        bloom_filter = BloomFilter(capacity, self._false_positive_rate)
+        for content_key, node_id in self._db.execute(
+            "SELECT content_key, node_id FROM offered"
+        ):
+            bloom_filter.add(_filter_item(content_key, node_id))
+        return bloom_filter
+
+    def _commit(self):
+        self._db.commit()
+        self._last_commit = time.monotonic()
+
+
+def _filter_item(content_key: bytes, node_id: str) -> bytes:
+    # Prefix the length, so no two different pairs run together the same way
+    return len(content_key).to_bytes(2, "big") + content_key + node_id.encode()
@@ -0,0 +1,109 @@
+import heapq
+import itertools
+import random
+import time
+from typing import Any, Callable, List, Optional, Tuple
+
+# Defaults for how long to wait before retrying an item, in seconds: the first
+#   retry waits about the base delay, doubling with each attempt, up to the cap
+DEFAULT_BASE_DELAY = 10
+DEFAULT_MAX_DELAY = 600
+
+# How many times to try an item in total, before giving up on it
+DEFAULT_MAX_ATTEMPTS = 8
+
+# Each delay is randomly stretched or shrunk by up to this fraction, so that
+#   items that failed together don't all retry together
+DEFAULT_JITTER = 0.2
+
+
+class RetryScheduler:
+    """
+    Decide when to retry each failed item, with exponential backoff and jitter.
+
+    Items waiting for a retry are kept in a heap, ordered by when they are
+    next due, so the next due item is always found in constant time, and
+    scheduling takes logarithmic time.
+    """
+
+    def __init__(
+        self,
+        base_delay: float = DEFAULT_BASE_DELAY,
+        max_delay: float = DEFAULT_MAX_DELAY,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        jitter: float = DEFAULT_JITTER,
+        clock: Callable[[], float] = time.monotonic,
+        rng: random.Random = None,
+    ):
+        """
+        Create an empty schedule, with the given retry policy.
+
+        :param base_delay: seconds to wait before the first retry
+        :param max_delay: the cap on seconds to wait before any retry
+        :param max_attempts: how many attempts an item gets in total, including
+            the first one, before it's given up on
+        :param jitter: the fraction of each delay to randomly add or subtract
+        :param clock: the source of the current time, in seconds
+        :param rng: the source of randomness for the jitter
+        """
+        if max_attempts < 1:
+            raise ValueError(f"Must allow at least one attempt, not {max_attempts}")
+        if not 0 <= jitter < 1:
+            raise ValueError(f"Jitter must be a fraction from 0 up to 1, not {jitter}")
+
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._max_attempts = max_attempts
+        self._jitter = jitter
+        self._clock = clock
+        self._rng = rng or random.Random()
+
+        # Entries of (due_time, tie_breaker, attempts_so_far, item)
+        self._heap: List[Tuple[float, int, int, Any]] = []
+        self._tie_breaker = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def delay_after(self, attempts: int) -> float:
+        """
+        How long to wait before the next attempt, after the given number of failed attempts.
+        """
+        delay = min(self._base_delay * 2 ** (attempts - 1), self._max_delay)
+        return delay * self._rng.uniform(1 - self._jitter, 1 + self._jitter)
+
+    def schedule(self, item, attempts: int) -> bool:
+        """
+        Schedule another attempt at an item, unless it's out of attempts.
+
+        :param attempts: how many times the item was already attempted
+
+        :return: whether the item was scheduled. If not, it should be given up on.
+        """
+        if attempts >= self._max_attempts:
+            return False
+
+        due_time = self._clock() + self.delay_after(attempts)
+        heapq.heappush(self._heap, (due_time, next(self._tie_breaker), attempts, item))
+        return True
+
+    def pop_due(self) -> Optional[Tuple[Any, int]]:
+        """
+        Remove and return the item that's most overdue for a retry.
+
+        :return: (item, attempts_so_far), or None if no item is due yet
+        """
+        if self._heap and self._heap[0][0] <= self._clock():
+            _, _, attempts, item = heapq.heappop(self._heap)
+            return item, attempts
+        else:
+            return None
+
+    def seconds_until_due(self) -> Optional[float]:
+        """
+        How long until the next item is due, or None if nothing is scheduled.
+        """
+        if self._heap:
+            return max(self._heap[0][0] - self._clock(), 0)
+        else:
+            return None
@@ -0,0 +1,90 @@
+from bisect import bisect_left
+import hashlib
+from typing import List, Sequence, Tuple
+
+
+def content_id(content_key: bytes) -> int:
+    """
+    Convert a Portal History Network content key into its content ID, as an integer.
+
+    The content ID is the sha256 hash of the content key, and is the location
+    of the content in the same 256-bit keyspace as the node IDs.
+    """
+    return int.from_bytes(hashlib.sha256(content_key).digest(), "big")
+
+
+class NodeIdIndex:
+    """
+    Find which of a group of nodes are closest to a content ID, by XOR distance.
+
+    Node IDs are kept in a sorted array. Every set of IDs that share a common
+    prefix forms a contiguous run of that array, so the closest nodes can be
+    found by bisecting into ever-smaller runs, rather than by measuring the
+    distance to every node.
+    """
+
+    def __init__(self, node_ids: Sequence[bytes]):
+        """
+        Index the node IDs of a group of nodes.
+
+        :param node_ids: the 32-byte node ID of each node. Nodes are identified
+            by their position in this sequence.
+        """
+        ids_and_positions = sorted(
+            (int.from_bytes(node_id, "big"), position)
+            for position, node_id in enumerate(node_ids)
+        )
+        self._sorted_ids = [node_id for node_id, _ in ids_and_positions]
+        self._positions = [position for _, position in ids_and_positions]
+
+    def __len__(self) -> int:
+        return len(self._sorted_ids)
+
+    def closest(self, target: int, k: int) -> Tuple[int, ...]:
+        """
+        Find the k nodes closest to the target ID.
+
+        :param target: the ID to measure distance from, like a content ID
+        :param k: how many nodes to select. If there are fewer than k nodes,
+            all of them are returned.
+
+        :return: the position of each selected node in the original node IDs,
+            closest first
+        """
+        if k < 1:
+            raise ValueError(f"Must select at least one node, not {k}")
+
+        selected = self._closest_in_run(target, 0, len(self._sorted_ids), k)
+        selected.sort(key=lambda idx: self._sorted_ids[idx] ^ target)
+        return tuple(self._positions[idx] for idx in selected)
+
+    def _closest_in_run(self, target: int, lo: int, hi: int, k: int) -> List[int]:
+        """
+        Find the indices of the k closest IDs in the sorted run from lo to hi.
+
+        All IDs in the run must share a prefix, down to the highest bit where
+        the first and last ID differ.
+        """
+        if hi - lo <= k:
+            return list(range(lo, hi))
+
+        ids = self._sorted_ids
+        split_bit = (ids[lo] ^ ids[hi - 1]).bit_length() - 1
+        if split_bit < 0:
+            # Duplicate IDs are equally close, so any of them will do
+            return list(range(lo, lo + k))
+
+        # The run splits in two at the first ID with the split bit set. Every ID
+        #   on the same side as the target is closer than every ID on the other.
+        split_value = ((ids[lo] >> split_bit) | 1) << split_bit
+        mid = bisect_left(ids, split_value, lo, hi)
+        if (target >> split_bit) & 1:
+            (near_lo, near_hi), (far_lo, far_hi) = (mid, hi), (lo, mid)
+        else:
+            (near_lo, near_hi), (far_lo, far_hi) = (lo, mid), (mid, hi)
+
+        selected = self._closest_in_run(target, near_lo, near_hi, k)
+        if len(selected) < k:
+            remaining = k - len(selected)
+            selected += self._closest_in_run(target, far_lo, far_hi, remaining)
+        return selected
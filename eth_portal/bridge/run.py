@@ -1,17 +1,30 @@
 from contextlib import ExitStack, contextmanager
-import logging
 import os
 import sys
-import time
 from typing import Iterable
 
 from eth_utils import decode_hex
 from web3 import Web3
 
-from eth_portal.bridge.handle import handle_new_header, propagate_block
-from eth_portal.bridge.inject import inject_content
-from eth_portal.bridge.insert import PortalInserter
-from eth_portal.trin import launch_trin
+from eth_portal.bridge.backfill import (
+    DEFAULT_FETCH_WORKERS,
+    pipelined_backfill,
+    serial_backfill,
+)
+from eth_portal.bridge.checkpoint import BackfillCheckpoint
+from eth_portal.bridge.coverage import check_coverage
+from eth_portal.bridge.export import export_block_range
+from eth_portal.bridge.follow import DEFAULT_MAX_IN_FLIGHT, follow_chain_head
+from eth_portal.bridge.inject import DEFAULT_DEAD_LETTER_PATH, inject_content
+from eth_portal.bridge.insert import OFFER_REQUEST_TIMEOUT, PortalInserter
+from eth_portal.bridge.metrics import REGISTRY, serve_metrics
+from eth_portal.bridge.offered import OfferIndex
+from eth_portal.bridge.store import DEFAULT_MAX_BYTES, ContentStore
+from eth_portal.trin import (
+    DEFAULT_STORAGE_KB,
+    launch_trin_nodes,
+    private_key_to_node_id,
+)
 
 INVALID_KEY_ENV_ERROR = (
     "Must supply environment variable PORTAL_BRIDGE_KEYS, as a"
@@ -24,75 +37,199 @@ INVALID_CLOUDFLARE_AUTH_PROVIDER_ENV_ERROR = (
 )
 
 
-class DroppedFilter(Exception):
-    pass
-
-
-def header_log_loop(w3, portal_inserter, event_filter, poll_interval):
-    while True:
-        try:
-            new_entries = event_filter.get_new_entries()
-        except ValueError as exc:
-            # most likely: the filter was dropped by the node
-            logging.exception("Failure to get latest events, re-attempting...")
-            raise DroppedFilter from exc
-
-        for header_hash in new_entries:
-            handle_new_header(w3, portal_inserter, header_hash)
-        time.sleep(poll_interval)
-
-
-def poll_chain_head(portal_inserter, w3):
+def backfill_bridge_blocks(
+    portal_inserter,
+    start_block,
+    end_block,
+    w3,
+    fetch_workers=None,
+    ordered=False,
+    content_store=None,
+    checkpoint=None,
+    resume=False,
+    encode_processes=None,
+):
     """
-    Monitor the head of the chain, and insert new content until Ctrl-C is pressed.
+    Push all content for the blocks in the given range (inclusive).
+
+    :param fetch_workers: if supplied, run a pipelined backfill with this many
+        threads fetching from the provider. Otherwise, handle one block at a time.
+    :param ordered: whether a pipelined backfill must push blocks in order
+    :param content_store: if supplied, a :class:`ContentStore` to reuse
+        previously-encoded content from, and to save newly-encoded content to
+    :param checkpoint: if supplied, a :class:`BackfillCheckpoint` to record
+        progress in
+    :param resume: whether to skip the content that the checkpoint shows was
+        already offered
+    :param encode_processes: if supplied, a pipelined backfill encodes blocks
+        in this many processes
     """
-    while True:
-        block_filter = w3.eth.filter("latest")
-
-        try:
-            # On each new header, publish the content to the trin nodes
-            header_log_loop(w3, portal_inserter, block_filter, 6)
-        except DroppedFilter:
-            print("Recreating filter to watch for latest headers")
-            continue
-
-
-def backfill_bridge_blocks(portal_inserter, start_block, end_block, w3):
     block_numbers = range(start_block, end_block + 1)
     print(f"Injecting {len(block_numbers)} blocks, starting from #{start_block}")
 
-    for block_num in block_numbers:
-        print(f"Getting block #{block_num} for injection to Portal network")
-        block_fields = w3.eth.get_block(block_num, full_transactions=True)
-        print(f"Injecting block hash {block_fields.hash.hex()}")
-        propagate_block(w3, portal_inserter, block_fields)
+    if resume:
+        num_complete = checkpoint.count_complete(start_block, end_block)
+        print(f"Resuming, skipping {num_complete} blocks that were already pushed")
+
+    if fetch_workers is not None:
+        pipelined_backfill(
+            portal_inserter,
+            block_numbers,
+            w3,
+            fetch_workers=fetch_workers,
+            ordered=ordered,
+            content_store=content_store,
+            checkpoint=checkpoint,
+            resume=resume,
+            encode_processes=encode_processes,
+        )
+    else:
+        serial_backfill(
+            portal_inserter, block_numbers, w3, content_store, checkpoint, resume
+        )
 
     print("Finished injecting all blocks")
 
 
-def launch_bridge(provider_arg):
+def launch_bridge(
+    provider_arg,
+    route_k=None,
+    max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+    subscribe_uri=None,
+    content_store_path=None,
+    content_store_max_bytes=DEFAULT_MAX_BYTES,
+    trin_data_root=None,
+    trin_storage_kb=DEFAULT_STORAGE_KB,
+    offer_index_path=None,
+):
     # Launch trin nodes, for broadcasting data
     # The context manager shuts down all trin nodes on context exit
     trin_node_keys = load_private_keys()
     w3 = load_provider(provider_arg)
-    with launch_trin_inserters(trin_node_keys) as portal_inserter:
-        poll_chain_head(portal_inserter, w3)
-
-
-def launch_injector(content_files):
+    with ExitStack() as stack:
+        content_store = stack.enter_context(
+            open_content_store(content_store_path, content_store_max_bytes)
+        )
+        portal_inserter = stack.enter_context(
+            launch_trin_inserters(
+                trin_node_keys,
+                route_k,
+                trin_data_root,
+                trin_storage_kb,
+                offer_index_path,
+            )
+        )
+        follow_chain_head(
+            w3,
+            portal_inserter,
+            max_in_flight=max_in_flight,
+            subscribe_uri=subscribe_uri,
+            content_store=content_store,
+        )
+
+
+def launch_injector(
+    content_files,
+    route_k=None,
+    dead_letter_path=DEFAULT_DEAD_LETTER_PATH,
+    trin_data_root=None,
+    trin_storage_kb=DEFAULT_STORAGE_KB,
+    offer_index_path=None,
+):
     trin_node_keys = load_private_keys()
-    with launch_trin_inserters(trin_node_keys) as portal_inserter:
-        inject_content(portal_inserter, content_files)
-
-
-def launch_backfill(start_block, end_block, provider_arg):
+    with launch_trin_inserters(
+        trin_node_keys, route_k, trin_data_root, trin_storage_kb, offer_index_path
+    ) as portal_inserter:
+        inject_content(portal_inserter, content_files, dead_letter_path)
+
+
+def launch_backfill(
+    start_block,
+    end_block,
+    provider_arg,
+    fetch_workers=None,
+    ordered=False,
+    route_k=None,
+    content_store_path=None,
+    content_store_max_bytes=DEFAULT_MAX_BYTES,
+    checkpoint_path=None,
+    resume=False,
+    encode_processes=None,
+    trin_data_root=None,
+    trin_storage_kb=DEFAULT_STORAGE_KB,
+    offer_index_path=None,
+):
     trin_node_keys = load_private_keys()
     w3 = load_provider(provider_arg)
-    with launch_trin_inserters(trin_node_keys) as portal_inserter:
-        backfill_bridge_blocks(portal_inserter, start_block, end_block, w3)
-
-
-def launch_patch_recent(blocks_to_patch, provider_arg):
+    with ExitStack() as stack:
+        checkpoint = stack.enter_context(open_checkpoint(checkpoint_path))
+        content_store = stack.enter_context(
+            open_content_store(content_store_path, content_store_max_bytes)
+        )
+        portal_inserter = stack.enter_context(
+            launch_trin_inserters(
+                trin_node_keys,
+                route_k,
+                trin_data_root,
+                trin_storage_kb,
+                offer_index_path,
+            )
+        )
+        backfill_bridge_blocks(
+            portal_inserter,
+            start_block,
+            end_block,
+            w3,
+            fetch_workers,
+            ordered,
+            content_store,
+            checkpoint,
+            resume,
+            encode_processes,
+        )
+
+
+def launch_export(
+    start_block,
+    end_block,
+    provider_arg,
+    export_path,
+    fetch_workers=None,
+    encode_processes=None,
+    content_store_path=None,
+    content_store_max_bytes=DEFAULT_MAX_BYTES,
+):
+    # No trin nodes are needed, the content is only written to files
+    w3 = load_provider(provider_arg)
+    block_numbers = range(start_block, end_block + 1)
+    print(f"Exporting {len(block_numbers)} blocks to {export_path}")
+    with open_content_store(content_store_path, content_store_max_bytes) as store:
+        num_items = export_block_range(
+            block_numbers,
+            w3,
+            export_path,
+            DEFAULT_FETCH_WORKERS if fetch_workers is None else fetch_workers,
+            encode_processes,
+            store,
+        )
+    print(f"Finished exporting {num_items} content items to {export_path}")
+
+
+def launch_patch_recent(
+    blocks_to_patch,
+    provider_arg,
+    fetch_workers=None,
+    ordered=False,
+    route_k=None,
+    content_store_path=None,
+    content_store_max_bytes=DEFAULT_MAX_BYTES,
+    checkpoint_path=None,
+    resume=False,
+    encode_processes=None,
+    trin_data_root=None,
+    trin_storage_kb=DEFAULT_STORAGE_KB,
+    offer_index_path=None,
+):
     trin_node_keys = load_private_keys()
     w3 = load_provider(provider_arg)
     end_block = w3.eth.get_block("latest").get("number")
@@ -100,12 +237,42 @@ def launch_patch_recent(blocks_to_patch, provider_arg):
         start_block = 0
     else:
         start_block = end_block - blocks_to_patch
-    with launch_trin_inserters(trin_node_keys) as portal_inserter:
-        backfill_bridge_blocks(portal_inserter, start_block, end_block, w3)
+    with ExitStack() as stack:
+        checkpoint = stack.enter_context(open_checkpoint(checkpoint_path))
+        content_store = stack.enter_context(
+            open_content_store(content_store_path, content_store_max_bytes)
+        )
+        portal_inserter = stack.enter_context(
+            launch_trin_inserters(
+                trin_node_keys,
+                route_k,
+                trin_data_root,
+                trin_storage_kb,
+                offer_index_path,
+            )
+        )
+        backfill_bridge_blocks(
+            portal_inserter,
+            start_block,
+            end_block,
+            w3,
+            fetch_workers,
+            ordered,
+            content_store,
+            checkpoint,
+            resume,
+            encode_processes,
+        )
 
 
 @contextmanager
-def launch_trin_inserters(keys: Iterable[bytes]):
+def launch_trin_inserters(
+    keys: Iterable[bytes],
+    route_k: int = None,
+    data_root: str = None,
+    storage_kb: int = DEFAULT_STORAGE_KB,
+    offer_index_path: str = None,
+):
     """
     For each key supplied, launch an instance of trin, then yield an object for propagation.
 
@@ -115,13 +282,87 @@ def launch_trin_inserters(keys: Iterable[bytes]):
     of launched trin nodes.
 
     :param keys: list of private keys to launch each trin instance.
+    :param route_k: if supplied, offer each item only to this many trin
+        instances, whose node IDs are closest to the content ID
+    :param data_root: if supplied, keep each trin instance's data in a
+        temporary directory under this one, like a ramdisk
+    :param storage_kb: the cap on how much content each trin instance stores
+    :param offer_index_path: if supplied, the path of an :class:`OfferIndex`,
+        to skip content that each trin instance already offered, even in an
+        earlier run
     """
     with ExitStack() as stack:
-        web3_links = [
-            stack.enter_context(launch_trin(key, 9000 + idx))
-            for idx, key in enumerate(keys)
-        ]
-        yield PortalInserter(web3_links)
+        offer_index = stack.enter_context(open_offer_index(offer_index_path))
+        web3_links = stack.enter_context(
+            launch_trin_nodes(
+                keys,
+                data_root=data_root,
+                storage_kb=storage_kb,
+                request_timeout=OFFER_REQUEST_TIMEOUT,
+            )
+        )
+        node_ids = [private_key_to_node_id(key) for key in keys]
+        print(f"Keyspace coverage of {check_coverage(node_ids).describe()}")
+        portal_inserter = PortalInserter(
+            web3_links, node_ids=node_ids, route_k=route_k, offer_index=offer_index
+        )
+        stack.callback(portal_inserter.shutdown)
+        yield portal_inserter
+
+
+@contextmanager
+def open_content_store(path, max_bytes: int = DEFAULT_MAX_BYTES):
+    """
+    Open a :class:`ContentStore` at the path, or yield None if no path is given.
+    """
+    if path is None:
+        yield None
+    else:
+        with ContentStore(path, max_bytes) as content_store:
+            print(
+                f"Using content store at {path},"
+                f" currently {content_store.total_bytes / 2**20:.1f} MB"
+            )
+            yield content_store
+
+
+@contextmanager
+def open_offer_index(path):
+    """
+    Open an :class:`OfferIndex` at the path, or yield None if no path is given.
+    """
+    if path is None:
+        yield None
+    else:
+        with OfferIndex(path) as offer_index:
+            print(
+                f"Using offer index at {path}, with {len(offer_index)} offers"
+                f" recorded, filtered in {offer_index.filter_bytes / 2**20:.1f} MB"
+            )
+            yield offer_index
+
+
+@contextmanager
+def open_checkpoint(path):
+    """
+    Open a :class:`BackfillCheckpoint` at the path, or yield None if no path is given.
+    """
+    if path is None:
+        yield None
+    else:
+        with BackfillCheckpoint(path) as checkpoint:
+            yield checkpoint
+
+
+def launch_metrics_server(port: int):
+    """
+    Serve the bridge's metrics over HTTP on the port, on localhost only.
+
+    :return: the running server, to ``shutdown()`` on exit
+    """
+    server = serve_metrics(REGISTRY, port)
+    print(f"Serving metrics at http://127.0.0.1:{port}/metrics")
+    return server
 
 
 def load_private_keys():
@@ -160,6 +401,10 @@ def load_provider(provider_arg):
             )
         return w3
     else:
+        # Infura defaults to a websocket connection, which can't be shared by
+        #   the threads that fetch blocks concurrently. HTTP can, and supports
+        #   batched requests too.
+        os.environ.setdefault("WEB3_INFURA_SCHEME", "https")
         from web3.auto.infura import w3
 
         return w3
@@ -0,0 +1,221 @@
+from pathlib import Path
+import sqlite3
+import threading
+from typing import Iterable, Optional, Tuple
+
+from eth_portal.portal_encode import (
+    block_body_content_key,
+    header_content_key,
+    receipt_content_key,
+)
+
+# Default cap on the total size of stored content values: 10 GB
+DEFAULT_MAX_BYTES = 10 * 2**30
+
+# When the store grows past its cap, evict down to this fraction of the cap, so
+#   that eviction runs occasionally in bulk, instead of on every insert
+_EVICTION_TARGET_RATIO = 0.9
+
+
+class ContentStore:
+    """
+    Keep encoded Portal content on disk, so it doesn't have to be fetched and encoded again.
+
+    Content values are stored by content key, in a SQLite database. Each block's
+    number is also mapped to its header hash, so that a backfill can find all
+    of a block's content without asking the provider for the block.
+
+    The total size of the stored content values is capped. When the store grows
+    past the cap, the least-recently used content is evicted.
+
+    The store may be shared between threads.
+    """
+
+    def __init__(self, path, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        Open the store at the given path, creating it if needed.
+
+        :param path: the path of the SQLite database file
+        :param max_bytes: the cap on the total size of stored content values
+        """
+        self._path = Path(path)
+        self._max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self._path), check_same_thread=False)
+        self._db.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS content (
+                content_key BLOB PRIMARY KEY,
+                content_value BLOB NOT NULL,
+                last_access INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS content_by_access ON content (last_access);
+            CREATE TABLE IF NOT EXISTS blocks (
+                block_number INTEGER PRIMARY KEY,
+                header_hash BLOB NOT NULL
+            );
+            """
+        )
+
+        self._total_bytes, latest_access = self._db.execute(
+            "SELECT COALESCE(SUM(LENGTH(content_value)), 0),"
+            " COALESCE(MAX(last_access), 0) FROM content"
+        ).fetchone()
+
+        # A counter instead of a timestamp, so that the access order is exact
+        self._access_counter = latest_access
+
+    @property
+    def total_bytes(self) -> int:
+        """
+        The total size of all stored content values.
+        """
+        return self._total_bytes
+
+    def get(self, content_key: bytes) -> Optional[bytes]:
+        """
+        Load the content value for the given key, or None if it isn't stored.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT content_value FROM content WHERE content_key = ?",
+                (content_key,),
+            ).fetchone()
+            if row is None:
+                return None
+
+            self._db.execute(
+                "UPDATE content SET last_access = ? WHERE content_key = ?",
+                (self._next_access(), content_key),
+            )
+            self._db.commit()
+            return row[0]
+
+    def put(self, content_key: bytes, content_value: bytes) -> None:
+        """
+        Store the content value under the given key, evicting old content if needed.
+        """
+        self.put_all(((content_key, content_value),))
+
+    def put_all(self, content_items: Iterable[Tuple[bytes, bytes]]) -> None:
+        """
+        Store several (content_key, content_value) pairs in one transaction.
+        """
+        with self._lock:
+            self._insert(content_items)
+            self._db.commit()
+
+    def get_block(self, block_number: int) -> Optional[Tuple[Tuple[bytes, bytes], ...]]:
+        """
+        Load all the content of the block with the given number.
+
+        :return: ((content_key, content_value), ...) for the header, block body
+            and receipts, or None if any of them is not stored
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT header_hash FROM blocks WHERE block_number = ?",
+                (block_number,),
+            ).fetchone()
+
+        if row is None:
+            return None
+        else:
+            return self.get_block_by_hash(row[0])
+
+    def get_block_by_hash(
+        self, header_hash: bytes
+    ) -> Optional[Tuple[Tuple[bytes, bytes], ...]]:
+        """
+        Load all the content of the block with the given header hash.
+
+        :return: ((content_key, content_value), ...) for the header, block body
+            and receipts, or None if any of them is not stored
+        """
+        content_keys = block_content_keys(header_hash)
+        content_values = [self.get(content_key) for content_key in content_keys]
+        if any(content_value is None for content_value in content_values):
+            return None
+        else:
+            return tuple(zip(content_keys, content_values))
+
+    def put_block(
+        self,
+        block_number: int,
+        header_hash: bytes,
+        content_items: Iterable[Tuple[bytes, bytes]],
+    ) -> None:
+        """
+        Store all the content of a block, and remember the block's header hash.
+        """
+        with self._lock:
+            self._insert(content_items)
+            self._db.execute(
+                "INSERT OR REPLACE INTO blocks (block_number, header_hash) VALUES (?, ?)",
+                (block_number, bytes(header_hash)),
+            )
+            self._db.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self) -> "ContentStore":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _insert(self, content_items):
+        for content_key, content_value in content_items:
+            replaced = self._db.execute(
+                "SELECT LENGTH(content_value) FROM content WHERE content_key = ?",
+                (content_key,),
+            ).fetchone()
+            if replaced is not None:
+                self._total_bytes -= replaced[0]
+
+            self._db.execute(
+                "INSERT OR REPLACE INTO content"
+                " (content_key, content_value, last_access) VALUES (?, ?, ?)",
+                (bytes(content_key), bytes(content_value), self._next_access()),
+            )
+            self._total_bytes += len(content_value)
+
+        if self._total_bytes > self._max_bytes:
+            self._evict(int(self._max_bytes * _EVICTION_TARGET_RATIO))
+
+    def _evict(self, target_bytes):
+        """
+        Delete the least-recently used content until the total size is at most the target.
+        """
+        cursor = self._db.execute(
+            "SELECT content_key, LENGTH(content_value) FROM content"
+            " ORDER BY last_access ASC"
+        )
+        evicted_keys = []
+        for content_key, size in cursor:
+            if self._total_bytes <= target_bytes:
+                break
+            evicted_keys.append((content_key,))
+            self._total_bytes -= size
+
+        self._db.executemany("DELETE FROM content WHERE content_key = ?", evicted_keys)
+
+    def _next_access(self):
+        self._access_counter += 1
+        return self._access_counter
+
+
+def block_content_keys(header_hash: bytes) -> Tuple[bytes, bytes, bytes]:
+    """
+    Get the content keys of the header, block body and receipts of a block.
+    """
+    return (
+        header_content_key(header_hash),
+        block_body_content_key(header_hash),
+        receipt_content_key(header_hash),
+    )
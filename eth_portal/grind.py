@@ -0,0 +1,367 @@
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from functools import partial
+import heapq
+import os
+import secrets
+import time
+from typing import Dict, List, NamedTuple
+
+from eth_hash.auto import keccak
+from eth_keys.backends.native.jacobian import fast_add, fast_multiply
+from eth_keys.constants import SECPK1_G, SECPK1_N, SECPK1_P
+
+# How many consecutive keys share a single modular inversion
+DEFAULT_BATCH_SIZE = 1024
+
+# How many keys each task in the process pool tries
+DEFAULT_KEYS_PER_TASK = 2**16
+
+# By default, tile the keyspace with node IDs within 1/64 of a slice width
+#   of the middle of their slices
+DEFAULT_PRECISION_BITS = 6
+
+# How often to report progress, in seconds
+_REPORT_INTERVAL = 5
+
+# The affine points (i * G) for i in 1..batch_size, built once per process
+_MULTIPLES_OF_G: List[tuple] = []
+
+
+class GroundKey(NamedTuple):
+    distance: int
+    node_id: bytes
+    private_key: bytes
+
+    @property
+    def matching_bits(self) -> int:
+        """
+        How many leading bits of the node ID match the target.
+        """
+        return 256 - self.distance.bit_length()
+
+
+def grind_node_ids(
+    target: int,
+    match_bits: int,
+    num_keys: int = 1,
+    processes: int = None,
+    max_keys: int = None,
+    keys_per_task: int = DEFAULT_KEYS_PER_TASK,
+    report=print,
+) -> List[GroundKey]:
+    """
+    Search for private keys with node IDs near the target, on all CPU cores.
+
+    A node ID is near enough when at least `match_bits` of its leading bits
+    match the target, meaning that its XOR distance to the target is within
+    a radius of ``2 ** (256 - match_bits)``. Each extra bit doubles the
+    expected search time.
+
+    Each task only keeps the closest key it found, so memory use is flat, no
+    matter how many keys are tried. That also means each key returned comes
+    from a different random start, so they are unrelated.
+
+    :param target: the node ID to search near, as an integer
+    :param match_bits: how many leading bits must match the target
+    :param num_keys: how many keys to find
+    :param processes: how many processes to search with, defaulting to one per core
+    :param max_keys: give up after trying this many keys
+    :param keys_per_task: how many keys each process tries before reporting back
+    :param report: called with a progress message every few seconds
+
+    :return: the closest keys found, nearest first. There are `num_keys` of
+        them, all within the radius, unless `max_keys` ran out first.
+    """
+    radius = 2 ** (256 - match_bits)
+
+    # A max-heap of the closest keys found, by negated distance
+    closest = []
+
+    def merge(key):
+        _keep_closest(closest, key, num_keys)
+
+    def finished():
+        return len(closest) == num_keys and -closest[0][0] < radius
+
+    def progress():
+        best = max(closest)[2].matching_bits if closest else 0
+        return f"best match so far: {best} bits"
+
+    _grind_in_pool(
+        partial(grind_batch, target),
+        merge,
+        finished,
+        progress,
+        processes,
+        max_keys,
+        keys_per_task,
+        report,
+    )
+    return sorted(key for _, _, key in closest)
+
+
+def grind_tiling(
+    num_nodes: int,
+    precision_bits: int = DEFAULT_PRECISION_BITS,
+    processes: int = None,
+    max_keys: int = None,
+    keys_per_task: int = DEFAULT_KEYS_PER_TASK,
+    report=print,
+) -> List[GroundKey]:
+    """
+    Search for a set of private keys with node IDs that evenly tile the keyspace.
+
+    The keyspace is cut into `num_nodes` equal slices, and each slice gets the
+    key with the node ID closest to the middle of it. Every node ID found is
+    sorted into its slice, so all slices are searched for at once. But each
+    task's keys are related, so only one key from each task is used, for the
+    slice that needs it most.
+
+    :param num_nodes: how many keys to find
+    :param precision_bits: how near the middle of its slice each node ID must
+        be, as the number of halvings of the slice width
+    :param processes: how many processes to search with, defaulting to one per core
+    :param max_keys: give up after trying this many keys
+    :param keys_per_task: how many keys each process tries before reporting back
+    :param report: called with a progress message every few seconds
+
+    :return: one key per slice, in node ID order, with the distance to the
+        middle of its slice. If `max_keys` ran out first, slices that were
+        never hit are left out.
+    """
+    if num_nodes < 1:
+        raise ValueError(f"Must tile with at least one node, not {num_nodes}")
+    radius = (2**256 // num_nodes) >> precision_bits
+
+    # The closest key found in each slice, by slice number
+    best: Dict[int, GroundKey] = {}
+
+    def merge(found):
+        improved = [
+            slot
+            for slot, key in found.items()
+            if slot not in best or key.distance < best[slot].distance
+        ]
+        if improved:
+            # Fill the slices that aren't near the middle yet first
+            slot = min(
+                improved,
+                key=lambda slot: (
+                    slot in best and best[slot].distance < radius,
+                    found[slot].distance,
+                ),
+            )
+            best[slot] = found[slot]
+
+    def finished():
+        return len(best) == num_nodes and all(
+            key.distance < radius for key in best.values()
+        )
+
+    def progress():
+        num_near = sum(key.distance < radius for key in best.values())
+        return f"{num_near} of {num_nodes} slices have a node ID near the middle"
+
+    _grind_in_pool(
+        partial(grind_tiling_batch, num_nodes),
+        merge,
+        finished,
+        progress,
+        processes,
+        max_keys,
+        keys_per_task,
+        report,
+    )
+    return [best[slot] for slot in sorted(best)]
+
+
+def grind_batch(target: int, num_tried: int):
+    """
+    Try consecutive private keys from a random start, and keep the closest to the target.
+
+    Walking consecutive keys is about a hundred times faster than deriving
+    each public key from a random private key. But consecutive keys are
+    related: anyone who learns one of them, and guesses how it was made, can
+    find the others. So only one key is kept from each walk.
+
+    :return: (how many keys were tried, the closest as a :class:`GroundKey`)
+    """
+    closest_distance = closest = None
+    for private_key, node_id in _walk_node_ids(num_tried):
+        distance = int.from_bytes(node_id, "big") ^ target
+        if closest is None or distance < closest_distance:
+            closest_distance, closest = distance, (private_key, node_id)
+
+    private_key, node_id = closest
+    return num_tried, GroundKey(
+        closest_distance, node_id, private_key.to_bytes(32, "big")
+    )
+
+
+def grind_tiling_batch(num_slots: int, num_tried: int):
+    """
+    Try consecutive private keys, and keep the one closest to the middle of each slice.
+
+    Like :func:`grind_batch`, the keys tried are related, so the caller must
+    only use one of them.
+
+    :param num_slots: how many equal slices to cut the keyspace into
+
+    :return: (how many keys were tried, the closest :class:`GroundKey` to the
+        middle of each slice that was hit, by slice number)
+    """
+    middles = [((2 * slot + 1) << 256) // (2 * num_slots) for slot in range(num_slots)]
+
+    best: Dict[int, GroundKey] = {}
+    for private_key, node_id in _walk_node_ids(num_tried):
+        node_id_int = int.from_bytes(node_id, "big")
+        slot = (node_id_int * num_slots) >> 256
+        distance = node_id_int ^ middles[slot]
+        if slot not in best or distance < best[slot].distance:
+            best[slot] = GroundKey(distance, node_id, private_key.to_bytes(32, "big"))
+
+    return num_tried, best
+
+
+def _grind_in_pool(
+    grind_task,
+    merge,
+    finished,
+    progress,
+    processes,
+    max_keys,
+    keys_per_task,
+    report,
+):
+    """
+    Run grinding tasks in a process pool, until enough keys are found.
+
+    :param grind_task: called in a worker with the number of keys to try,
+        returning (how many keys were tried, what was found)
+    :param merge: called with what each task found
+    :param finished: returns whether enough keys were found, to stop early
+    :param progress: returns a description of the keys found so far
+    """
+    processes = processes or os.cpu_count()
+    num_submitted = num_tried = 0
+    start = last_report = time.monotonic()
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        pending = set()
+        while True:
+            # Keep every process busy, with a task queued up behind each one
+            while len(pending) < 2 * processes:
+                if max_keys is None:
+                    task_keys = keys_per_task
+                else:
+                    task_keys = min(keys_per_task, max_keys - num_submitted)
+                    if task_keys <= 0:
+                        break
+                pending.add(pool.submit(grind_task, task_keys))
+                num_submitted += task_keys
+
+            if not pending:
+                break
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for task in done:
+                num_keys_tried, found = task.result()
+                num_tried += num_keys_tried
+                merge(found)
+
+            now = time.monotonic()
+            if now - last_report >= _REPORT_INTERVAL:
+                last_report = now
+                report(
+                    f"Tried {num_tried} keys at {num_tried / (now - start):.0f} keys/s,"
+                    f" {progress()}"
+                )
+
+            if finished():
+                # Skip any tasks that haven't started yet
+                for task in pending:
+                    task.cancel()
+                break
+
+    elapsed = time.monotonic() - start
+    report(
+        f"Tried {num_tried} keys in {elapsed:.1f}s, at {num_tried / elapsed:.0f} keys/s"
+    )
+
+
+def _walk_node_ids(num_tried: int):
+    """
+    Yield (private_key, node_id) for consecutive private keys, from a random start.
+
+    Stepping from one private key to the next only takes adding the generator
+    point to the public key, and the expensive modular inversions for a whole
+    batch of additions are shared.
+    """
+    multiples = _multiples_of_g()
+    batch_size = len(multiples)
+
+    first_key = secrets.randbelow(SECPK1_N - num_tried - batch_size) + 1
+    point = fast_multiply(SECPK1_G, first_key)
+    for batch_start in range(0, num_tried, batch_size):
+        points = _add_to_all(point, multiples)
+        base_key = first_key + batch_start + 1
+        for offset, (x, y) in enumerate(points[: num_tried - batch_start]):
+            yield base_key + offset, keccak(
+                x.to_bytes(32, "big") + y.to_bytes(32, "big")
+            )
+
+        # Carry on from the last key of the batch
+        point = points[-1]
+
+
+def _keep_closest(closest, key: GroundKey, num_keys: int):
+    # The node ID is a tie-breaker, so keys never get compared
+    entry = (-key.distance, key.node_id, key)
+    if len(closest) < num_keys:
+        heapq.heappush(closest, entry)
+    elif entry > closest[0]:
+        heapq.heapreplace(closest, entry)
+
+
+def _multiples_of_g():
+    if not _MULTIPLES_OF_G:
+        point = SECPK1_G
+        _MULTIPLES_OF_G.append(point)
+        for _ in range(DEFAULT_BATCH_SIZE - 1):
+            point = fast_add(point, SECPK1_G)
+            _MULTIPLES_OF_G.append(point)
+    return _MULTIPLES_OF_G
+
+
+def _add_to_all(point, others):
+    """
+    Add the affine point to each of the other points, with a single modular inversion.
+
+    Uses Montgomery's trick: invert the product of all the denominators, then
+    peel off each denominator's inverse with multiplications.
+    """
+    p = SECPK1_P
+    x0, y0 = point
+
+    denominators = [(x - x0) % p for x, _ in others]
+    running_products = []
+    product = 1
+    for denominator in denominators:
+        running_products.append(product)
+        product = product * denominator % p
+
+    if product == 0:
+        # Only if the point is a multiple of G in the batch, or its negation
+        raise ValueError("Cannot add a point to itself, or to its negation")
+    inverse = pow(product, p - 2, p)
+
+    sums = [None] * len(others)
+    for idx in range(len(others) - 1, -1, -1):
+        denominator_inverse = inverse * running_products[idx] % p
+        inverse = inverse * denominators[idx] % p
+
+        x1, y1 = others[idx]
+        slope = (y1 - y0) * denominator_inverse % p
+        x = (slope * slope - x0 - x1) % p
+        sums[idx] = (x, (slope * (x0 - x) - y0) % p)
+    return sums
@@ -0,0 +1,295 @@
+import binascii
+import codecs
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+import itertools
+import json
+import re
+import socket
+import threading
+import time
+from typing import Any, Dict, List
+
+from web3.exceptions import TimeExhausted
+from web3.providers.base import JSONBaseProvider
+
+# How much to read from the socket at a time, in bytes
+_RECV_SIZE = 2**16
+
+# How often to try connecting to a restarting node again, in seconds
+_RECONNECT_POLL_SECONDS = 0.1
+
+_WHITESPACE = re.compile(r"\s*")
+
+
+class EncodedHex:
+    """
+    A binary value, hex-encoded once, to send as a 0x-prefixed request param.
+
+    :class:`PipelinedIPCProvider` writes the encoded value straight to the
+    socket, without building a JSON string around it. So a value offered to
+    many nodes is only ever encoded once, and never copied per request.
+    """
+
+    __slots__ = ("hex_bytes",)
+
+    def __init__(self, value):
+        """
+        Hex-encode the value, without a 0x prefix.
+
+        :param value: any bytes-like object, like a memoryview
+        """
+        self.hex_bytes = binascii.hexlify(value)
+
+    def __str__(self) -> str:
+        return "0x" + self.hex_bytes.decode()
+
+
+class PipelinedIPCProvider(JSONBaseProvider):
+    """
+    A web3 provider that sends JSON-RPC requests over one persistent IPC connection.
+
+    Unlike :class:`web3.IPCProvider`, which waits for each response before
+    sending the next request, any number of requests can be in flight at
+    once. Each request gets a unique JSON-RPC id, and a background thread
+    matches responses back up to requests by id, in whatever order they
+    arrive.
+
+    Params may include :class:`EncodedHex` values, which are written to the
+    socket as they are, rather than copied into the JSON of the request.
+
+    The connection is opened on the first request, and kept open. If it
+    drops, like when the node restarts, the next request opens a new one,
+    and a request that was cut off by the drop is retried once. If the node's
+    socket is missing or refuses the connection, the retry waits up to the
+    timeout for the node to listen again.
+    """
+
+    def __init__(self, ipc_path, timeout: float = 10):
+        """
+        Set up the provider, without connecting to the node yet.
+
+        :param ipc_path: the path of the node's IPC socket
+        :param timeout: how long to wait for each response, in seconds
+        """
+        self.ipc_path = str(ipc_path)
+        self.timeout = timeout
+
+        self._connection = None
+        self._connect_lock = threading.Lock()
+        self._request_ids = itertools.count()
+        super().__init__()
+
+    def __str__(self) -> str:
+        return f"<{self.__class__.__name__} {self.ipc_path}>"
+
+    def make_request(self, method, params) -> Dict[str, Any]:
+        """
+        Send a request, and wait for its response.
+
+        :raise OSError: if the node can't be connected to
+        :raise TimeExhausted: if the node doesn't respond in time
+        """
+        try:
+            return self._request(method, params)
+        except (ConnectionRefusedError, FileNotFoundError):
+            # The node may be restarting, so try again once it's listening
+            self._reconnect()
+            return self._request(method, params)
+        except ConnectionError:
+            # The node may have restarted, so try again, on a new connection
+            return self._request(method, params)
+
+    def probe(self, method, params, timeout: float) -> Dict[str, Any]:
+        """
+        Send a request just once, without waiting for a restarting node to come back.
+
+        Useful to check whether a node is up yet, without blocking on it for
+        the full provider timeout.
+
+        :param timeout: how long to wait for the response, in seconds
+
+        :raise OSError: if the node can't be connected to
+        :raise TimeExhausted: if the node doesn't respond in time
+        """
+        return self._request(method, params, timeout)
+
+    def close(self) -> None:
+        """
+        Close the connection, failing any requests that are still waiting.
+        """
+        with self._connect_lock:
+            if self._connection is not None:
+                self._connection.close("Provider was closed")
+                self._connection = None
+
+    def _request(self, method, params, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+        request_id = next(self._request_ids)
+        request_parts = _encode_request(request_id, method, params)
+
+        connection = self._get_connection()
+        response = connection.send(request_id, request_parts)
+        try:
+            return response.result(timeout=timeout)
+        except FutureTimeoutError:
+            connection.forget(request_id)
+            raise TimeExhausted(
+                f"{self.ipc_path} did not respond to {method} within {timeout}s"
+            )
+
+    def _reconnect(self):
+        """
+        Keep trying to connect to the node, until it accepts or the timeout runs out.
+
+        :raise OSError: if the node still can't be connected to
+        """
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                self._get_connection()
+                return
+            except (ConnectionRefusedError, FileNotFoundError):
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(_RECONNECT_POLL_SECONDS)
+
+    def _get_connection(self):
+        with self._connect_lock:
+            if self._connection is None or self._connection.closed:
+                self._connection = _Connection(self.ipc_path)
+            return self._connection
+
+
+class _Connection:
+    """
+    One socket to a node, with a thread that reads responses as they arrive.
+    """
+
+    def __init__(self, ipc_path):
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self._sock.connect(ipc_path)
+        except OSError:
+            self._sock.close()
+            raise
+
+        self.closed = False
+
+        # Whole requests must be written one at a time, so they don't interleave
+        self._send_lock = threading.Lock()
+
+        # Responses that haven't arrived yet, by request id
+        self._pending: Dict[int, Future] = {}
+        self._pending_lock = threading.Lock()
+
+        reader = threading.Thread(
+            target=self._read_responses,
+            name=f"ipc-reader-{ipc_path}",
+            daemon=True,
+        )
+        reader.start()
+
+    def send(self, request_id: int, request_parts: List[bytes]) -> Future:
+        """
+        Send a request, in parts, and return a future for its response.
+
+        If the connection drops, the future fails with a :class:`ConnectionError`.
+        """
+        response = Future()
+        with self._pending_lock:
+            if self.closed:
+                raise ConnectionResetError("Connection to node is already closed")
+            self._pending[request_id] = response
+
+        try:
+            with self._send_lock:
+                for part in request_parts:
+                    self._sock.sendall(part)
+        except OSError as exc:
+            self.close(f"Could not send request: {exc!r}")
+
+        return response
+
+    def forget(self, request_id: int) -> None:
+        """
+        Stop waiting for the response to a request.
+        """
+        with self._pending_lock:
+            self._pending.pop(request_id, None)
+
+    def close(self, reason: str) -> None:
+        """
+        Close the socket, and fail every request that is waiting for a response.
+        """
+        with self._pending_lock:
+            if self.closed:
+                return
+            self.closed = True
+            pending, self._pending = self._pending, {}
+
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            # The other side already hung up
+            pass
+        self._sock.close()
+
+        for response in pending.values():
+            response.set_exception(ConnectionResetError(reason))
+
+    def _read_responses(self):
+        decoder = json.JSONDecoder()
+        # A character might be split across chunks, so decode them incrementally
+        text_decoder = codecs.getincrementaldecoder("utf-8")()
+        buffer = ""
+        while True:
+            try:
+                chunk = self._sock.recv(_RECV_SIZE)
+            except OSError as exc:
+                self.close(f"Could not read response: {exc!r}")
+                return
+
+            if not chunk:
+                self.close("Node closed the connection")
+                return
+
+            # Several responses might arrive in one chunk, or one across several
+            buffer += text_decoder.decode(chunk)
+            position = _WHITESPACE.match(buffer).end()
+            while position < len(buffer):
+                try:
+                    response, position = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    # The rest of the response hasn't arrived yet
+                    break
+                self._resolve(response)
+                position = _WHITESPACE.match(buffer, position).end()
+            buffer = buffer[position:]
+
+    def _resolve(self, response):
+        with self._pending_lock:
+            future = self._pending.pop(response.get("id"), None)
+        if future is not None:
+            future.set_result(response)
+
+
+def _encode_request(request_id, method, params) -> List[bytes]:
+    """
+    Encode a JSON-RPC request, as parts that concatenate into the full request.
+
+    Each :class:`EncodedHex` param becomes its own part, so that its value
+    isn't copied.
+    """
+    request_parts = [
+        json.dumps({"jsonrpc": "2.0", "id": request_id, "method": method})[:-1].encode()
+    ]
+    for idx, param in enumerate(params):
+        separator = b', "params": [' if idx == 0 else b", "
+        if isinstance(param, EncodedHex):
+            request_parts.extend((separator + b'"0x', param.hex_bytes, b'"'))
+        else:
+            request_parts.append(separator + json.dumps(param).encode())
+
+    request_parts.append(b"]}" if params else b', "params": []}')
+    return request_parts
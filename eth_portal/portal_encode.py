@@ -39,6 +39,13 @@ def block_body_content_value(transactions, encoded_uncles):
     a byte-string.
     """
     encoded_transactions = [transaction.encode() for transaction in transactions]
+    return encoded_block_body_content_value(encoded_transactions, encoded_uncles)
+
+
+def encoded_block_body_content_value(encoded_transactions, encoded_uncles):
+    """
+    Compile already-encoded transactions and uncle headers into a block body content value.
+    """
     return ssz.encode((encoded_transactions, encoded_uncles), BLOCK_BODY_SEDES)
 
 
@@ -56,4 +63,11 @@ def receipt_content_value(receipts) -> bytes:
     Compile a list of encoded receipts into their joined content value.
     """
     encoded_receipts = [receipt.encode() for receipt in receipts]
+    return encoded_receipt_content_value(encoded_receipts)
+
+
+def encoded_receipt_content_value(encoded_receipts) -> bytes:
+    """
+    Compile a list of already-encoded receipts into their joined content value.
+    """
     return ssz.encode(encoded_receipts, BLOCK_RECEIPTS_SEDES)
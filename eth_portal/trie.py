@@ -0,0 +1,123 @@
+from typing import Iterable, List
+
+from eth.constants import BLANK_ROOT_HASH
+from eth_hash.auto import keccak
+from eth_typing import Hash32
+import rlp
+
+# The RLP encoding of an empty byte-string, which marks an empty branch slot
+_BLANK_NODE_RLP = b"\x80"
+
+
+def ordered_trie_root(encoded_items: Iterable[bytes]) -> Hash32:
+    """
+    Calculate the root of a trie of already-encoded items, keyed by their position.
+
+    This is how the transactions root and receipts root of a header are built.
+    It gives the same result as py-evm's ``make_trie_root_and_nodes()``, but
+    only calculates the root: the trie is built bottom-up from the sorted keys,
+    encoding and hashing each node once, without inserting items one by one
+    into a node database.
+    """
+    values = list(encoded_items)
+    if not values:
+        return BLANK_ROOT_HASH
+
+    # Trie keys are the RLP-encoded item positions, as hex nibbles
+    keyed_values = sorted(
+        (rlp.encode(index, sedes=rlp.sedes.big_endian_int).hex(), value)
+        for index, value in enumerate(values)
+    )
+    keys = [key for key, _ in keyed_values]
+    values = [value for _, value in keyed_values]
+
+    root_rlp = _encode_node(keys, values, 0, len(keys), 0)
+    return keccak(root_rlp)
+
+
+def _encode_node(keys: List[str], values: List[bytes], lo: int, hi: int, depth: int):
+    """
+    RLP-encode the node holding the sorted keys from lo to hi.
+
+    All of the keys share the same nibbles up to depth.
+    """
+    first_key = keys[lo]
+    if hi - lo == 1:
+        return _encode_list(
+            rlp.encode(_hex_prefix(first_key[depth:], is_leaf=True))
+            + rlp.encode(values[lo])
+        )
+
+    # Keys are sorted, so the prefix shared by the first and last key is
+    #   shared by all of them
+    last_key = keys[hi - 1]
+    shared = depth
+    while (
+        shared < len(first_key)
+        and shared < len(last_key)
+        and first_key[shared] == last_key[shared]
+    ):
+        shared += 1
+
+    if shared > depth:
+        child_rlp = _encode_node(keys, values, lo, hi, shared)
+        return _encode_list(
+            rlp.encode(_hex_prefix(first_key[depth:shared], is_leaf=False))
+            + _child_reference(child_rlp)
+        )
+
+    # Keys diverge at this depth, so this is a branch
+    if len(first_key) == depth:
+        # This key ends at the branch, so its value is stored in the branch
+        branch_value = rlp.encode(values[lo])
+        lo += 1
+    else:
+        branch_value = _BLANK_NODE_RLP
+
+    slots = []
+    child_lo = lo
+    for nibble in "0123456789abcdef":
+        child_hi = child_lo
+        while child_hi < hi and keys[child_hi][depth] == nibble:
+            child_hi += 1
+
+        if child_hi == child_lo:
+            slots.append(_BLANK_NODE_RLP)
+        else:
+            child_rlp = _encode_node(keys, values, child_lo, child_hi, depth + 1)
+            slots.append(_child_reference(child_rlp))
+        child_lo = child_hi
+
+    return _encode_list(b"".join(slots) + branch_value)
+
+
+def _child_reference(node_rlp: bytes) -> bytes:
+    """
+    Reference a child node from its parent: inline if short, otherwise by hash.
+    """
+    if len(node_rlp) < 32:
+        return node_rlp
+    else:
+        return rlp.encode(keccak(node_rlp))
+
+
+def _hex_prefix(nibbles: str, is_leaf: bool) -> bytes:
+    """
+    Compactly encode a path of hex nibbles, with a flag for whether it ends in a leaf.
+    """
+    flag = 2 if is_leaf else 0
+    if len(nibbles) % 2:
+        return bytes.fromhex(f"{flag + 1:x}{nibbles}")
+    else:
+        return bytes.fromhex(f"{flag:x}0{nibbles}")
+
+
+def _encode_list(payload: bytes) -> bytes:
+    """
+    RLP-encode a list, given the concatenation of its already-encoded elements.
+    """
+    if len(payload) < 56:
+        return bytes((0xC0 + len(payload),)) + payload
+    else:
+        length = len(payload).to_bytes((len(payload).bit_length() + 7) // 8, "big")
+        return bytes((0xF7 + len(length),)) + length + payload
@@ -1,29 +1,261 @@
-from contextlib import contextmanager
+from contextlib import ExitStack, contextmanager
+import os
 from pathlib import Path
+import shutil
 import signal
 import subprocess
+import tempfile
+import time
+from typing import Iterable, List
 
 from eth_keys.datatypes import PrivateKey
 from eth_utils import keccak, remove_0x_prefix
 from web3 import Web3
+from web3.exceptions import TimeExhausted
+
+from eth_portal.ipc import PipelinedIPCProvider
+
+# How long to wait for launched trin nodes to answer requests, in seconds
+DEFAULT_READY_TIMEOUT = 60
+
+# How long to wait for each response from a launched trin node, in seconds
+DEFAULT_REQUEST_TIMEOUT = 10
+
+# How often to check whether the launched trin nodes are ready, in seconds
+_READY_POLL_INTERVAL = 0.1
+
+# How long each readiness check waits for a node to answer, in seconds. Nodes
+#   are checked one at a time, so one slow node mustn't hold up the others.
+_READY_PROBE_TIMEOUT = 1
+
+# How much content each launched trin node stores, in kilobytes. The point of
+#   these nodes is to broadcast content, not to host it, so none is kept.
+DEFAULT_STORAGE_KB = 0
+
+
+def private_key_to_node_id(private_key: bytes) -> bytes:
+    """
+    Derive the Portal Network node ID of a client launched with the given private key.
+    """
+    public_key = PrivateKey(private_key).public_key.to_bytes()
+    return keccak(public_key)
 
 
-# TODO set data directory into a ramdisk to avoid disk contention
-#   especially when running >> 8 nodes
 @contextmanager
-def launch_trin(private_key: bytes, port: int):
+def launch_trin(
+    private_key: bytes,
+    port: int,
+    ready_timeout: float = DEFAULT_READY_TIMEOUT,
+    data_root: str = None,
+    storage_kb: int = DEFAULT_STORAGE_KB,
+):
     """
     Launch an instance of trin, yield a configured web3 & exit when context ends.
 
+    The web3 is only yielded once trin is ready to answer requests, see
+    :func:`launch_trin_nodes` for the other options.
+    """
+    with launch_trin_nodes(
+        [private_key], port, ready_timeout, data_root, storage_kb
+    ) as (w3,):
+        yield w3
+
+
+@contextmanager
+def launch_trin_nodes(
+    private_keys: Iterable[bytes],
+    first_port: int = 9000,
+    ready_timeout: float = DEFAULT_READY_TIMEOUT,
+    data_root: str = None,
+    storage_kb: int = DEFAULT_STORAGE_KB,
+    request_timeout: float = DEFAULT_REQUEST_TIMEOUT,
+):
+    """
+    Launch an instance of trin for each key, and yield their web3 links once all are ready.
+
+    Every node is spawned before waiting on any of them, so they all boot at
+    the same time, and launching many nodes takes about as long as launching
+    one. Then, each node is ready when its IPC socket exists, and it answers
+    a health check request.
+
+    With many nodes, their databases contend for the disk. To avoid that,
+    supply a data root on a ramdisk, like ``/dev/shm``. Each node then gets
+    its own data directory under it, which is deleted when the nodes exit.
+
+    :param private_keys: the private key of each node to launch
+    :param first_port: the discovery port of the first node, with each
+        following node using the next port up
+    :param ready_timeout: how long to wait for all nodes to be ready, in seconds
+    :param data_root: if supplied, the directory to create each node's data
+        directory in. Otherwise, trin picks its default data directory.
+    :param storage_kb: the cap on how much content each node stores, in kilobytes
+    :param request_timeout: how long to wait for each response from a node,
+        in seconds
+
+    :raise RuntimeError: if any node exits, or is not ready in time
+    """
+    private_keys = list(private_keys)
+    with ExitStack() as stack:
+        if data_root is None:
+            data_dirs = [None] * len(private_keys)
+        else:
+            data_dirs = stack.enter_context(
+                _node_data_dirs(data_root, private_keys, storage_kb)
+            )
+
+        start = time.monotonic()
+        nodes = [
+            stack.enter_context(
+                _run_trin(key, first_port + idx, data_dir, storage_kb, request_timeout)
+            )
+            for idx, (key, data_dir) in enumerate(zip(private_keys, data_dirs))
+        ]
+        spawn_seconds = time.monotonic() - start
+
+        ready_seconds = wait_until_ready(nodes, ready_timeout)
+        print(
+            f"Spawned {len(nodes)} trin nodes in {spawn_seconds:.2f}s, all ready after"
+            f" {time.monotonic() - start:.2f}s (fastest node {min(ready_seconds):.2f}s,"
+            f" slowest {max(ready_seconds):.2f}s)"
+        )
+
+        yield [w3 for w3, _ in nodes]
+
+
+def wait_until_ready(
+    nodes,
+    timeout: float = DEFAULT_READY_TIMEOUT,
+    clock=time.monotonic,
+    sleep=time.sleep,
+) -> List[float]:
+    """
+    Wait until every trin node's IPC socket is up, and the node answers a health check.
+
+    The nodes are all checked in turn, from a single thread, so waiting on
+    hundreds of nodes costs no more threads than waiting on one.
+
+    :param nodes: a (web3, process) for each node. The process is None if
+        the node was already running.
+    :param timeout: how long to wait for all nodes to be ready, in seconds
+
+    :return: how many seconds each node took to be ready, in order
+
+    :raise RuntimeError: if any node exits, or is not ready in time
+    """
+    start = clock()
+    ready_seconds = [0.0] * len(nodes)
+    pending = list(range(len(nodes)))
+    while pending:
+        still_pending = []
+        for idx in pending:
+            w3, trin_proc = nodes[idx]
+            if _is_ready(w3):
+                ready_seconds[idx] = clock() - start
+            elif trin_proc is not None and trin_proc.poll() is not None:
+                raise RuntimeError(
+                    f"trin at {w3.provider.ipc_path} exited with code"
+                    f" {trin_proc.returncode} before it was ready"
+                )
+            else:
+                still_pending.append(idx)
+
+        pending = still_pending
+        if pending:
+            if clock() - start > timeout:
+                raise RuntimeError(
+                    f"{len(pending)} of {len(nodes)} trin nodes were not ready"
+                    f" after {timeout}s"
+                )
+            sleep(_READY_POLL_INTERVAL)
+
+    return ready_seconds
+
+
+def _is_ready(w3) -> bool:
+    if not Path(w3.provider.ipc_path).exists():
+        return False
+
+    try:
+        if isinstance(w3.provider, PipelinedIPCProvider):
+            # Don't wait out the request timeout for a node that isn't listening
+            response = w3.provider.probe("web3_clientVersion", [], _READY_PROBE_TIMEOUT)
+        else:
+            response = w3.provider.make_request("web3_clientVersion", [])
+    except (OSError, TimeExhausted):
+        # The socket may exist before trin accepts connections on it
+        return False
+    else:
+        return "result" in response
+
+
+@contextmanager
+def _node_data_dirs(data_root, private_keys, storage_kb):
+    """
+    Create a data directory for each node under the root, and yield their paths.
+
+    When the context exits, report how much space the directories took up
+    altogether, which is memory when the root is a ramdisk, and delete them.
+    """
+    capacity = len(private_keys) * storage_kb * 1024
+    free_bytes = shutil.disk_usage(data_root).free
+    print(
+        f"Storing trin data in {data_root}, up to {capacity / 2**20:.1f} MB of content"
+        f" for {len(private_keys)} nodes, with {free_bytes / 2**20:.1f} MB free"
+    )
+    if capacity > free_bytes:
+        print(f"Warning: trin nodes may run out of space in {data_root}")
+
+    with tempfile.TemporaryDirectory(prefix="trin-bridge-", dir=data_root) as parent:
+        data_dirs = []
+        for private_key in private_keys:
+            data_dir = Path(parent) / private_key_to_node_id(private_key).hex()[:20]
+            data_dir.mkdir()
+            data_dirs.append(data_dir)
+
+        try:
+            yield data_dirs
+        finally:
+            print(
+                f"trin data directories in {data_root} took up"
+                f" {directory_bytes(parent) / 2**20:.1f} MB in total"
+            )
+
+
+def directory_bytes(path) -> int:
+    """
+    Total the space allocated to every file under the directory, recursively.
+    """
+    total = 0
+    for dir_path, _, file_names in os.walk(path):
+        for file_name in file_names:
+            try:
+                stat = os.lstat(os.path.join(dir_path, file_name))
+            except FileNotFoundError:
+                # Deleted by trin while walking
+                continue
+            total += stat.st_blocks * 512
+    return total
+
+
+@contextmanager
+def _run_trin(
+    private_key: bytes,
+    port: int,
+    data_dir: Path = None,
+    storage_kb: int = DEFAULT_STORAGE_KB,
+    request_timeout: float = DEFAULT_REQUEST_TIMEOUT,
+):
+    """
+    Spawn an instance of trin, without waiting for it to boot, and yield (web3, process).
+
     Modify the IPC path so that several nodes can run simultaneously, assuming
     their first 10 bytes of node ID are distinct.
 
-    The point of these importer nodes is not to host the data, but to broadcast
-    it. So keep a small cap on the data storage of 20 MB. 256 nodes * 20MB
-    would be only 5GB, which could fit on a ramdisk.
+    :param data_dir: the node's data directory, or None for trin's default
+    :param storage_kb: the cap on how much content the node stores, in kilobytes
+    :param request_timeout: how long to wait for each response, in seconds
     """
-    public_key = PrivateKey(private_key).public_key.to_bytes()
-    node_id_hex = keccak(public_key).hex()
+    node_id_hex = private_key_to_node_id(private_key).hex()
     ipc_path = f"/tmp/trin-jsonrpc-{node_id_hex[:20]}.ipc"
     private_key_hex = remove_0x_prefix(private_key.hex())
 
@@ -34,7 +266,7 @@ def launch_trin(private_key: bytes, port: int):
         "--discovery-port", str(port),
         "--unsafe-private-key", private_key_hex,
         "--web3-ipc-path", ipc_path,
-        "--kb", "0",
+        "--kb", str(storage_kb),
         "--networks", "history",
         "--bootnodes", "default",
         # fmt: on
@@ -44,16 +276,22 @@ def launch_trin(private_key: bytes, port: int):
         print(f"trin already running for {short_node_id}, skipping launch...")
         trin_proc = None
     else:
+        trin_env = {"TRIN_INFURA_PROJECT_ID": "1"}
+        if data_dir is None:
+            command = " ".join(trin_args)
+        else:
+            trin_env["TRIN_DATA_PATH"] = str(data_dir)
+            command = f"TRIN_DATA_PATH={data_dir} " + " ".join(trin_args)
+
         print(f"Launching trin with node ID {short_node_id} using...")
-        print(" ".join(trin_args))
-        trin_proc = subprocess.Popen(
-            trin_args,
-            env={"TRIN_INFURA_PROJECT_ID": "1"},
-        )
+        print(command)
+        trin_proc = subprocess.Popen(trin_args, env=trin_env)
 
+    provider = PipelinedIPCProvider(ipc_path, request_timeout)
     try:
-        yield Web3(Web3.IPCProvider(ipc_path))
+        yield Web3(provider), trin_proc
     finally:
+        provider.close()
         if trin_proc:
             print(f"Exiting trin with node ID {node_id_hex[:10]}...")
             trin_proc.send_signal(signal.SIGINT)
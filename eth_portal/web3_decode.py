@@ -1,3 +1,5 @@
+from bisect import bisect_right
+
 from eth.chains import MainnetChain
 from eth.rlp.headers import BlockHeader
 from eth.rlp.logs import Log
@@ -5,6 +7,94 @@ from eth.rlp.receipts import Receipt
 from eth.vm.forks.london.blocks import LondonBlockHeader
 from eth_utils import ValidationError, to_bytes, to_canonical_address, to_int
 from eth_utils.toolz import assoc
+import rlp
+
+from eth_portal.trie import ordered_trie_root
+
+# The first block number of each mainnet fork, in ascending order, alongside
+#   the VM that runs that fork. Bisect into these to find the rules for a block.
+_FORK_BLOCK_NUMBERS, _FORK_VM_CLASSES = zip(*MainnetChain.vm_configuration)
+
+
+def vm_class_for_block_number(block_number):
+    """
+    Get the VM class with the mainnet rules that apply to the given block number.
+
+    Equivalent to ``MainnetChain.get_vm_class_for_block_number()``, but only
+    bisects a precomputed index of fork block numbers.
+    """
+    fork_idx = bisect_right(_FORK_BLOCK_NUMBERS, block_number) - 1
+    if fork_idx < 0:
+        raise ValidationError(f"No mainnet fork defined for block #{block_number}")
+    return _FORK_VM_CLASSES[fork_idx]
+
+
+class DecodedBlock:
+    """
+    A web3 block, decoded into py-evm objects, along with their RLP encodings.
+
+    Encoding the header, block body and receipts of a block all need some of
+    the same decoded data. Each piece is computed the first time it's needed,
+    and then shared, so that each transaction is decoded and RLP-encoded
+    exactly once per block.
+    """
+
+    def __init__(self, web3_block_fields):
+        """
+        Wrap a web3 block, without decoding anything yet.
+
+        :param web3_block_fields: the result of a w3.eth.get_block() request,
+            with full transactions
+        """
+        self.block_fields = web3_block_fields
+        self._header = None
+        self._header_rlp = None
+        self._transactions = None
+        self._encoded_transactions = None
+        self._transactions_root = None
+
+    @property
+    def hash(self) -> bytes:
+        return self.block_fields.hash
+
+    @property
+    def number(self) -> int:
+        return self.block_fields.number
+
+    @property
+    def header(self):
+        if self._header is None:
+            self._header = block_fields_to_header(self.block_fields)
+        return self._header
+
+    @property
+    def header_rlp(self) -> bytes:
+        if self._header_rlp is None:
+            self._header_rlp = rlp.encode(self.header)
+        return self._header_rlp
+
+    @property
+    def transactions(self):
+        if self._transactions is None:
+            self._transactions = tuple(block_fields_to_transactions(self.block_fields))
+        return self._transactions
+
+    @property
+    def encoded_transactions(self):
+        if self._encoded_transactions is None:
+            self._encoded_transactions = tuple(
+                transaction.encode() for transaction in self.transactions
+            )
+        return self._encoded_transactions
+
+    @property
+    def transactions_root(self):
+        """
+        The transactions root, calculated from the decoded transactions.
+        """
+        if self._transactions_root is None:
+            self._transactions_root = ordered_trie_root(self.encoded_transactions)
+        return self._transactions_root
 
 
 def block_fields_to_header(web3_block_fields):
@@ -52,14 +142,47 @@ def _select_header_fields(block_fields):
         return base_fields
 
 
+def block_fields_to_transactions(web3_block_fields):
+    """
+    Convert all web3 transactions in a web3 block into rlp-serializable objects.
+
+    :param web3_block_fields: the result of a w3.eth.get_block() request,
+        with full transactions
+    """
+    return web3_results_to_transactions(
+        web3_block_fields.transactions, web3_block_fields.number
+    )
+
+
+def web3_results_to_transactions(web3_transactions, block_number):
+    """
+    Convert a list of web3 transactions, all in the same block, into rlp-serializable objects.
+
+    The transaction builder for the block's fork is only looked up once, and
+    reused for every transaction.
+    """
+    VM = vm_class_for_block_number(block_number)
+    TransactionBuilder = VM.block_class.transaction_builder
+    return [
+        _build_transaction(web3_transaction, TransactionBuilder)
+        for web3_transaction in web3_transactions
+    ]
+
+
 def web3_result_to_transaction(web3_transaction, block_number):
     """
     Convert a web3 transaction into an rlp-serializable object.
+
+    To convert all transactions in a block, :func:`block_fields_to_transactions`
+    is faster.
     """
     # Get appropriate Virtual Machine rules for given block number
-    VM = MainnetChain.get_vm_class_for_block_number(block_number)
+    VM = vm_class_for_block_number(block_number)
     TransactionBuilder = VM.block_class.transaction_builder
+    return _build_transaction(web3_transaction, TransactionBuilder)
+
 
+def _build_transaction(web3_transaction, TransactionBuilder):
     if web3_transaction.to:
         recipient = to_canonical_address(web3_transaction.to)
     else:
@@ -122,14 +245,32 @@ def _normalize_access_list(web3_transaction):
     ]
 
 
+def receipts_fields_to_receipts(web3_receipts, block_number):
+    """
+    Convert all web3 receipts of a block into rlp-serializable objects.
+
+    The receipt builder for the block's fork is only looked up once, and
+    reused for every receipt.
+    """
+    VM = vm_class_for_block_number(block_number)
+    ReceiptBuilder = VM.block_class.receipt_builder
+    return [_build_receipt(receipt, ReceiptBuilder) for receipt in web3_receipts]
+
+
 def receipt_fields_to_receipt(web3_receipt_fields, block_number):
     """
     Convert a web3 receipt into an rlp-serializable object.
+
+    To convert all receipts of a block, :func:`receipts_fields_to_receipts`
+    is faster.
     """
     # Get appropriate Virtual Machine rules for given block number
-    VM = MainnetChain.get_vm_class_for_block_number(block_number)
+    VM = vm_class_for_block_number(block_number)
     ReceiptBuilder = VM.block_class.receipt_builder
+    return _build_receipt(web3_receipt_fields, ReceiptBuilder)
+
 
+def _build_receipt(web3_receipt_fields, ReceiptBuilder):
     if "type" not in web3_receipt_fields or web3_receipt_fields.type == "0x0":
         return _build_legacy_receipt(web3_receipt_fields)
     else:
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+"""
+Measure the cost of converting web3 transactions into py-evm transactions.
+
+Compares converting each transaction on its own, which looks up the fork
+rules for every transaction, to converting a whole block at once, which
+looks them up once per block. The cost of the fork lookup alone is shown
+separately, because building the transaction itself dominates the total.
+
+The lookup gets much faster, but it was only ever a sliver of the cost of
+decoding, so the per-transaction decode time barely changes: the last line
+of the output shows by how much.
+
+Run from the root of the repository, so the test block can be found:
+```
+./scripts/benchmark_decode.py [num_transactions] [repeats]
+```
+"""
+
+from itertools import cycle, islice
+import sys
+import timeit
+
+from eth.chains import MainnetChain
+from hexbytes import HexBytes  # noqa: F401  # used by eval() of the example block
+from web3.datastructures import AttributeDict  # noqa: F401
+
+from eth_portal.web3_decode import (
+    block_fields_to_transactions,
+    vm_class_for_block_number,
+    web3_result_to_transaction,
+)
+
+EXAMPLE_BLOCK_PATH = "tests/full_block.example"
+
+
+def load_block(num_transactions):
+    with open(EXAMPLE_BLOCK_PATH) as f:
+        block = eval(f.readline().strip())
+
+    # Repeat the example transactions, to get a block of the requested size
+    transactions = list(islice(cycle(block.transactions), num_transactions))
+    return AttributeDict({**block, "transactions": transactions})
+
+
+def decode_each(block):
+    return [
+        web3_result_to_transaction(web3_transaction, block.number)
+        for web3_transaction in block.transactions
+    ]
+
+
+def decode_block(block):
+    return block_fields_to_transactions(block)
+
+
+def lookup_each_from_chain(block):
+    for _ in block.transactions:
+        MainnetChain.get_vm_class_for_block_number(block.number)
+
+
+def lookup_each(block):
+    for _ in block.transactions:
+        vm_class_for_block_number(block.number)
+
+
+def lookup_once(block):
+    vm_class_for_block_number(block.number)
+
+
+def benchmark(num_transactions, repeats):
+    block = load_block(num_transactions)
+    print(f"Block of {num_transactions} transactions, best of {repeats} runs")
+
+    micros = {}
+    for measured in (
+        lookup_each_from_chain,
+        lookup_each,
+        lookup_once,
+        decode_each,
+        decode_block,
+    ):
+        best = min(timeit.repeat(lambda: measured(block), number=1, repeat=repeats))
+        micros[measured] = best / num_transactions * 1e6
+        print(f"{measured.__name__:>22}: {micros[measured]:.3f} µs per transaction")
+
+    lookup_saving = micros[lookup_each_from_chain] - micros[lookup_once]
+    print(
+        f"The faster fork lookup saves {lookup_saving:.3f} µs per transaction,"
+        f" {lookup_saving / micros[decode_each]:.1%} of decoding it, which is"
+        " negligible: decode_each and decode_block differ only by noise."
+    )
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    num_transactions = int(args[0]) if len(args) > 0 else 500
+    repeats = int(args[1]) if len(args) > 1 else 100
+    benchmark(num_transactions, repeats)
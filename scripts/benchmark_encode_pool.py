@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+"""
+Measure how block encoding throughput scales with the number of encode processes.
+
+Encodes the example mainnet block many times from raw JSON, the same way a
+backfill with ``--encode-processes`` does.
+
+Run from the root of the repository, so the test block can be found:
+```
+./scripts/benchmark_encode_pool.py [num_blocks] [max_processes]
+```
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+import sys
+import time
+
+from eth_utils import encode_hex
+from hexbytes import HexBytes  # noqa: F401  # used by eval() of the example data
+from web3.datastructures import AttributeDict  # noqa: F401
+
+from eth_portal.bridge.history import encode_raw_block_content
+
+EXAMPLE_BLOCK_PATH = "tests/full_block_with_uncle.example"
+EXAMPLE_UNCLES_PATH = "tests/uncles_block14764013.example"
+EXAMPLE_RECEIPTS_PATH = "tests/receipts_block14764013.example"
+
+
+def _to_raw_json(value):
+    # Undo web3's result formatting, to get the JSON that a provider would return
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return value
+    elif isinstance(value, int):
+        return hex(value)
+    elif isinstance(value, bytes):
+        return encode_hex(value)
+    elif isinstance(value, (list, tuple)):
+        return [_to_raw_json(item) for item in value]
+    else:
+        return {key: _to_raw_json(item) for key, item in dict(value).items()}
+
+
+def load_raw_block():
+    def load_all(path):
+        with open(path) as f:
+            return [eval(line.strip()) for line in f]
+
+    (block,) = load_all(EXAMPLE_BLOCK_PATH)
+    raw = {
+        "block": block,
+        "uncles": load_all(EXAMPLE_UNCLES_PATH),
+        "receipts": load_all(EXAMPLE_RECEIPTS_PATH),
+    }
+    return json.dumps(_to_raw_json(raw)).encode()
+
+
+def benchmark(num_blocks, max_processes):
+    raw_block = load_raw_block()
+    print(f"Encoding {num_blocks} blocks of {len(raw_block) // 1024} KB raw JSON")
+
+    baseline = None
+    num_processes = 1
+    while num_processes <= max_processes:
+        with ProcessPoolExecutor(max_workers=num_processes) as pool:
+            # Warm up every process, so start-up time isn't measured
+            list(pool.map(encode_raw_block_content, [raw_block] * num_processes))
+
+            start = time.perf_counter()
+            list(pool.map(encode_raw_block_content, [raw_block] * num_blocks))
+            elapsed = time.perf_counter() - start
+
+        blocks_per_second = num_blocks / elapsed
+        if baseline is None:
+            baseline = blocks_per_second
+        print(
+            f"{num_processes:>3} processes: {blocks_per_second:.1f} blocks/s,"
+            f" {blocks_per_second / baseline:.1f}x"
+        )
+        num_processes *= 2
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    num_blocks = int(args[0]) if len(args) > 0 else 64
+    max_processes = int(args[1]) if len(args) > 1 else os.cpu_count()
+    benchmark(num_blocks, max_processes)
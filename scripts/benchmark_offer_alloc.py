@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+"""
+Measure the memory allocated to encode one content item, for an offer to every node.
+
+Compares building a JSON request string around the hex-encoded value for
+each node, like :class:`web3.IPCProvider` does, against hex-encoding the
+value once and sending it in parts, like
+:class:`~eth_portal.ipc.PipelinedIPCProvider` does.
+
+```
+./scripts/benchmark_offer_alloc.py [value_kb] [num_nodes]
+```
+"""
+
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from eth_portal.ipc import EncodedHex, _encode_request
+
+CONTENT_KEY_HEX = "0x01" + "ab" * 32
+
+
+def encode_json_requests(content_value, num_nodes):
+    content_value_hex = "0x" + content_value.hex()
+    return [
+        json.dumps(
+            {
+                "jsonrpc": "2.0",
+                "method": "portal_historyOffer",
+                "params": [CONTENT_KEY_HEX, content_value_hex],
+                "id": request_id,
+            }
+        ).encode()
+        for request_id in range(num_nodes)
+    ]
+
+
+def encode_request_parts(content_value, num_nodes):
+    content_value_hex = EncodedHex(content_value)
+    return [
+        _encode_request(
+            request_id, "portal_historyOffer", [CONTENT_KEY_HEX, content_value_hex]
+        )
+        for request_id in range(num_nodes)
+    ]
+
+
+def measure(encode, content_value, num_nodes):
+    tracemalloc.start()
+    start = time.perf_counter()
+    requests = encode(content_value, num_nodes)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del requests
+    return peak, elapsed
+
+
+def benchmark(value_kb, num_nodes):
+    content_value = os.urandom(value_kb * 1024)
+    print(f"Offering a {value_kb} KB value to {num_nodes} nodes")
+
+    for name, encode in (
+        ("JSON string per node", encode_json_requests),
+        ("hex encoded once", encode_request_parts),
+    ):
+        peak, elapsed = measure(encode, content_value, num_nodes)
+        print(
+            f"{name:>22}: {peak / 2**20:8.2f} MB allocated,"
+            f" {peak / len(content_value):6.1f} bytes per value byte,"
+            f" {elapsed * 1000:7.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    value_kb = int(args[0]) if len(args) > 0 else 2048
+    num_nodes = int(args[1]) if len(args) > 1 else 16
+    benchmark(value_kb, num_nodes)
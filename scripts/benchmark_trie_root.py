@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+"""
+Measure the cost of validating transactions and receipts roots.
+
+Compares building a full hexary trie with py-evm, which is how the roots used
+to be calculated, against calculating only the root of the ordered trie.
+
+Run from the root of the repository, so the test blocks can be found:
+```
+./scripts/benchmark_trie_root.py [num_items] [repeats]
+```
+"""
+
+from itertools import cycle, islice
+import sys
+import timeit
+
+from eth.db.trie import _make_trie_root_and_nodes
+from hexbytes import HexBytes  # noqa: F401  # used by eval() of the example data
+from web3.datastructures import AttributeDict  # noqa: F401
+
+from eth_portal.trie import ordered_trie_root
+from eth_portal.web3_decode import (
+    block_fields_to_transactions,
+    receipts_fields_to_receipts,
+)
+
+EXAMPLE_BLOCK_PATH = "tests/full_block_with_uncle.example"
+EXAMPLE_RECEIPTS_PATH = "tests/receipts_block14764013.example"
+
+
+def load_encoded_items(num_items):
+    with open(EXAMPLE_BLOCK_PATH) as f:
+        block = eval(f.readline().strip())
+    with open(EXAMPLE_RECEIPTS_PATH) as f:
+        web3_receipts = [eval(line.strip()) for line in f]
+
+    transactions = block_fields_to_transactions(block)
+    receipts = receipts_fields_to_receipts(web3_receipts, block.number)
+
+    # Repeat the example items, to get a block of the requested size
+    return {
+        "transactions": _repeat([txn.encode() for txn in transactions], num_items),
+        "receipts": _repeat([receipt.encode() for receipt in receipts], num_items),
+    }
+
+
+def _repeat(items, num_items):
+    return tuple(islice(cycle(items), num_items))
+
+
+def hexary_trie_root(encoded_items):
+    # Skip py-evm's cache of recent results, to measure the work of building the trie
+    root, _ = _make_trie_root_and_nodes.__wrapped__(encoded_items)
+    return root
+
+
+def benchmark(num_items, repeats):
+    print(f"Roots of {num_items} items, best of {repeats} runs")
+
+    for kind, encoded_items in load_encoded_items(num_items).items():
+        expected_root = hexary_trie_root(encoded_items)
+        for calculate in (hexary_trie_root, ordered_trie_root):
+            assert calculate(encoded_items) == expected_root
+            best = min(
+                timeit.repeat(
+                    lambda: calculate(encoded_items), number=1, repeat=repeats
+                )
+            )
+            print(f"{kind:>12} {calculate.__name__:>17}: {best * 1e3:.2f} ms")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    num_items = int(args[0]) if len(args) > 0 else 500
+    repeats = int(args[1]) if len(args) > 1 else 20
+    benchmark(num_items, repeats)
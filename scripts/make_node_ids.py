@@ -1,44 +1,94 @@
 #!/usr/bin/env python3
 
-"""
-Generate private keys and their associated Portal Network Node IDs.
+r"""
+Grind for private keys whose Portal Network node IDs are near a target.
 
-This is useful for grinding to find node IDs near a certain value.
+The target is either a hex prefix, which must be matched in full, or a whole
+node ID, along with how many leading bits of it must match. The search runs
+on every CPU core, printing its speed every few seconds, and prints only the
+closest keys it finds, as ``node_id private_key matching_bits``.
 
-For example, to generate a bunch of node IDs, then find the one closest to 0:
+For example, to find a node ID that starts with ``abcdef``, or the 4 closest
+to 0 that match at least 20 leading bits:
 ```
-./scripts/make_node_ids.py 100000 >>all_node_ids
-grep "^00" node_ids | sort | head -1
+./scripts/make_node_ids.py abcdef
+./scripts/make_node_ids.py 0x0000000000000000000000000000000000000000000000000000000000000000 \
+    --match-bits 20 --num-keys 4
 ```
 
-In the above example, one could sort without the grep and still be correct. We
-demonstrate with grep for two reasons:
+Each extra bit to match doubles the expected search time. Every 24 bits takes
+about 16 million keys.
 
-1. It's useful when you want to find an ID close to something other than 0.
-2. Even when looking for 0, it speeds things up noticeably, by avoiding sorting
-    the whole list.
+Keys are found by stepping through consecutive private keys, from a new random
+start for every 65,536 keys, which is much faster than generating each key
+independently. Consecutive keys are related, so only the closest key from each
+random start is kept, and keys found by the same run are unrelated.
 """
 
-import secrets
+from argparse import ArgumentParser
+import sys
+
+from eth_portal.grind import grind_node_ids
+
+NODE_ID_HEX_LENGTH = 64
+
+
+def parse_target(target_hex):
+    """
+    Parse a hex target, which may be a prefix, into a whole node ID.
+
+    :return: (target as an integer, how many bits the target's hex specifies)
+    """
+    target_hex = target_hex[2:] if target_hex.startswith("0x") else target_hex
+    if not target_hex or len(target_hex) > NODE_ID_HEX_LENGTH:
+        raise ValueError(f"Target must be 1 to {NODE_ID_HEX_LENGTH} hex characters")
+
+    target = int(target_hex.ljust(NODE_ID_HEX_LENGTH, "0"), 16)
+    return target, 4 * len(target_hex)
+
 
-from eth_keys.datatypes import PrivateKey
-from eth_utils import keccak
+def main(argv):
+    parser = ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("target", help="A hex node ID prefix, or a full node ID")
+    parser.add_argument(
+        "--match-bits",
+        type=int,
+        help="How many leading bits must match the target. Defaults to the whole prefix.",
+    )
+    parser.add_argument(
+        "--num-keys", type=int, default=1, help="How many keys to find. Defaults to 1."
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        help="How many processes to search with. Defaults to one per CPU core.",
+    )
+    parser.add_argument(
+        "--max-keys",
+        type=int,
+        help="Give up after trying this many keys, and print the closest found.",
+    )
+    args = parser.parse_args(argv)
 
+    try:
+        target, prefix_bits = parse_target(args.target)
+    except ValueError as exc:
+        parser.error(str(exc))
+    match_bits = prefix_bits if args.match_bits is None else args.match_bits
+    if not 0 <= match_bits <= 256:
+        parser.error("--match-bits must be between 0 and 256")
 
-def make_ids(num_nodes):
-    for _ in range(num_nodes):
-        private_key = secrets.token_bytes(32)
-        public_key = PrivateKey(private_key).public_key.to_bytes()
-        node_id = keccak(public_key)
-        print(node_id.hex(), private_key.hex())
+    found = grind_node_ids(
+        target,
+        match_bits,
+        args.num_keys,
+        args.processes,
+        args.max_keys,
+        report=lambda message: print(message, file=sys.stderr),
+    )
+    for key in found:
+        print(key.node_id.hex(), key.private_key.hex(), key.matching_bits)
 
 
 if __name__ == "__main__":
-    import sys
-
-    args = sys.argv
-    if len(args) != 2:
-        sys.exit("Must supply the number of node IDs you wish to generate")
-    else:
-        num_nodes = int(args[-1])
-        make_ids(num_nodes)
+    main(sys.argv[1:])
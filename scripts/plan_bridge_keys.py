@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+"""
+Plan a set of bridge keys whose node IDs evenly tile the Portal keyspace.
+
+Given a number of nodes, grind one private key for each equal slice of the
+keyspace, on every CPU core, and print them comma-separated, ready to use as
+PORTAL_BRIDGE_KEYS. The coverage of the keys is reported along the way.
+
+Keys are ground by stepping through consecutive private keys, from a new
+random start for every 65,536 keys. Consecutive keys are related, so only one
+key is planned from each random start, and the planned keys are unrelated.
+
+With --check, report on the coverage of the existing PORTAL_BRIDGE_KEYS
+instead, listing any node that is closest to more than its share of the
+keyspace, because there is a hole next to it.
+
+Run from the repository root, like:
+```
+export PORTAL_BRIDGE_KEYS=$(./scripts/plan_bridge_keys.py 64)
+./scripts/plan_bridge_keys.py --check
+```
+"""
+
+from argparse import ArgumentParser
+import sys
+
+from eth_portal.bridge.coverage import check_coverage
+from eth_portal.bridge.run import load_private_keys
+from eth_portal.grind import DEFAULT_PRECISION_BITS, grind_tiling
+from eth_portal.trin import private_key_to_node_id
+
+
+def report(message):
+    print(message, file=sys.stderr)
+
+
+def check_keys(keys):
+    node_ids = [private_key_to_node_id(key) for key in keys]
+    coverage = check_coverage(node_ids)
+    report(f"Coverage of {coverage.describe()}")
+    for idx in coverage.holes:
+        radius_bits = coverage.radii[idx].bit_length()
+        report(
+            f"  node {node_ids[idx].hex()[:16]}... (key #{idx}) is closest to content"
+            f" up to 2**{radius_bits} away"
+        )
+    return coverage
+
+
+def main(argv):
+    parser = ArgumentParser(description=__doc__.splitlines()[1])
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("num_nodes", nargs="?", type=int, help="How many keys to plan")
+    group.add_argument(
+        "--check",
+        action="store_true",
+        help="Report the coverage of the keys in PORTAL_BRIDGE_KEYS",
+    )
+    parser.add_argument(
+        "--precision-bits",
+        type=int,
+        default=DEFAULT_PRECISION_BITS,
+        help=(
+            "How near to the middle of its slice each node ID must be, as the number"
+            " of halvings of the slice width. Each extra bit doubles the search time."
+            f" Defaults to {DEFAULT_PRECISION_BITS}."
+        ),
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        help="How many processes to search with. Defaults to one per CPU core.",
+    )
+    args = parser.parse_args(argv)
+
+    if args.check:
+        coverage = check_keys(load_private_keys())
+        sys.exit(1 if coverage.holes else 0)
+
+    if args.num_nodes < 1:
+        parser.error("Must plan at least one key")
+
+    found = grind_tiling(
+        args.num_nodes, args.precision_bits, args.processes, report=report
+    )
+    keys = [key.private_key for key in found]
+    check_keys(keys)
+    print(",".join(key.hex() for key in keys))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
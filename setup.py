@@ -58,7 +58,10 @@ setup(
     url="https://github.com/ethereum/eth-portal",
     include_package_data=True,
     install_requires=[
-        "web3>=5.30.0,<6",
+        "requests>=2.16.0,<3",
+        # The bridge formats batched results with web3's private formatters,
+        #   so only accept the web3 releases that they have been checked against
+        "web3>=5.30.0,<5.32",
         "py-evm==0.5.0-alpha.3",
         "ssz>=0.3.0,<0.4.0",
     ],
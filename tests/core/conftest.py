@@ -4,6 +4,22 @@ from web3.datastructures import (  # noqa: F401; AttributeDict used by eval()
     AttributeDict,
 )
 
+
+class FakeClock:
+    """
+    A clock that only moves when told to, in seconds.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
 HEADER_FILES = [
     "tests/full_block.example",
     "tests/full_block_with_uncle.example",
@@ -43,3 +59,8 @@ def web3_block_and_receipts():
         web3_block,
         receipts,
     )
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
@@ -0,0 +1,110 @@
+import threading
+import time
+
+import pytest
+
+from eth_portal.bridge.adaptive import NodeOfferLimiter
+from eth_portal.bridge.metrics import NODES_DRAINED, OFFER_LIMIT
+
+
+def _make_limiter(clock, num_nodes=2, **kwargs):
+    labels = [f"node{idx}" for idx in range(num_nodes)]
+    return NodeOfferLimiter(labels, target_seconds=1, clock=clock, **kwargs)
+
+
+def _offer(limiter, position, seconds=0.1, num_peers=3):
+    started = limiter.acquire([position])
+    limiter.release(position, started, seconds, num_peers)
+
+
+def test_limit_rises_by_one_per_window_of_good_offers(clock):
+    limiter = _make_limiter(clock, initial_limit=4)
+    # Each good offer adds a quarter slot or so, shrinking as the limit grows
+    for _ in range(4):
+        _offer(limiter, 0)
+    assert limiter.limit(0) == 4
+    _offer(limiter, 0)
+
+    assert limiter.limit(0) == 5
+    assert limiter.limit(1) == 4
+    assert OFFER_LIMIT.value(node_id="node0") == 5
+
+
+@pytest.mark.parametrize(
+    "seconds, num_peers",
+    (
+        (0.1, None),  # failed
+        (2, 3),  # slower than the target
+    ),
+)
+def test_limit_halves_once_per_window_of_bad_offers(seconds, num_peers, clock):
+    limiter = _make_limiter(clock, initial_limit=8)
+
+    # Offers that were all in flight together only back off once
+    started = [limiter.acquire([0]) for _ in range(3)]
+    clock.now += 1
+    for start in started:
+        limiter.release(0, start, seconds, num_peers)
+    assert limiter.limit(0) == 4
+
+    # A new window backs off again, but never below the minimum
+    for _ in range(3):
+        clock.now += 1
+        _offer(limiter, 0, seconds, num_peers)
+    assert limiter.limit(0) == 1
+
+
+def test_isolated_node_is_drained_then_restored(clock):
+    limiter = _make_limiter(clock, initial_limit=4, drain_after=3, drain_seconds=60)
+
+    for _ in range(3):
+        _offer(limiter, 0, num_peers=0)
+
+    assert limiter.is_drained(0)
+    assert NODES_DRAINED.value() == 1
+    assert limiter.available([0, 1]) == [1]
+    # When every selected node is drained, offer to them anyway
+    assert limiter.available([0]) == [0]
+
+    clock.now += 60
+    assert limiter.available([0, 1]) == [0, 1]
+    assert limiter.limit(0) == 1
+    assert NODES_DRAINED.value() == 0
+
+
+def test_saturated_node_is_drained_only_at_the_lowest_limit(clock):
+    limiter = _make_limiter(clock, initial_limit=16, drain_after=3)
+
+    for _ in range(3):
+        clock.now += 1
+        _offer(limiter, 0, num_peers=None)
+    # Backing off might still be enough to recover
+    assert limiter.limit(0) == 2
+    assert not limiter.is_drained(0)
+
+    clock.now += 1
+    _offer(limiter, 0, num_peers=None)
+    assert limiter.is_drained(0)
+
+
+def test_acquire_waits_for_room_on_every_node():
+    limiter = _make_limiter(time.monotonic, initial_limit=1)
+    started = limiter.acquire([0])
+
+    acquired = threading.Event()
+
+    def acquire_both():
+        limiter.acquire([0, 1])
+        acquired.set()
+
+    thread = threading.Thread(target=acquire_both, daemon=True)
+    thread.start()
+    assert not acquired.wait(0.1)
+
+    limiter.release(0, started, 0.1, 3)
+    assert acquired.wait(1)
+
+
+def test_invalid_limits():
+    with pytest.raises(ValueError):
+        NodeOfferLimiter(["node0"], initial_limit=4, max_limit=2)
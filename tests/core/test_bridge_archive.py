@@ -0,0 +1,101 @@
+import pytest
+
+from eth_portal.bridge.archive import ArchiveWriter, ContentArchive
+from eth_portal.bridge.inject import inject_content, parse_content_keys
+from eth_portal.bridge.retry import RetryScheduler
+
+
+def _make_items(num_items):
+    return [
+        (bytes([idx % 3]) + idx.to_bytes(32, "big"), bytes([idx % 256]) * (idx % 700))
+        for idx in range(num_items)
+    ]
+
+
+@pytest.mark.parametrize("num_items", (0, 1, 2, 1000))
+def test_archive_round_trip(tmp_path, num_items):
+    path = tmp_path / "content.portalarchive"
+    items = _make_items(num_items)
+    with ArchiveWriter(path) as writer:
+        for content_key, content_value in items:
+            writer.add(content_key, content_value)
+
+    with ContentArchive(path) as archive:
+        assert len(archive) == num_items
+        for content_key, content_value in items:
+            with archive.get(content_key) as stored_value:
+                assert stored_value == content_value
+
+        assert archive.get(b"\x00" + bytes(32) + b"missing") is None
+        assert [key for key in archive.keys()] == [key for key, _ in items]
+
+
+def test_archive_keeps_latest_value(tmp_path):
+    path = tmp_path / "content.portalarchive"
+    with ArchiveWriter(path) as writer:
+        writer.add(b"\x00a", b"old")
+        writer.add(b"\x00b", b"other")
+        writer.add(b"\x00a", b"new")
+
+    with ContentArchive(path) as archive:
+        assert len(archive) == 2
+        assert bytes(archive.get(b"\x00a")) == b"new"
+        assert [(key, bytes(value)) for key, value in archive.items()] == [
+            (b"\x00b", b"other"),
+            (b"\x00a", b"new"),
+        ]
+
+
+def test_archive_not_written_on_error(tmp_path):
+    path = tmp_path / "content.portalarchive"
+    with pytest.raises(KeyboardInterrupt):
+        with ArchiveWriter(path) as writer:
+            writer.add(b"\x00a", b"value")
+            raise KeyboardInterrupt
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_archive_rejects_other_files(tmp_path):
+    path = tmp_path / "content.portalarchive"
+    path.write_bytes(b"not an archive, but long enough to have a header")
+    with pytest.raises(ValueError, match="not a content archive"):
+        ContentArchive(path)
+
+
+def test_inject_from_archive_and_files(tmp_path):
+    archive_path = tmp_path / "content.portalarchive"
+    archived_items = _make_items(10)
+    with ArchiveWriter(archive_path) as writer:
+        for content_key, content_value in archived_items:
+            writer.add(content_key, content_value)
+
+    file_key = b"\x01" + bytes(32)
+    file_path = tmp_path / f"{file_key.hex()}.portalcontent"
+    file_path.write_bytes(b"file value")
+
+    parsed_paths = tuple(parse_content_keys([archive_path, file_path]))
+    assert [key for key, _ in parsed_paths] == [key for key, _ in archived_items] + [
+        file_key
+    ]
+
+    pushed = {}
+
+    class StubInserter:
+        def push_history(self, content_key, content_value):
+            pushed[content_key] = bytes(content_value)
+            # Only the file reaches enough peers
+            return (3,) if content_key == file_key else (0,)
+
+    dead_letter_path = tmp_path / "failed.deadletter"
+    inject_content(
+        StubInserter(),
+        [archive_path, file_path],
+        dead_letter_path,
+        scheduler=RetryScheduler(max_attempts=1),
+    )
+
+    assert pushed == dict(archived_items + [(file_key, b"file value")])
+    assert dead_letter_path.read_text().splitlines() == [
+        f"{key.hex()} {archive_path}" for key, _ in archived_items
+    ]
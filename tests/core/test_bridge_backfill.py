@@ -0,0 +1,268 @@
+import random
+import threading
+import time
+
+from eth_utils import ValidationError
+from eth_utils.toolz import assoc
+import pytest
+from web3.datastructures import AttributeDict
+
+from eth_portal.bridge.archive import ContentArchive
+from eth_portal.bridge.backfill import (
+    iter_encoded_blocks,
+    pipelined_backfill,
+    serial_backfill,
+)
+from eth_portal.bridge.checkpoint import BackfillCheckpoint
+from eth_portal.bridge.export import export_block_range
+from eth_portal.bridge.history import encode_block_content
+from eth_portal.bridge.inject import parse_content_keys
+from eth_portal.bridge.store import ContentStore
+
+
+class StubEth:
+    """
+    Serve the same block, uncles and receipts for every request, with random delays.
+    """
+
+    def __init__(self, web3_block, web3_uncles, web3_receipts):
+        self.requests = 0
+        self._block = web3_block
+        self._uncles = {uncle.hash: uncle for uncle in web3_uncles}
+        self._receipts = {receipt.transactionHash: receipt for receipt in web3_receipts}
+
+    def get_block(self, block_id, full_transactions=False):
+        self.requests += 1
+        time.sleep(random.random() / 100)
+        if block_id in self._uncles:
+            return self._uncles[block_id]
+        else:
+            return self._block
+
+    def wait_for_transaction_receipt(self, txn_hash, poll_latency):
+        return self._receipts[txn_hash]
+
+
+class StubWeb3:
+    # Not an HTTP provider, so blocks are fetched without batching
+    provider = None
+
+    def __init__(self, *args):
+        self.eth = StubEth(*args)
+
+
+class RecordingInserter:
+    def __init__(self, fail_after=None, peers=3):
+        self.pushed = []
+        self.offered_blocks = set()
+        self._fail_after = fail_after
+        self._peers = peers
+
+    def push_history(self, content_key, content_value):
+        if len(self.pushed) == self._fail_after:
+            raise KeyboardInterrupt
+        self.pushed.append(content_key)
+        return (self._peers,)
+
+    def was_block_offered(self, header_hash):
+        return header_hash in self.offered_blocks
+
+
+@pytest.fixture
+def stub_w3(web3_block_and_uncles, web3_block_and_receipts):
+    web3_block, web3_uncles = web3_block_and_uncles
+    _, web3_receipts = web3_block_and_receipts
+    return StubWeb3(web3_block, web3_uncles, web3_receipts)
+
+
+@pytest.mark.parametrize("fetch_workers", (1, 4))
+def test_pipelined_backfill_pushes_all_content(stub_w3, fetch_workers):
+    inserter = RecordingInserter()
+    pipelined_backfill(inserter, range(10), stub_w3, fetch_workers=fetch_workers)
+
+    # A header, body and receipts content item for each block
+    assert len(inserter.pushed) == 30
+    assert {key[0] for key in inserter.pushed} == {0, 1, 2}
+
+
+def test_pipeline_ordered_output(stub_w3):
+    block_numbers = list(range(100, 140))
+    encoded_blocks = iter_encoded_blocks(
+        block_numbers, stub_w3, fetch_workers=8, ordered=True, queue_size=2
+    )
+
+    pushed_numbers = [block_number for block_number, _ in encoded_blocks]
+    assert pushed_numbers == block_numbers
+
+
+def test_ordered_pipeline_stops_fetching_behind_a_stalled_block(stub_w3):
+    stalled = threading.Event()
+    fetched_numbers = []
+    get_block = stub_w3.eth.get_block
+
+    def get_stalling_block(block_id, full_transactions=False):
+        if isinstance(block_id, int):
+            fetched_numbers.append(block_id)
+            if block_id == 0:
+                stalled.wait()
+        return get_block(block_id, full_transactions)
+
+    stub_w3.eth.get_block = get_stalling_block
+    encoded_blocks = iter_encoded_blocks(
+        range(100),
+        stub_w3,
+        fetch_workers=8,
+        ordered=True,
+        queue_size=4,
+        fetch_window=1,
+    )
+    reader = threading.Thread(target=lambda: list(encoded_blocks), daemon=True)
+    reader.start()
+
+    # Blocks after the stalled one can't pile up, waiting to be emitted
+    time.sleep(0.3)
+    assert len(fetched_numbers) == 4
+
+    stalled.set()
+    reader.join(5)
+    assert sorted(fetched_numbers) == list(range(100))
+
+
+def test_pipelined_backfill_raises_stage_failure(stub_w3):
+    bad_block = AttributeDict(assoc(stub_w3.eth._block, "hash", b"X" * 32))
+    stub_w3.eth._block = bad_block
+
+    inserter = RecordingInserter()
+    with pytest.raises(ValidationError):
+        pipelined_backfill(inserter, range(10), stub_w3, fetch_workers=4)
+
+    assert inserter.pushed == []
+
+
+def test_pipelined_backfill_reuses_stored_content(stub_w3, tmp_path):
+    first_inserter = RecordingInserter()
+    with ContentStore(tmp_path / "content.db") as store:
+        pipelined_backfill(
+            first_inserter, [14764013], stub_w3, fetch_workers=2, content_store=store
+        )
+        assert stub_w3.eth.requests > 0
+
+        stub_w3.eth.requests = 0
+        second_inserter = RecordingInserter()
+        pipelined_backfill(
+            second_inserter, [14764013], stub_w3, fetch_workers=2, content_store=store
+        )
+
+    assert stub_w3.eth.requests == 0
+    assert second_inserter.pushed == first_inserter.pushed
+
+
+@pytest.mark.parametrize(
+    "backfill",
+    (
+        serial_backfill,
+        lambda *args, **kwargs: pipelined_backfill(*args, fetch_workers=2, **kwargs),
+    ),
+    ids=("serial", "pipelined"),
+)
+def test_backfill_skips_offered_blocks(stub_w3, backfill):
+    inserter = RecordingInserter()
+    inserter.offered_blocks.add(stub_w3.eth._block.hash)
+
+    backfill(inserter, range(3), stub_w3)
+
+    assert inserter.pushed == []
+
+
+@pytest.mark.parametrize(
+    "backfill",
+    (
+        serial_backfill,
+        lambda *args, **kwargs: pipelined_backfill(
+            *args, fetch_workers=3, ordered=True, **kwargs
+        ),
+    ),
+    ids=("serial", "pipelined"),
+)
+def test_backfill_resumes_from_checkpoint(stub_w3, tmp_path, backfill):
+    with BackfillCheckpoint(tmp_path / "backfill.checkpoint") as checkpoint:
+        # Interrupt after pushing 4 blocks, and part of the 5th
+        interrupted_inserter = RecordingInserter(fail_after=13)
+        with pytest.raises(KeyboardInterrupt):
+            backfill(interrupted_inserter, range(10), stub_w3, checkpoint=checkpoint)
+
+        assert checkpoint.count_complete(0, 9) == 4
+        assert checkpoint.offered_types(4) == {0}
+
+        resumed_inserter = RecordingInserter()
+        backfill(
+            resumed_inserter, range(10), stub_w3, checkpoint=checkpoint, resume=True
+        )
+
+        assert len(resumed_inserter.pushed) == 30 - 13
+        assert checkpoint.count_complete(0, 9) == 10
+
+
+@pytest.mark.parametrize(
+    "backfill",
+    (
+        serial_backfill,
+        lambda *args, **kwargs: pipelined_backfill(*args, fetch_workers=2, **kwargs),
+    ),
+    ids=("serial", "pipelined"),
+)
+def test_checkpoint_skips_content_that_reached_too_few_peers(
+    stub_w3, tmp_path, backfill
+):
+    with BackfillCheckpoint(tmp_path / "backfill.checkpoint") as checkpoint:
+        # Like trin nodes that are down, or isolated from the network
+        backfill(RecordingInserter(peers=0), range(3), stub_w3, checkpoint=checkpoint)
+
+        assert checkpoint.count_complete(0, 2) == 0
+        assert checkpoint.offered_types(0) == frozenset()
+
+        resumed_inserter = RecordingInserter()
+        backfill(
+            resumed_inserter, range(3), stub_w3, checkpoint=checkpoint, resume=True
+        )
+
+        assert len(resumed_inserter.pushed) == 9
+        assert checkpoint.count_complete(0, 2) == 3
+
+
+def test_export_block_range(
+    stub_w3, tmp_path, web3_block_and_uncles, web3_block_and_receipts
+):
+    web3_block, web3_uncles = web3_block_and_uncles
+    _, web3_receipts = web3_block_and_receipts
+    export_dir = tmp_path / "exported"
+
+    num_written = export_block_range(range(5), stub_w3, export_dir, fetch_workers=2)
+
+    # The stub serves the same block every time, so the files are overwritten
+    assert num_written == 15
+    exported_paths = sorted(export_dir.iterdir())
+    assert len(exported_paths) == 3
+
+    # The exported files are ready for the content injector
+    exported = {
+        content_key: path.read_bytes()
+        for content_key, path in parse_content_keys(exported_paths)
+    }
+    expected = encode_block_content(web3_block, web3_uncles, web3_receipts)
+    assert exported == dict(expected)
+
+
+def test_export_block_range_to_archive(
+    stub_w3, tmp_path, web3_block_and_uncles, web3_block_and_receipts
+):
+    web3_block, web3_uncles = web3_block_and_uncles
+    _, web3_receipts = web3_block_and_receipts
+    archive_path = tmp_path / "exported.portalarchive"
+
+    export_block_range(range(5), stub_w3, archive_path, fetch_workers=2)
+
+    expected = encode_block_content(web3_block, web3_uncles, web3_receipts)
+    with ContentArchive(archive_path) as archive:
+        exported = {key: bytes(value) for key, value in archive.items()}
+    assert exported == dict(expected)
@@ -0,0 +1,40 @@
+from eth_portal.bridge.checkpoint import BackfillCheckpoint
+from eth_portal.portal_encode import (
+    block_body_content_key,
+    header_content_key,
+    receipt_content_key,
+)
+
+HEADER_HASH = b"H" * 32
+
+
+def test_checkpoint_records_content_types(tmp_path):
+    with BackfillCheckpoint(tmp_path / "backfill.checkpoint") as checkpoint:
+        assert checkpoint.offered_types(1) == frozenset()
+
+        checkpoint.record(1, header_content_key(HEADER_HASH))
+        checkpoint.record(1, receipt_content_key(HEADER_HASH))
+        assert checkpoint.offered_types(1) == {0, 2}
+        assert not checkpoint.is_complete(1)
+
+        checkpoint.record(1, block_body_content_key(HEADER_HASH))
+        assert checkpoint.is_complete(1)
+        assert not checkpoint.is_complete(2)
+
+
+def test_checkpoint_persists(tmp_path):
+    path = tmp_path / "backfill.checkpoint"
+    with BackfillCheckpoint(path) as checkpoint:
+        for block_number in range(10, 20):
+            for make_key in (
+                header_content_key,
+                block_body_content_key,
+                receipt_content_key,
+            ):
+                checkpoint.record(block_number, make_key(HEADER_HASH))
+        checkpoint.record(20, header_content_key(HEADER_HASH))
+
+    with BackfillCheckpoint(path) as checkpoint:
+        assert checkpoint.count_complete(0, 100) == 10
+        assert checkpoint.count_complete(15, 17) == 3
+        assert checkpoint.offered_types(20) == {0}
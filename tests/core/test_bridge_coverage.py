@@ -0,0 +1,59 @@
+import random
+
+import pytest
+
+from eth_portal.bridge.coverage import KEYSPACE_SIZE, check_coverage
+from eth_portal.bridge.routing import NodeIdIndex
+
+PREFIX_BITS = 6
+LOW_BITS = 256 - PREFIX_BITS
+
+
+def _node_id(prefix):
+    return (prefix << LOW_BITS).to_bytes(32, "big")
+
+
+def test_even_tiling_has_no_holes():
+    node_ids = [_node_id(prefix << 2) for prefix in range(16)]
+    coverage = check_coverage(node_ids)
+
+    assert coverage.radii == (KEYSPACE_SIZE // 16 - 1,) * 16
+    assert coverage.ideal_radius == KEYSPACE_SIZE // 16 - 1
+    assert coverage.holes == ()
+    assert coverage.max_gap == KEYSPACE_SIZE // 16
+    assert "0 nodes covering a hole" in coverage.describe()
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_radius_matches_routing(seed):
+    rng = random.Random(seed)
+    prefixes = rng.sample(range(2**PREFIX_BITS), rng.randint(1, 12))
+    node_ids = [_node_id(prefix) for prefix in prefixes]
+    coverage = check_coverage(node_ids)
+
+    # Route content from every prefix, at the furthest point in each prefix
+    index = NodeIdIndex(node_ids)
+    expected_radii = [0] * len(node_ids)
+    for prefix in range(2**PREFIX_BITS):
+        content_id = (prefix << LOW_BITS) | (2**LOW_BITS - 1)
+        (closest,) = index.closest(content_id, 1)
+        distance = content_id ^ (prefixes[closest] << LOW_BITS)
+        expected_radii[closest] = max(expected_radii[closest], distance)
+
+    assert coverage.radii == tuple(expected_radii)
+
+
+def test_holes_and_gaps():
+    # Two nodes share the third quarter, leaving them to cover the empty last one
+    node_ids = [_node_id(0), _node_id(16), _node_id(32), _node_id(33)]
+    coverage = check_coverage(node_ids)
+
+    assert coverage.holes == (2, 3)
+    assert coverage.radii[2] == KEYSPACE_SIZE // 2 - 1 - 2**LOW_BITS
+    assert coverage.radii[0] == coverage.ideal_radius
+    assert coverage.max_gap == (64 - 33) << LOW_BITS
+
+
+def test_no_node_ids():
+    with pytest.raises(ValueError):
+        check_coverage([])
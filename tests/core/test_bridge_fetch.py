@@ -0,0 +1,193 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+
+from eth_utils import encode_hex
+from hexbytes import HexBytes
+import pytest
+from web3 import Web3
+
+from eth_portal.bridge import fetch
+from eth_portal.bridge.backfill import pipelined_backfill
+from eth_portal.bridge.fetch import BatchFetcher, parse_raw_block
+from eth_portal.bridge.history import encode_block_content, encode_raw_block_content
+from eth_portal.bridge.metrics import ENCODE_SECONDS
+
+
+def _to_raw_json(value):
+    """
+    Undo web3's result formatting, to get the JSON that a provider would return.
+    """
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return value
+    elif isinstance(value, int):
+        return hex(value)
+    elif isinstance(value, (bytes, HexBytes)):
+        return encode_hex(value)
+    elif isinstance(value, (list, tuple)):
+        return [_to_raw_json(item) for item in value]
+    else:
+        return {key: _to_raw_json(item) for key, item in dict(value).items()}
+
+
+class StubJsonRpcHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server.posted.append(body)
+
+        if isinstance(body, list):
+            response = [server.respond(request) for request in body]
+        else:
+            response = server.respond(body)
+
+        encoded = json.dumps(response).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubJsonRpcServer(ThreadingHTTPServer):
+    def __init__(self, web3_block, web3_uncles, web3_receipts, block_receipts):
+        super().__init__(("127.0.0.1", 0), StubJsonRpcHandler)
+        self.posted = []
+        self.block_receipts = block_receipts
+
+        self._block = _to_raw_json(web3_block)
+        self._uncles = {encode_hex(u.hash): _to_raw_json(u) for u in web3_uncles}
+        self._receipts = {
+            encode_hex(r.transactionHash): _to_raw_json(r) for r in web3_receipts
+        }
+
+    def respond(self, request):
+        method, params = request["method"], request["params"]
+        if method == "eth_getBlockByNumber":
+            result = self._block
+        elif method == "eth_getBlockByHash":
+            result = self._uncles[params[0]]
+        elif method == "eth_getTransactionReceipt":
+            result = self._receipts[params[0]]
+        elif method == "eth_getBlockReceipts" and self.block_receipts:
+            result = list(self._receipts.values())
+        else:
+            return {
+                "jsonrpc": "2.0",
+                "id": request["id"],
+                "error": {"code": -32601, "message": "method not found"},
+            }
+        return {"jsonrpc": "2.0", "id": request["id"], "result": result}
+
+
+@pytest.fixture(params=(True, False), ids=("block-receipts", "txn-receipts"))
+def stub_server(request, web3_block_and_uncles, web3_block_and_receipts, monkeypatch):
+    monkeypatch.setattr(fetch, "_BLOCK_RECEIPTS_SUPPORT", {})
+
+    web3_block, web3_uncles = web3_block_and_uncles
+    _, web3_receipts = web3_block_and_receipts
+    server = StubJsonRpcServer(web3_block, web3_uncles, web3_receipts, request.param)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def stub_w3(stub_server):
+    host, port = stub_server.server_address
+    return Web3(Web3.HTTPProvider(f"http://{host}:{port}"))
+
+
+def test_fetch_block_window(
+    stub_server, stub_w3, web3_block_and_uncles, web3_block_and_receipts
+):
+    web3_block, web3_uncles = web3_block_and_uncles
+    _, web3_receipts = web3_block_and_receipts
+
+    fetched = BatchFetcher(stub_w3).fetch_blocks([1, 2, 3])
+
+    assert len(fetched) == 3
+    for block_fields, fetched_uncles, fetched_receipts in fetched:
+        assert block_fields == web3_block
+        assert fetched_uncles == web3_uncles
+        assert fetched_receipts == web3_receipts
+
+        # Formatted well enough to validate against the header
+        encode_block_content(block_fields, fetched_uncles, fetched_receipts)
+
+    batches = [body for body in stub_server.posted if isinstance(body, list)]
+    if stub_server.block_receipts:
+        # Blocks, the probe for eth_getBlockReceipts, then uncles & receipts
+        assert len(stub_server.posted) == 3
+        assert len(batches[-1]) == 3 * (len(web3_uncles) + 1)
+    else:
+        assert len(stub_server.posted) == 3
+        assert len(batches[-1]) == 3 * (len(web3_uncles) + len(web3_receipts))
+
+
+def test_fetch_raises_on_error(stub_w3):
+    with pytest.raises(ValueError, match="method not found"):
+        BatchFetcher(stub_w3).request_batch([("eth_unknownMethod", [])])
+
+
+def test_fetch_raw_blocks(stub_w3, web3_block_and_uncles, web3_block_and_receipts):
+    web3_block, web3_uncles = web3_block_and_uncles
+    _, web3_receipts = web3_block_and_receipts
+
+    raw_blocks = BatchFetcher(stub_w3).fetch_raw_blocks([1, 2])
+
+    assert len(raw_blocks) == 2
+    for raw_block in raw_blocks:
+        assert isinstance(raw_block, bytes)
+        assert parse_raw_block(raw_block) == (web3_block, web3_uncles, web3_receipts)
+
+
+def test_encode_raw_block_content(stub_w3, web3_block_and_uncles):
+    web3_block, _ = web3_block_and_uncles
+    fetcher = BatchFetcher(stub_w3)
+    (raw_block,) = fetcher.fetch_raw_blocks([1])
+    (fetched,) = fetcher.fetch_blocks([1])
+
+    header_hash, content_items, encode_times = encode_raw_block_content(raw_block)
+
+    assert header_hash == web3_block.hash
+    assert content_items == encode_block_content(*fetched)
+    assert [labels["content_type"] for _, labels in encode_times] == [
+        "header",
+        "block_body",
+        "receipts",
+    ]
+
+
+def test_pipelined_backfill_encode_processes(stub_w3):
+    pushed = []
+    headers_timed_before = ENCODE_SECONDS.count(content_type="header")
+
+    class ListInserter:
+        def push_history(self, content_key, content_value):
+            pushed.append((content_key, content_value))
+
+        def was_block_offered(self, header_hash):
+            return False
+
+    pipelined_backfill(
+        ListInserter(),
+        range(6),
+        stub_w3,
+        fetch_workers=2,
+        ordered=True,
+        fetch_window=2,
+        encode_processes=2,
+    )
+
+    # Encode times from the worker processes are recorded in this one
+    assert ENCODE_SECONDS.count(content_type="header") == headers_timed_before + 6
+
+    # The stub provider returns the same block for every block number
+    (fetched,) = BatchFetcher(stub_w3).fetch_blocks([0])
+    assert pushed == list(encode_block_content(*fetched)) * 6
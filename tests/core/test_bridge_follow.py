@@ -0,0 +1,195 @@
+import asyncio
+import json
+import time
+
+from web3.datastructures import AttributeDict
+
+from eth_portal.bridge import follow
+from eth_portal.bridge.follow import Head, HeadFollower, HeadLatency
+
+
+class StubEth:
+    def get_block(self, block_id, full_transactions=False):
+        if isinstance(block_id, bytes):
+            number = int.from_bytes(block_id, "big")
+        else:
+            number = block_id
+        return AttributeDict({"number": number, "timestamp": int(time.time())})
+
+
+class StubWeb3:
+    eth = StubEth()
+
+
+class ScriptedFollower(HeadFollower):
+    """
+    Follow a fixed list of heads, instead of a live chain.
+    """
+
+    def __init__(self, heads, head_delay=0, **kwargs):
+        super().__init__(StubWeb3(), None, **kwargs)
+        self._heads = heads
+        self._head_delay = head_delay
+
+    async def _watch_heads(self):
+        for number in self._heads:
+            yield Head(number, number.to_bytes(32, "big"), time.time())
+            await asyncio.sleep(self._head_delay)
+
+
+def test_follower_backfills_gaps(monkeypatch):
+    published = []
+
+    def record_block(w3, portal_inserter, block_fields, content_store, fetcher):
+        time.sleep(0.01)
+        published.append(block_fields.number)
+
+    monkeypatch.setattr(follow, "propagate_block", record_block)
+
+    follower = ScriptedFollower([10, 11, 14, 15, 15, 20], max_in_flight=3)
+    asyncio.run(follower.run())
+
+    # Block 15 is seen twice, as though re-orged, so it is published twice
+    assert sorted(published) == list(range(10, 16)) + [15] + list(range(16, 21))
+    assert follower.latency.count == 11
+
+
+def test_follower_reuses_one_fetcher(monkeypatch):
+    fetchers = []
+
+    def record_fetcher(w3, portal_inserter, block_fields, content_store, fetcher):
+        fetchers.append(fetcher)
+
+    monkeypatch.setattr(follow, "propagate_block", record_fetcher)
+
+    follower = ScriptedFollower([1, 5])
+    asyncio.run(follower.run())
+
+    assert len(fetchers) == 5
+    assert len(set(map(id, fetchers))) == 1
+
+
+def test_follower_limits_blocks_in_flight(monkeypatch):
+    in_flight = []
+    max_in_flight = []
+
+    def record_block(w3, portal_inserter, block_fields, content_store, fetcher):
+        in_flight.append(block_fields.number)
+        max_in_flight.append(len(in_flight))
+        time.sleep(0.02)
+        in_flight.remove(block_fields.number)
+
+    monkeypatch.setattr(follow, "propagate_block", record_block)
+
+    follower = ScriptedFollower([1, 20], max_in_flight=2)
+    asyncio.run(follower.run())
+
+    assert len(max_in_flight) == 20
+    assert max(max_in_flight) == 2
+
+
+def test_follower_survives_failed_block(monkeypatch):
+    published = []
+
+    def fail_on_even(w3, portal_inserter, block_fields, content_store, fetcher):
+        if block_fields.number % 2 == 0:
+            raise ValueError("provider hiccup")
+        published.append(block_fields.number)
+
+    monkeypatch.setattr(follow, "propagate_block", fail_on_even)
+
+    follower = ScriptedFollower([1, 2, 3, 4, 5])
+    asyncio.run(follower.run())
+
+    assert sorted(published) == [1, 3, 5]
+
+
+def test_follower_retries_failed_block(monkeypatch):
+    published = []
+    attempts = []
+
+    def fail_twice_on_2(w3, portal_inserter, block_fields, content_store, fetcher):
+        attempts.append(block_fields.number)
+        if block_fields.number == 2 and attempts.count(2) < 3:
+            raise ValueError("provider hiccup")
+        published.append(block_fields.number)
+
+    monkeypatch.setattr(follow, "propagate_block", fail_twice_on_2)
+
+    follower = ScriptedFollower([1, 2, 3, 4, 5], head_delay=0.05)
+    asyncio.run(follower.run())
+
+    assert sorted(published) == [1, 2, 3, 4, 5]
+    assert attempts.count(2) == 3
+
+
+def test_follower_gives_up_on_block_after_max_attempts(monkeypatch):
+    attempts = []
+
+    def fail_on_2(w3, portal_inserter, block_fields, content_store, fetcher):
+        attempts.append(block_fields.number)
+        if block_fields.number == 2:
+            raise ValueError("bad block")
+
+    monkeypatch.setattr(follow, "propagate_block", fail_on_2)
+
+    follower = ScriptedFollower(list(range(1, 10)), head_delay=0.05)
+    asyncio.run(follower.run())
+
+    assert attempts.count(2) == follow.MAX_PUBLISH_ATTEMPTS
+
+
+class StubSubscription:
+    def __init__(self, messages):
+        self._messages = messages
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def send(self, message):
+        pass
+
+    async def __aiter__(self):
+        for message in self._messages:
+            yield json.dumps(message)
+
+
+def test_subscription_reconnects_after_refused_connection(monkeypatch):
+    notification = {
+        "jsonrpc": "2.0",
+        "method": "eth_subscription",
+        "params": {"result": {"number": "0x7", "hash": "0x" + "07" * 32}},
+    }
+    connections = []
+
+    def connect(uri):
+        connections.append(uri)
+        if len(connections) == 1:
+            raise ConnectionRefusedError("provider restarting")
+        return StubSubscription([notification])
+
+    monkeypatch.setattr(follow.websockets, "connect", connect)
+    monkeypatch.setattr(follow, "MIN_POLL_SECONDS", 0)
+
+    follower = HeadFollower(StubWeb3(), None, subscribe_uri="ws://stub")
+
+    async def first_head():
+        return await follower._subscribe_heads().__anext__()
+
+    head = asyncio.run(first_head())
+
+    assert (head.number, head.hash) == (7, b"\x07" * 32)
+    assert len(connections) == 2
+
+
+def test_latency_window():
+    latency = HeadLatency(window=2)
+    now = time.time()
+    for number in range(5):
+        latency.record(number, int(now), now)
+
+    assert latency.count == 2
+    assert "over last 2 blocks" in latency.summary()
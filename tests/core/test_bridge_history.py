@@ -7,8 +7,10 @@ from web3.datastructures import AttributeDict
 from eth_portal.bridge.history import (
     block_fields_to_content,
     encode_block_body_content,
+    encode_decoded_block_body_content,
     encode_receipts_content,
 )
+from eth_portal.web3_decode import DecodedBlock
 
 EXPECTED_CONTENT_BY_HASH = {
     HexBytes("0xe137900645bb727b8cd3d2bca2e1af46a9270fb59feb08969668a322583f8af7"): (
@@ -112,6 +114,23 @@ def test_block_body_content(web3_block_and_uncles):
     )  # noqa: E501
 
 
+def test_decoded_block_body_content(web3_block_and_uncles):
+    web3_block, web3_uncles = web3_block_and_uncles
+    expected_content = encode_block_body_content(
+        web3_block.transactions,
+        web3_uncles,
+        web3_block.hash,
+        web3_block.number,
+        web3_block.transactionsRoot,
+        web3_block.sha3Uncles,
+    )
+
+    decoded_block = DecodedBlock(web3_block)
+    assert encode_decoded_block_body_content(decoded_block, web3_uncles) == (
+        expected_content
+    )
+
+
 def test_bad_uncle_in_block_body_content(web3_block_and_uncles):
     web3_block, web3_uncles = web3_block_and_uncles
 
@@ -0,0 +1,103 @@
+from eth_utils import ValidationError
+import pytest
+
+from eth_portal.bridge.archive import ArchiveWriter
+from eth_portal.bridge.inject import (
+    inject_content,
+    iter_content_paths,
+    parse_content_keys,
+)
+
+
+class StubInserter:
+    def __init__(self):
+        self.pushed = {}
+
+    def push_history(self, content_key, content_value):
+        self.pushed[content_key] = bytes(content_value)
+        return (3,)
+
+
+def _write_content_file(directory, content_key, content_value):
+    directory.mkdir(parents=True, exist_ok=True)
+    (directory / f"{content_key.hex()}.portalcontent").write_bytes(content_value)
+
+
+@pytest.fixture
+def content_dir(tmp_path):
+    root = tmp_path / "content"
+    _write_content_file(root, b"\x00\x01", b"top")
+    _write_content_file(root / "nested" / "deeper", b"\x00\x02", b"nested")
+    with ArchiveWriter(root / "nested" / "packed.portalarchive") as writer:
+        writer.add(b"\x00\x03", b"archived")
+
+    # Files that aren't content, or are only partially written, are skipped
+    (root / "README").write_text("not content")
+    (root / "nested" / "0004.portalcontent.partial").write_bytes(b"partial")
+    return root
+
+
+EXPECTED_CONTENT = {
+    b"\x00\x01": b"top",
+    b"\x00\x02": b"nested",
+    b"\x00\x03": b"archived",
+}
+
+
+def test_inject_directory(content_dir):
+    inserter = StubInserter()
+    inject_content(inserter, [str(content_dir)])
+    assert inserter.pushed == EXPECTED_CONTENT
+
+
+def test_inject_glob(content_dir):
+    inserter = StubInserter()
+    globs = [
+        str(content_dir / "**" / "*.portalcontent"),
+        str(content_dir / "**" / "*.portalarchive"),
+    ]
+    inject_content(inserter, globs)
+    assert inserter.pushed == EXPECTED_CONTENT
+
+
+def test_recursive_glob_yields_each_file_once(content_dir):
+    paths = list(iter_content_paths([str(content_dir / "**")]))
+
+    assert len(paths) == len(set(paths)) == 3
+
+    inserter = StubInserter()
+    inject_content(inserter, [str(content_dir / "**")])
+    assert inserter.pushed == EXPECTED_CONTENT
+
+
+def test_glob_matching_directories_walks_them(content_dir):
+    paths = list(iter_content_paths([str(content_dir / "nest*")]))
+
+    assert sorted(path.name for path in paths) == [
+        "0002.portalcontent",
+        "packed.portalarchive",
+    ]
+
+
+def test_explicit_files_are_still_validated(content_dir):
+    with pytest.raises(ValidationError, match="must end in"):
+        tuple(parse_content_keys([str(content_dir / "README")]))
+
+
+@pytest.mark.parametrize(
+    "missing", ("missing.portalcontent", "missing/*.portalcontent")
+)
+def test_missing_paths(tmp_path, missing):
+    with pytest.raises(ValidationError):
+        tuple(parse_content_keys([str(tmp_path / missing)]))
+
+
+def test_parse_content_keys_is_lazy(content_dir, tmp_path):
+    parsed = parse_content_keys([str(content_dir), str(tmp_path / "missing")])
+
+    # Items are available before later paths are even checked
+    first_items = [next(parsed) for _ in range(3)]
+    assert {key for key, _ in first_items} == set(EXPECTED_CONTENT)
+
+    with pytest.raises(ValidationError, match="does not exist"):
+        next(parsed)
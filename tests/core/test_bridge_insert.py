@@ -0,0 +1,194 @@
+import hashlib
+import logging
+import time
+
+import pytest
+from web3.exceptions import TimeExhausted
+
+from eth_portal.bridge.adaptive import NodeOfferLimiter
+from eth_portal.bridge.insert import PortalInserter
+from eth_portal.bridge.metrics import ITEMS_PUSHED, OFFERS
+from eth_portal.bridge.offered import OfferIndex
+
+
+class StubProvider:
+    def __init__(self, node_id, delay, peers, error):
+        self.ipc_path = f"/tmp/trin-jsonrpc-{node_id}.ipc"
+        self.offers = []
+        self._delay = delay
+        self._peers = peers
+        self._error = error
+
+    def make_request(self, method, params):
+        self.offers.append((method, params))
+        time.sleep(self._delay)
+        if self._error is not None:
+            raise self._error
+        return {"jsonrpc": "2.0", "id": 0, "result": self._peers}
+
+
+class StubWeb3:
+    def __init__(self, node_id, delay=0, peers=3, error=None):
+        self.provider = StubProvider(node_id, delay, peers, error)
+
+    @property
+    def manager(self):
+        return self
+
+
+@pytest.fixture
+def make_inserter():
+    inserters = []
+
+    def _make_inserter(*args, **kwargs):
+        inserter = PortalInserter(*args, **kwargs)
+        inserters.append(inserter)
+        return inserter
+
+    yield _make_inserter
+
+    for inserter in inserters:
+        inserter.shutdown()
+
+
+def test_push_history_offers_to_all_nodes(make_inserter):
+    web3_links = [StubWeb3(f"{idx:020x}", peers=idx) for idx in range(4)]
+    inserter = make_inserter(web3_links)
+
+    peer_counts = inserter.push_history(b"\x00" + b"H" * 32, b"value")
+
+    assert peer_counts == (0, 1, 2, 3)
+    for w3 in web3_links:
+        assert w3.provider.offers == [
+            ("portal_historyOffer", ["0x00" + "48" * 32, "0x76616c7565"])
+        ]
+
+
+def test_push_history_offers_concurrently(make_inserter):
+    num_nodes = 16
+    web3_links = [StubWeb3(f"{idx:020x}", delay=0.2) for idx in range(num_nodes)]
+    inserter = make_inserter(web3_links)
+
+    start = time.monotonic()
+    peer_counts = inserter.push_history(b"key", b"value")
+    duration = time.monotonic() - start
+
+    assert peer_counts == (3,) * num_nodes
+    # Offering one after another would take more than 3 seconds
+    assert duration < 0.2 * num_nodes / 2
+
+
+def test_push_history_timeout_counts_as_no_peers(make_inserter):
+    slow_node = StubWeb3("slow", delay=1)
+    fast_node = StubWeb3("fast")
+    inserter = make_inserter([slow_node, fast_node], offer_timeout=0.1)
+
+    peer_counts = inserter.push_history(b"key", b"value")
+
+    assert peer_counts == (0, 3)
+
+
+def test_push_history_failures_count_as_no_peers(make_inserter):
+    web3_links = [
+        StubWeb3("hung", error=TimeExhausted("no response")),
+        StubWeb3("gone", error=FileNotFoundError("no socket")),
+        StubWeb3("fine"),
+    ]
+    limiter = NodeOfferLimiter(["hung", "gone", "fine"], initial_limit=4)
+    inserter = make_inserter(web3_links, offer_limiter=limiter)
+    errors_before = OFFERS.value(outcome="error")
+
+    peer_counts = inserter.push_history(b"key", b"value")
+
+    assert peer_counts == (0, 0, 3)
+    assert OFFERS.value(outcome="error") == errors_before + 2
+    # The failed offers were reported to the limiter, which backed off
+    assert [limiter.limit(idx) for idx in range(3)] == [2, 2, 4]
+
+
+def test_push_history_routes_to_closest_nodes(make_inserter):
+    node_ids = [bytes([first_byte]) + b"\x00" * 31 for first_byte in (0, 3, 6, 7)]
+    web3_links = [
+        StubWeb3(node_id.hex()[:20], peers=idx) for idx, node_id in enumerate(node_ids)
+    ]
+    inserter = make_inserter(web3_links, node_ids=node_ids, route_k=2)
+
+    # The content ID of this key starts with the byte 0x06
+    content_key = b"\x00\x16"
+    assert hashlib.sha256(content_key).digest()[0] == 6
+
+    peer_counts = inserter.push_history(content_key, b"value")
+
+    assert peer_counts == (2, 3)
+    assert [len(w3.provider.offers) for w3 in web3_links] == [0, 0, 1, 1]
+
+
+def test_push_history_logs_summaries_not_payloads(make_inserter, caplog):
+    web3_links = [StubWeb3(f"{idx:020x}") for idx in range(2)]
+    inserter = make_inserter(web3_links, log_sample_interval=3)
+
+    with caplog.at_level(logging.INFO, logger="eth_portal.bridge.insert"):
+        for idx in range(7):
+            inserter.push_history(bytes([idx]), b"\xab" * 100)
+
+    summaries = [record for record in caplog.records if record.levelname == "INFO"]
+    assert [record.total_items for record in summaries] == [3, 6]
+    assert summaries[0].items == 3
+    assert summaries[0].bytes == 300
+    assert "abab" not in caplog.text
+
+
+def test_push_history_logs_outliers(make_inserter, caplog):
+    slow_node = StubWeb3("slow", delay=0.3)
+    inserter = make_inserter([slow_node], offer_timeout=0.1, slow_push_seconds=0.05)
+    items_before = ITEMS_PUSHED.value()
+    timeouts_before = OFFERS.value(outcome="timeout")
+
+    with caplog.at_level(logging.INFO, logger="eth_portal.bridge.insert"):
+        inserter.push_history(b"key", b"value")
+
+    warnings = [record.getMessage() for record in caplog.records]
+    assert warnings == ["Timed out offering history item", "Slow push of history item"]
+    assert caplog.records[0].node_id == "slow"
+
+    assert ITEMS_PUSHED.value() == items_before + 1
+    assert OFFERS.value(outcome="timeout") == timeouts_before + 1
+
+
+def test_push_history_routes_around_drained_nodes(make_inserter):
+    node_ids = [bytes([first_byte]) + b"\x00" * 31 for first_byte in (0, 3, 6, 7)]
+    web3_links = [StubWeb3(node_id.hex()[:20], peers=3) for node_id in node_ids]
+    web3_links[3].provider._peers = 0
+    limiter = NodeOfferLimiter(
+        [node_id.hex()[:20] for node_id in node_ids], drain_after=2
+    )
+    inserter = make_inserter(
+        web3_links, node_ids=node_ids, route_k=2, offer_limiter=limiter
+    )
+
+    # The content ID of this key starts with the byte 0x06
+    content_key = b"\x00\x16"
+    for _ in range(2):
+        assert inserter.push_history(content_key, b"value") == (3, 0)
+
+    # The isolated node is drained, so the next closest node gets its offers
+    assert limiter.is_drained(3)
+    assert inserter.push_history(content_key, b"value") == (3, 3)
+    assert [len(w3.provider.offers) for w3 in web3_links] == [0, 1, 3, 2]
+
+
+def test_push_history_skips_nodes_that_already_offered(make_inserter, tmp_path):
+    web3_links = [StubWeb3(f"{idx:020x}", peers=3 + idx) for idx in range(3)]
+
+    with OfferIndex(tmp_path / "offers.db") as index:
+        index.record(b"key", f"{1:020x}", 7)
+        inserter = make_inserter(web3_links, offer_index=index)
+
+        assert not inserter.was_offered(b"key")
+        assert inserter.push_history(b"key", b"value") == (3, 7, 5)
+        assert [len(w3.provider.offers) for w3 in web3_links] == [1, 0, 1]
+
+        # Every node has offered it now, so nothing is offered again
+        assert inserter.was_offered(b"key")
+        assert inserter.push_history(b"key", b"value") == (3, 7, 5)
+        assert [len(w3.provider.offers) for w3 in web3_links] == [1, 0, 1]
@@ -0,0 +1,63 @@
+import io
+import json
+import logging
+
+import pytest
+
+from eth_portal.bridge.logs import start_queued_logging
+
+
+@pytest.fixture
+def restore_root_logger():
+    root_logger = logging.getLogger()
+    handlers, level = list(root_logger.handlers), root_logger.level
+    yield
+    root_logger.handlers[:] = handlers
+    root_logger.setLevel(level)
+
+
+@pytest.mark.parametrize("json_format", (False, True))
+def test_queued_logging(restore_root_logger, json_format):
+    stream = io.StringIO()
+    listener = start_queued_logging("INFO", json_format, stream)
+    logger = logging.getLogger("eth_portal.test")
+    logger.debug("Hidden", extra={"items": 1})
+    logger.info("Pushed items", extra={"items": 3, "seconds": 0.5})
+    listener.stop()
+
+    (line,) = stream.getvalue().splitlines()
+    if json_format:
+        entry = json.loads(line)
+        assert entry["level"] == "INFO"
+        assert entry["logger"] == "eth_portal.test"
+        assert entry["message"] == "Pushed items"
+        assert entry["items"] == 3
+        assert entry["seconds"] == 0.5
+    else:
+        assert line.endswith("INFO eth_portal.test: Pushed items items=3 seconds=0.5")
+
+
+@pytest.mark.parametrize("json_format", (False, True))
+def test_queued_logging_keeps_tracebacks(restore_root_logger, json_format):
+    stream = io.StringIO()
+    listener = start_queued_logging("INFO", json_format, stream)
+    logger = logging.getLogger("eth_portal.test")
+    try:
+        raise ValueError("bad block")
+    except ValueError:
+        logger.exception("Failed to publish", extra={"block": 7})
+    listener.stop()
+
+    output = stream.getvalue()
+    if json_format:
+        (line,) = output.splitlines()
+        entry = json.loads(line)
+        assert entry["message"] == "Failed to publish"
+        assert entry["block"] == 7
+        assert entry["exception"].startswith("Traceback (most recent call last):")
+        assert entry["exception"].endswith("ValueError: bad block")
+    else:
+        first_line, *traceback_lines = output.splitlines()
+        assert first_line.endswith("ERROR eth_portal.test: Failed to publish block=7")
+        assert traceback_lines[0] == "Traceback (most recent call last):"
+        assert traceback_lines[-1] == "ValueError: bad block"
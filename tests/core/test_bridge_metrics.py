@@ -0,0 +1,104 @@
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import pytest
+
+from eth_portal.bridge.metrics import MetricsRegistry, serve_metrics
+
+
+@pytest.fixture
+def registry():
+    return MetricsRegistry()
+
+
+def test_render_counter_and_gauge(registry):
+    fetched = registry.counter("blocks_total", "Blocks fetched")
+    offers = registry.counter("offers_total", "Offers", ("outcome",))
+    depth = registry.gauge("queue_depth", "Queue depth")
+
+    fetched.inc(3)
+    offers.inc(outcome="accepted")
+    offers.inc(outcome="accepted")
+    offers.inc(outcome='ti"meout')
+    depth.set(2.5)
+
+    assert registry.render() == (
+        "# HELP blocks_total Blocks fetched\n"
+        "# TYPE blocks_total counter\n"
+        "blocks_total 3\n"
+        "# HELP offers_total Offers\n"
+        "# TYPE offers_total counter\n"
+        'offers_total{outcome="accepted"} 2\n'
+        'offers_total{outcome="ti\\"meout"} 1\n'
+        "# HELP queue_depth Queue depth\n"
+        "# TYPE queue_depth gauge\n"
+        "queue_depth 2.5\n"
+    )
+
+
+def test_render_histogram(registry):
+    latency = registry.histogram("latency", "Latency", ("node",), buckets=(1, 5))
+    for value in (0.5, 1, 3, 10):
+        latency.observe(value, node="a")
+
+    assert registry.render().splitlines()[2:] == [
+        'latency_bucket{node="a",le="1"} 2',
+        'latency_bucket{node="a",le="5"} 3',
+        'latency_bucket{node="a",le="+Inf"} 4',
+        'latency_sum{node="a"} 14.5',
+        'latency_count{node="a"} 4',
+    ]
+
+
+def test_histogram_timer(registry):
+    timing = registry.histogram("timing", "Timing", ("kind",))
+
+    @timing.time(kind="decorated")
+    def work():
+        pass
+
+    work()
+    work()
+    with timing.time(kind="context"):
+        pass
+
+    assert timing.count(kind="decorated") == 2
+    assert timing.count(kind="context") == 1
+
+
+def test_histogram_capture(registry):
+    timing = registry.histogram("timing", "Timing", ("kind",))
+
+    with timing.capture() as observations:
+        timing.observe(0.5, kind="captured")
+    timing.observe(0.25, kind="uncaptured")
+
+    assert observations == [(0.5, {"kind": "captured"})]
+
+    # Like recording observations sent back from another process
+    other_timing = registry.histogram("other_timing", "Timing", ("kind",))
+    other_timing.observe_all(observations)
+    assert other_timing.count(kind="captured") == 1
+
+
+def test_wrong_labels(registry):
+    offers = registry.counter("offers_total", "Offers", ("outcome",))
+    with pytest.raises(ValueError):
+        offers.inc()
+    with pytest.raises(ValueError):
+        registry.counter("offers_total", "Again")
+
+
+def test_serve_metrics(registry):
+    registry.counter("blocks_total", "Blocks fetched").inc()
+    server = serve_metrics(registry, 0)
+    try:
+        port = server.server_address[1]
+        with urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            assert b"blocks_total 1\n" in response.read()
+
+        with pytest.raises(HTTPError):
+            urlopen(f"http://127.0.0.1:{port}/other")
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,49 @@
+import os
+
+from eth_portal.bridge.offered import BloomFilter, OfferIndex
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom_filter = BloomFilter(1000, 0.01)
+    items = [os.urandom(33) for _ in range(1000)]
+    for item in items:
+        bloom_filter.add(item)
+
+    assert all(item in bloom_filter for item in items)
+
+    # About 1% of items that weren't added look like they were
+    false_positives = sum(os.urandom(33) in bloom_filter for _ in range(10000))
+    assert false_positives < 300
+
+
+def test_offer_index_records_offers_to_enough_peers(tmp_path):
+    with OfferIndex(tmp_path / "offers.db", min_peers=3) as index:
+        assert index.record(b"key", "node-a", 5)
+        assert not index.record(b"key", "node-b", 2)
+
+        assert index.offered_peers(b"key", ["node-a", "node-b"]) == {"node-a": 5}
+        assert index.offered_peers(b"other-key", ["node-a"]) == {}
+        assert len(index) == 1
+
+
+def test_offer_index_persists(tmp_path):
+    path = tmp_path / "offers.db"
+    with OfferIndex(path) as index:
+        index.record(b"key", "node-a", 3)
+        # Recording the same offer again doesn't count twice
+        index.record(b"key", "node-a", 4)
+
+    with OfferIndex(path) as index:
+        assert len(index) == 1
+        assert index.offered_peers(b"key", ["node-a"]) == {"node-a": 3}
+
+
+def test_offer_index_grows_its_filter(tmp_path):
+    with OfferIndex(tmp_path / "offers.db", filter_capacity=10) as index:
+        initial_bytes = index.filter_bytes
+        keys = [bytes([idx]) * 33 for idx in range(50)]
+        for key in keys:
+            index.record(key, "node-a", 3)
+
+        assert index.filter_bytes > initial_bytes
+        assert all(index.offered_peers(key, ["node-a"]) for key in keys)
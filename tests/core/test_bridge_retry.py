@@ -0,0 +1,118 @@
+import random
+
+import pytest
+
+from eth_portal.bridge.inject import inject_content
+from eth_portal.bridge.retry import RetryScheduler
+
+
+def test_backoff_doubles_up_to_the_cap():
+    scheduler = RetryScheduler(base_delay=1, max_delay=5, jitter=0)
+    assert [scheduler.delay_after(attempts) for attempts in range(1, 6)] == [
+        1,
+        2,
+        4,
+        5,
+        5,
+    ]
+
+
+def test_jitter_stays_in_bounds():
+    scheduler = RetryScheduler(base_delay=10, jitter=0.2, rng=random.Random(0))
+    delays = [scheduler.delay_after(1) for _ in range(100)]
+    assert all(8 <= delay <= 12 for delay in delays)
+    assert len(set(delays)) > 1
+
+
+def test_items_come_due_in_time_order(clock):
+    scheduler = RetryScheduler(base_delay=1, jitter=0, clock=clock)
+    assert scheduler.schedule("slow", 3)
+    assert scheduler.schedule("fast", 1)
+    assert scheduler.pop_due() is None
+    assert scheduler.seconds_until_due() == 1
+
+    clock.sleep(1)
+    assert scheduler.pop_due() == ("fast", 1)
+    assert scheduler.pop_due() is None
+
+    clock.sleep(3)
+    assert scheduler.pop_due() == ("slow", 3)
+    assert scheduler.seconds_until_due() is None
+
+
+def test_out_of_attempts():
+    scheduler = RetryScheduler(max_attempts=2)
+    assert scheduler.schedule("item", 1)
+    assert not scheduler.schedule("item", 2)
+    assert len(scheduler) == 1
+
+
+@pytest.mark.parametrize("max_attempts, jitter", ((0, 0), (1, 1), (1, -0.1)))
+def test_invalid_settings(max_attempts, jitter):
+    with pytest.raises(ValueError):
+        RetryScheduler(max_attempts=max_attempts, jitter=jitter)
+
+
+class FlakyInserter:
+    """
+    Offers each item to too few peers, until it's pushed a given number of times.
+    """
+
+    def __init__(self, pushes_needed):
+        self.pushes_needed = pushes_needed
+        self.pushed = []
+
+    def push_history(self, content_key, content_value):
+        self.pushed.append(content_key)
+        if self.pushed.count(content_key) >= self.pushes_needed.get(content_key, 1):
+            return (3, 0)
+        else:
+            return (1, 0)
+
+
+def _write_content(tmp_path, num_items):
+    content_dir = tmp_path / "content"
+    content_dir.mkdir()
+    for index in range(num_items):
+        (content_dir / f"{index:04x}.portalcontent").write_bytes(b"value")
+    return content_dir
+
+
+def test_retries_interleave_with_fresh_content(tmp_path, clock):
+    content_dir = _write_content(tmp_path, 5)
+    first_key = bytes.fromhex("0000")
+    inserter = FlakyInserter({first_key: 2})
+
+    scheduler = RetryScheduler(base_delay=1, jitter=0, clock=clock)
+
+    # Each push takes a second, so the retry comes due before fresh content runs out
+    class SlowInserter:
+        def push_history(self, content_key, content_value):
+            clock.sleep(1)
+            return inserter.push_history(content_key, content_value)
+
+    files = sorted(content_dir.iterdir())
+    dead_letter_path = tmp_path / "dead"
+    inject_content(SlowInserter(), files, dead_letter_path, scheduler, clock.sleep)
+
+    assert inserter.pushed.count(first_key) == 2
+    assert inserter.pushed[-1] != first_key
+    assert not dead_letter_path.exists()
+
+
+def test_dead_letters_are_recorded(tmp_path, capsys, clock):
+    content_dir = _write_content(tmp_path, 3)
+    stubborn_key = bytes.fromhex("0001")
+    inserter = FlakyInserter({stubborn_key: 100})
+
+    scheduler = RetryScheduler(base_delay=1, max_attempts=3, clock=clock)
+
+    files = sorted(content_dir.iterdir())
+    dead_letter_path = tmp_path / "dead"
+    inject_content(inserter, files, dead_letter_path, scheduler, clock.sleep)
+
+    assert inserter.pushed.count(stubborn_key) == 3
+    assert dead_letter_path.read_text() == (
+        f"0001 {content_dir / '0001.portalcontent'}\n"
+    )
+    assert "Gave up on 1 items" in capsys.readouterr().out
@@ -0,0 +1,55 @@
+import random
+
+import pytest
+
+from eth_portal.bridge.routing import NodeIdIndex, content_id
+
+
+def _random_id(rng):
+    return rng.getrandbits(256).to_bytes(32, "big")
+
+
+def _brute_force_closest(node_ids, target, k):
+    distances = sorted(
+        (int.from_bytes(node_id, "big") ^ target, idx)
+        for idx, node_id in enumerate(node_ids)
+    )
+    return tuple(idx for _, idx in distances[:k])
+
+
+@pytest.mark.parametrize("num_nodes", (1, 2, 3, 8, 64, 257))
+@pytest.mark.parametrize("k", (1, 2, 4, 16))
+def test_closest_matches_brute_force(num_nodes, k):
+    rng = random.Random(num_nodes * 1000 + k)
+    node_ids = [_random_id(rng) for _ in range(num_nodes)]
+    index = NodeIdIndex(node_ids)
+
+    for _ in range(50):
+        target = rng.getrandbits(256)
+        assert index.closest(target, k) == _brute_force_closest(node_ids, target, k)
+
+
+def test_closest_with_shared_prefixes():
+    # Nodes that are numerically between the target and a close node, but
+    #   further away by XOR distance
+    node_ids = [bytes([first_byte]) + b"\x00" * 31 for first_byte in (0, 3, 6, 7)]
+    index = NodeIdIndex(node_ids)
+
+    target = int.from_bytes(b"\x04" + b"\x00" * 31, "big")
+    assert index.closest(target, 3) == (2, 3, 0)
+
+
+def test_closest_rejects_empty_selection():
+    index = NodeIdIndex([b"\x00" * 32])
+    with pytest.raises(ValueError):
+        index.closest(0, 0)
+
+
+def test_content_id():
+    # Pulled test data from the Portal Network history content ID test vectors
+    content_key = bytes.fromhex(
+        "00d1c390624d3bd4e409a61a858e5dcc5517729a9170d014a6c96530d64dd8621d"
+    )
+    assert content_id(content_key) == int(
+        "3e86b3767b57402ea72e369ae0496ce47cc15be685bec3b4726b9f316e3895fe", 16
+    )
@@ -0,0 +1,65 @@
+from eth_portal.bridge.store import ContentStore, block_content_keys
+
+
+def test_store_round_trip(tmp_path):
+    with ContentStore(tmp_path / "content.db") as store:
+        assert store.get(b"key") is None
+        store.put(b"key", b"value")
+        assert store.get(b"key") == b"value"
+        assert store.total_bytes == 5
+
+    # Content persists after re-opening
+    with ContentStore(tmp_path / "content.db") as store:
+        assert store.get(b"key") == b"value"
+        assert store.total_bytes == 5
+
+
+def test_store_replaces_value(tmp_path):
+    with ContentStore(tmp_path / "content.db") as store:
+        store.put(b"key", b"value")
+        store.put(b"key", b"longer value")
+        assert store.get(b"key") == b"longer value"
+        assert store.total_bytes == 12
+
+
+def test_store_block_by_number(tmp_path):
+    header_hash = b"H" * 32
+    content_items = tuple(
+        (content_key, content_key[:1] * 10)
+        for content_key in block_content_keys(header_hash)
+    )
+
+    with ContentStore(tmp_path / "content.db") as store:
+        assert store.get_block(1) is None
+        store.put_block(1, header_hash, content_items)
+
+        assert store.get_block(1) == content_items
+        assert store.get_block_by_hash(header_hash) == content_items
+        assert store.get_block(2) is None
+
+
+def test_store_evicts_least_recently_used(tmp_path):
+    with ContentStore(tmp_path / "content.db", max_bytes=100) as store:
+        for idx in range(5):
+            store.put(bytes([idx]), b"x" * 20)
+
+        # Touch the oldest item, so it's no longer the least recently used
+        assert store.get(b"\x00") is not None
+
+        # Going over the cap evicts down to 90% of it
+        store.put(b"\x05", b"x" * 20)
+        assert store.total_bytes <= 90
+
+        assert store.get(b"\x00") is not None
+        assert store.get(b"\x01") is None
+        assert store.get(b"\x02") is None
+        assert store.get(b"\x05") is not None
+
+
+def test_store_partial_block_is_a_miss(tmp_path):
+    header_hash = b"H" * 32
+    header_key, body_key, receipts_key = block_content_keys(header_hash)
+
+    with ContentStore(tmp_path / "content.db") as store:
+        store.put_block(1, header_hash, [(header_key, b"header")])
+        assert store.get_block(1) is None
@@ -0,0 +1,95 @@
+import pytest
+
+from eth_portal.grind import (
+    DEFAULT_BATCH_SIZE,
+    _walk_node_ids,
+    grind_batch,
+    grind_node_ids,
+    grind_tiling,
+)
+from eth_portal.trin import private_key_to_node_id
+
+
+@pytest.mark.parametrize("num_tried", (1, 500, DEFAULT_BATCH_SIZE + 7))
+def test_walk_node_ids_derives_node_ids(monkeypatch, num_tried):
+    monkeypatch.setattr("eth_portal.grind.secrets.randbelow", lambda _: 12345)
+    walked = list(_walk_node_ids(num_tried))
+
+    assert [private_key for private_key, _ in walked] == list(
+        range(12347, 12347 + num_tried)
+    )
+    for private_key, node_id in walked[:: DEFAULT_BATCH_SIZE // 4]:
+        assert private_key_to_node_id(private_key.to_bytes(32, "big")) == node_id
+
+
+def test_grind_batch_keeps_only_the_closest(monkeypatch):
+    # Start the walk and the batch just before the same key
+    monkeypatch.setattr("eth_portal.grind.secrets.randbelow", lambda _: 12345)
+    target = 2**255
+    walked = list(_walk_node_ids(500))
+    tried, closest = grind_batch(target, 500)
+
+    assert tried == 500
+    assert closest.distance == min(
+        int.from_bytes(node_id, "big") ^ target for _, node_id in walked
+    )
+    assert closest.distance == int.from_bytes(closest.node_id, "big") ^ target
+    assert private_key_to_node_id(closest.private_key) == closest.node_id
+
+
+def test_grind_node_ids():
+    messages = []
+    found = grind_node_ids(
+        0xAB << 248,
+        match_bits=6,
+        num_keys=2,
+        processes=1,
+        keys_per_task=1024,
+        report=messages.append,
+    )
+
+    assert len(found) == 2
+    assert found[0].distance <= found[1].distance
+    for key in found:
+        assert key.node_id.hex().startswith(("a8", "a9", "aa", "ab"))
+        assert key.matching_bits >= 6
+        assert private_key_to_node_id(key.private_key) == key.node_id
+    assert "keys/s" in messages[-1]
+
+
+def test_grind_node_ids_keeps_one_key_per_random_start():
+    found = grind_node_ids(
+        0, match_bits=1, num_keys=3, processes=1, keys_per_task=256, report=print
+    )
+
+    # Keys from the same walk would be within a task's worth of each other
+    private_keys = sorted(int.from_bytes(key.private_key, "big") for key in found)
+    assert len(private_keys) == 3
+    for lower, higher in zip(private_keys, private_keys[1:]):
+        assert higher - lower > 256
+
+
+def test_grind_node_ids_gives_up():
+    found = grind_node_ids(
+        0, match_bits=256, processes=1, max_keys=100, keys_per_task=64, report=print
+    )
+    assert len(found) == 1
+    assert found[0].matching_bits < 256
+
+
+def test_grind_tiling():
+    found = grind_tiling(
+        4, precision_bits=2, processes=1, keys_per_task=1024, report=print
+    )
+
+    assert len(found) == 4
+    slice_width = 2**256 // 4
+    for slot, key in enumerate(found):
+        assert int.from_bytes(key.node_id, "big") // slice_width == slot
+        assert key.distance < slice_width >> 2
+        assert private_key_to_node_id(key.private_key) == key.node_id
+
+    # Keys from the same walk would be within a task's worth of each other
+    private_keys = sorted(int.from_bytes(key.private_key, "big") for key in found)
+    for lower, higher in zip(private_keys, private_keys[1:]):
+        assert higher - lower > 1024
@@ -0,0 +1,205 @@
+import json
+import socket
+import threading
+import time
+
+import pytest
+from web3.exceptions import TimeExhausted
+
+from eth_portal.ipc import EncodedHex, PipelinedIPCProvider, _encode_request
+
+
+class StubIPCServer:
+    """
+    Answer each request with its params, after the delay given in the first param.
+
+    Responses are written in pieces, so they arrive split across reads.
+    """
+
+    def __init__(self, ipc_path):
+        self.ipc_path = str(ipc_path)
+        self.num_connections = 0
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(self.ipc_path)
+        self._server.listen()
+        self._connections = []
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            self.num_connections += 1
+            self._connections.append(conn)
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        decoder = json.JSONDecoder()
+        buffer = ""
+        while True:
+            try:
+                chunk = conn.recv(4096)
+            except OSError:
+                return
+            if not chunk:
+                return
+            buffer += chunk.decode()
+            while buffer:
+                try:
+                    request, end = decoder.raw_decode(buffer)
+                except json.JSONDecodeError:
+                    break
+                buffer = buffer[end:]
+                threading.Thread(
+                    target=self._respond, args=(conn, request), daemon=True
+                ).start()
+
+    def _respond(self, conn, request):
+        time.sleep(request["params"][0])
+        response = json.dumps(
+            {"jsonrpc": "2.0", "id": request["id"], "result": request["params"]}
+        ).encode()
+        middle = len(response) // 2
+        try:
+            conn.sendall(response[:middle])
+            time.sleep(0.01)
+            conn.sendall(response[middle:] + b"\n")
+        except OSError:
+            pass
+
+    def close(self):
+        self._server.close()
+        for conn in self._connections:
+            conn.close()
+
+
+@pytest.fixture
+def ipc_path(tmp_path):
+    return tmp_path / "node.ipc"
+
+
+@pytest.fixture
+def server(ipc_path):
+    server = StubIPCServer(ipc_path)
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def provider(ipc_path):
+    provider = PipelinedIPCProvider(ipc_path, timeout=2)
+    yield provider
+    provider.close()
+
+
+def test_requests_are_pipelined(server, provider):
+    # Later requests are answered first
+    delays = [0.5, 0.4, 0.3, 0.2, 0.1]
+    results = [None] * len(delays)
+
+    def request(idx):
+        results[idx] = provider.make_request("echo", [delays[idx], "é" * idx])
+
+    threads = [threading.Thread(target=request, args=(idx,)) for idx in range(5)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.monotonic() - start
+
+    assert [response["result"] for response in results] == [
+        [delay, "é" * idx] for idx, delay in enumerate(delays)
+    ]
+
+    # All requests share one connection, and are not answered one at a time
+    assert server.num_connections == 1
+    assert duration < sum(delays)
+
+
+def test_reconnects_after_restart(ipc_path, provider):
+    server = StubIPCServer(ipc_path)
+    assert provider.make_request("echo", [0])["result"] == [0]
+    server.close()
+    ipc_path.unlink()
+
+    restarted = StubIPCServer(ipc_path)
+    try:
+        assert provider.make_request("echo", [0, "again"])["result"] == [0, "again"]
+        assert restarted.num_connections == 1
+    finally:
+        restarted.close()
+
+
+def test_waits_for_restarting_node(ipc_path, provider):
+    def restart():
+        time.sleep(0.3)
+        restarted.append(StubIPCServer(ipc_path))
+
+    restarted = []
+    thread = threading.Thread(target=restart)
+    thread.start()
+    try:
+        # The socket is missing when the request is made
+        assert provider.make_request("echo", [0])["result"] == [0]
+    finally:
+        thread.join()
+        restarted[0].close()
+
+
+def test_missing_node(provider):
+    provider.timeout = 0.2
+    with pytest.raises(FileNotFoundError):
+        provider.make_request("echo", [0])
+    assert not provider.is_connected()
+
+
+def test_probe_does_not_wait_for_node_that_is_not_listening(ipc_path, provider):
+    # trin binds its socket a moment before it accepts connections on it
+    bound = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    bound.bind(str(ipc_path))
+    try:
+        start = time.monotonic()
+        with pytest.raises(ConnectionRefusedError):
+            provider.probe("echo", [0], timeout=0.2)
+        assert time.monotonic() - start < provider.timeout / 2
+    finally:
+        bound.close()
+
+
+def test_timeout(server, provider):
+    provider.timeout = 0.2
+    with pytest.raises(TimeExhausted):
+        provider.make_request("echo", [1])
+
+    # The connection is still usable afterwards
+    assert provider.make_request("echo", [0])["result"] == [0]
+
+
+@pytest.mark.parametrize(
+    "params",
+    (
+        [],
+        [0],
+        [0, EncodedHex(b"")],
+        [EncodedHex(memoryview(b"\x00\xff" * 100)), "0x01", {"a": [1, None]}],
+    ),
+)
+def test_encode_request(params):
+    request = b"".join(_encode_request(7, "portal_historyOffer", params))
+    assert json.loads(request) == {
+        "jsonrpc": "2.0",
+        "id": 7,
+        "method": "portal_historyOffer",
+        "params": [
+            str(param) if isinstance(param, EncodedHex) else param for param in params
+        ],
+    }
+
+
+def test_encoded_hex_param(server, provider):
+    value = EncodedHex(bytes(range(256)) * 1000)
+    response = provider.make_request("echo", [0, value])
+    assert response["result"] == [0, "0x" + (bytes(range(256)) * 1000).hex()]
@@ -0,0 +1,25 @@
+import random
+
+from eth.db.trie import _make_trie_root_and_nodes
+import pytest
+
+from eth_portal.trie import ordered_trie_root
+
+
+@pytest.mark.parametrize("num_items", (0, 1, 2, 3, 16, 17, 127, 128, 129, 300, 1000))
+@pytest.mark.parametrize("max_item_size", (1, 8, 40, 200))
+def test_ordered_trie_root_matches_hexary_trie(num_items, max_item_size):
+    rng = random.Random(num_items * 1000 + max_item_size)
+    items = tuple(
+        bytes(rng.getrandbits(8) for _ in range(rng.randint(1, max_item_size)))
+        for _ in range(num_items)
+    )
+
+    expected_root, _ = _make_trie_root_and_nodes(items)
+    assert ordered_trie_root(items) == expected_root
+
+
+def test_ordered_trie_root_accepts_iterator():
+    items = [bytes([idx]) * 40 for idx in range(50)]
+    expected_root, _ = _make_trie_root_and_nodes(tuple(items))
+    assert ordered_trie_root(iter(items)) == expected_root
@@ -0,0 +1,143 @@
+import socket
+import time
+
+import pytest
+from web3 import Web3
+
+from eth_portal.ipc import PipelinedIPCProvider
+from eth_portal.trin import _node_data_dirs, directory_bytes, wait_until_ready
+
+
+class BootingProvider:
+    """
+    Act like trin's IPC socket, which appears and starts answering after a delay.
+    """
+
+    def __init__(self, tmp_path, name, clock, socket_after, answers_after):
+        self.ipc_path = str(tmp_path / f"{name}.ipc")
+        self._clock = clock
+        self._socket_after = socket_after
+        self._answers_after = answers_after
+        self.requests = []
+
+    def make_request(self, method, params):
+        self.requests.append(method)
+        if self._clock() < self._answers_after:
+            raise ConnectionRefusedError
+        return {"jsonrpc": "2.0", "id": 0, "result": "trin v0.1.0"}
+
+    def tick(self):
+        if self._clock() >= self._socket_after:
+            open(self.ipc_path, "a").close()
+
+
+class BootingWeb3:
+    def __init__(self, provider):
+        self.provider = provider
+
+
+class FakeProcess:
+    def __init__(self, returncode=None):
+        self.returncode = returncode
+
+    def poll(self):
+        return self.returncode
+
+
+def _booting_nodes(tmp_path, clock, boot_times):
+    providers = [
+        BootingProvider(tmp_path, f"node{idx}", clock, socket_after, answers_after)
+        for idx, (socket_after, answers_after) in enumerate(boot_times)
+    ]
+
+    def sleep(seconds):
+        clock.sleep(seconds)
+        for provider in providers:
+            provider.tick()
+
+    nodes = [(BootingWeb3(provider), FakeProcess()) for provider in providers]
+    return providers, nodes, sleep
+
+
+def test_nodes_are_waited_on_together(tmp_path, clock):
+    providers, nodes, sleep = _booting_nodes(
+        tmp_path, clock, [(1, 2), (3, 3), (0.5, 4)]
+    )
+
+    ready_seconds = wait_until_ready(nodes, timeout=10, clock=clock, sleep=sleep)
+
+    # All nodes boot at once, so the barrier only lasts as long as the slowest
+    assert [round(seconds, 1) for seconds in ready_seconds] == [2, 3, 4]
+    assert round(clock(), 1) == 4
+
+    # No health check is sent before the socket exists
+    assert len(providers[1].requests) == 1
+
+
+def test_nodes_that_are_not_listening_dont_hold_up_the_wait(tmp_path):
+    # Each socket is bound, like trin does a moment before it accepts connections
+    sockets = []
+    nodes = []
+    for idx in range(3):
+        ipc_path = tmp_path / f"node{idx}.ipc"
+        bound = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        bound.bind(str(ipc_path))
+        sockets.append(bound)
+        nodes.append((Web3(PipelinedIPCProvider(ipc_path, timeout=60)), None))
+
+    start = time.monotonic()
+    try:
+        with pytest.raises(RuntimeError, match="3 of 3 trin nodes were not ready"):
+            wait_until_ready(nodes, timeout=0.5)
+    finally:
+        for bound in sockets:
+            bound.close()
+
+    # Not held up by the providers' long request timeout
+    assert time.monotonic() - start < 5
+
+
+def test_exited_node(tmp_path, clock):
+    _, nodes, sleep = _booting_nodes(tmp_path, clock, [(1, 1), (1, 1)])
+    nodes[1] = (nodes[1][0], FakeProcess(returncode=1))
+
+    with pytest.raises(RuntimeError, match="exited with code 1"):
+        wait_until_ready(nodes, timeout=10, clock=clock, sleep=sleep)
+
+
+def test_timeout(tmp_path, clock):
+    _, nodes, sleep = _booting_nodes(tmp_path, clock, [(1, 1), (1, 100)])
+
+    with pytest.raises(RuntimeError, match="1 of 2 trin nodes were not ready"):
+        wait_until_ready(nodes, timeout=10, clock=clock, sleep=sleep)
+
+
+def test_already_running_node(tmp_path, clock):
+    providers, nodes, sleep = _booting_nodes(tmp_path, clock, [(0, 0)])
+    providers[0].tick()
+    nodes[0] = (nodes[0][0], None)
+
+    assert wait_until_ready(nodes, clock=clock, sleep=sleep) == [0]
+
+
+def test_node_data_dirs_are_cleaned_up(tmp_path, capsys):
+    keys = [bytes([idx]) * 32 for idx in range(1, 4)]
+    with _node_data_dirs(tmp_path, keys, storage_kb=1024) as data_dirs:
+        assert len(set(data_dirs)) == len(keys)
+        for data_dir in data_dirs:
+            assert data_dir.is_dir()
+            assert data_dir.parent.parent == tmp_path
+            (data_dir / "trin.sqlite").write_bytes(b"\x01" * 100000)
+
+    assert list(tmp_path.iterdir()) == []
+
+    output = capsys.readouterr().out
+    assert "up to 3.0 MB of content for 3 nodes" in output
+    assert "took up 0.3 MB in total" in output
+
+
+def test_directory_bytes(tmp_path):
+    (tmp_path / "nested").mkdir()
+    (tmp_path / "a").write_bytes(b"\x01" * 10000)
+    (tmp_path / "nested" / "b").write_bytes(b"\x01" * 10000)
+    assert 20000 <= directory_bytes(tmp_path) < 40000
@@ -1,11 +1,18 @@
+from eth.chains import MainnetChain
 from eth.db.trie import make_trie_root_and_nodes
 from eth_hash.auto import keccak
 from hexbytes import HexBytes
+import pytest
 import rlp
 
+from eth_portal.trie import ordered_trie_root
 from eth_portal.web3_decode import (
+    DecodedBlock,
     block_fields_to_header,
+    block_fields_to_transactions,
     receipt_fields_to_receipt,
+    receipts_fields_to_receipts,
+    vm_class_for_block_number,
     web3_result_to_transaction,
 )
 
@@ -28,6 +35,61 @@ def test_web3_to_transaction(web3_block):
     assert calculated_root == web3_block.transactionsRoot
 
 
+@pytest.mark.parametrize(
+    "block_number",
+    (0, 1, 1149999, 1150000, 12964999, 12965000, 13772999, 13773000, 10**9),
+)
+def test_vm_class_matches_chain(block_number):
+    expected_vm = MainnetChain.get_vm_class_for_block_number(block_number)
+    assert vm_class_for_block_number(block_number) is expected_vm
+
+
+def test_block_fields_to_transactions(web3_block):
+    transactions = block_fields_to_transactions(web3_block)
+    expected = [
+        web3_result_to_transaction(web3_transaction, web3_block.number)
+        for web3_transaction in web3_block.transactions
+    ]
+    assert [txn.encode() for txn in transactions] == [txn.encode() for txn in expected]
+
+    calculated_root, _ = make_trie_root_and_nodes(transactions)
+    assert calculated_root == web3_block.transactionsRoot
+
+
+def test_decoded_block(web3_block):
+    decoded_block = DecodedBlock(web3_block)
+
+    assert keccak(decoded_block.header_rlp) == web3_block.hash
+    assert decoded_block.transactions_root == web3_block.transactionsRoot
+    assert decoded_block.encoded_transactions == tuple(
+        transaction.encode() for transaction in decoded_block.transactions
+    )
+    assert tuple(txn.hash for txn in web3_block.transactions) == tuple(
+        keccak(encoded) for encoded in decoded_block.encoded_transactions
+    )
+
+    # Decoded data is computed once, and then shared
+    assert decoded_block.transactions is decoded_block.transactions
+    assert decoded_block.encoded_transactions is decoded_block.encoded_transactions
+
+
+def test_ordered_trie_root_matches_py_evm(web3_block_and_receipts):
+    web3_block, web3_receipts = web3_block_and_receipts
+    receipts = receipts_fields_to_receipts(web3_receipts, web3_block.number)
+
+    expected_root, _ = make_trie_root_and_nodes(receipts)
+    assert ordered_trie_root(receipt.encode() for receipt in receipts) == expected_root
+    assert ordered_trie_root([]) == make_trie_root_and_nodes([])[0]
+
+
+def test_receipts_fields_to_receipts(web3_block_and_receipts):
+    web3_block, web3_receipts = web3_block_and_receipts
+    receipts = receipts_fields_to_receipts(web3_receipts, web3_block.number)
+
+    calculated_root, _ = make_trie_root_and_nodes(receipts)
+    assert calculated_root == web3_block.receiptsRoot
+
+
 def test_receipt_root_from_fields(web3_block_and_receipts):
     web3_block, web3_receipts = web3_block_and_receipts
     receipts = [